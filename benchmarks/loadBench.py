@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+End-to-End Load Benchmark
+-------------------------
+Drives a running pipeline (mosquitto -> mqttInfluxdb.py -> InfluxDB ->
+htmlScript.py) with many simulated stations and reports throughput and
+publish-to-visible latency.
+
+Publisher processes each simulate a share of the load stations
+(load0, load1, ...) and publish one sample per station at --rate samples
+per second, as stamped text readings or binary frames, like the firmware.
+Alongside them a probe station publishes a frame every --probe-interval
+seconds whose device timestamp is the send time and whose tvoc value is a
+probe sequence number, so each stage can be timed by the probe it shows:
+
+    influxdb    probe points become visible to a query
+    snapshot    the bridge's latest.snapshot holds the probe (what the
+                dashboard renders from)
+    dashboard   the probe station's page shows the probe's tvoc value
+
+Run the broker, InfluxDB, the bridge and the dashboard locally first
+(the bridge and dashboard hosts are set in their scripts), then:
+
+    python3 benchmarks/loadBench.py --stations 200 --rate 1 --duration 60
+
+Latency is sampled by polling every --poll-interval seconds, which bounds
+its resolution. Points stored are counted per load station once the run
+ends, waiting up to --drain-timeout seconds for the bridge to catch up.
+The bridge stores times at WRITE_PRECISION (seconds by default), so with
+--rate above 1 samples of a station overwrite each other and fewer points
+are stored than published; set WRITE_PRECISION = "ns" for such runs.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "final_scripts"))
+
+import paho.mqtt.client as mqtt
+from influxdb import InfluxDBClient
+
+from latestCache import read_snapshot
+from sampleFrame import FRAME_FIELDS, encode_frame
+from topicMapping import NUMERIC_MEASUREMENTS, TOPIC_MAPPING
+
+# Services under test
+MQTT_BROKER = "localhost"
+MQTT_PORT = 1883
+MQTT_USERNAME = "weather_user"
+MQTT_PASSWORD = "WeatherWizards"
+INFLUXDB_HOST = "localhost"
+INFLUXDB_PORT = 8086
+INFLUXDB_USER = "user"
+INFLUXDB_PASSWORD = "secret"
+INFLUXDB_DATABASE = "weather"
+LATEST_SNAPSHOT_PATH = "/var/lib/weather-station/latest.snapshot"
+HTML_ROOT = "/var/www/html"
+
+LOAD_STATION_PREFIX = "load"
+PROBE_STATION = "probe"
+PROBE_MEASUREMENT = "tvoc"  # carries the probe sequence number
+
+# Text topics and a plausible payload range per measurement
+TEXT_TOPICS = [
+    (topic, mapping["measurement"]) for topic, mapping in TOPIC_MAPPING.items()
+    if mapping["measurement"] in NUMERIC_MEASUREMENTS
+]
+VALUE_RANGES = {
+    "air_quality": (1, 5), "tvoc": (50, 600), "co2_concentration": (400, 1200),
+    "temperature_c": (15, 30), "temperature_f": (60, 85), "pressure": (990, 1020),
+    "humidity": (30, 90), "dewpoint": (5, 20), "gas": (1, 6), "altitude": (90, 150),
+    "visible_light": (100, 1000), "infrared": (50, 800), "lightning_distance": (1, 40),
+    "lightning_strike": (0, 0),
+}
+INT_MEASUREMENTS = {measurement for measurement, kind, scale in FRAME_FIELDS if scale == 1}
+
+# Dashboard markup around the tvoc value (see DashboardTemplate in htmlScript.py)
+PAGE_PROBE_RE = re.compile(r"Total VOC \(ppb\)</span><span class='value'[^>]*>([0-9.]+)<")
+
+
+def make_client(client_id):
+    client = mqtt.Client(client_id=client_id)
+    client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+    return client
+
+
+def random_sample(rng):
+    values = {}
+    for measurement, (low, high) in VALUE_RANGES.items():
+        value = low + rng.random() * (high - low)
+        values[measurement] = round(value) if measurement in INT_MEASUREMENTS else round(value, 2)
+    return values
+
+
+def publisher(worker, stations, rate, duration, binary, results):
+    """Publish samples for a slice of the load stations until the run ends."""
+    rng = random.Random(worker)
+    client = make_client(f"loadBench-{os.getpid()}-{worker}")
+    topics = {
+        station: [(topic.replace("weather/", f"weather/{station}/", 1), measurement) for topic, measurement in TEXT_TOPICS]
+        for station in stations
+    }
+    frame_topics = {station: f"weather/{station}/frame" for station in stations}
+
+    messages = 0
+    samples = 0
+    late_ticks = 0
+    seq = 0
+    period = 1.0 / rate
+    start = time.perf_counter()
+    deadline = start
+    while deadline - start < duration:
+        for station in stations:
+            values = random_sample(rng)
+            if binary:
+                frame = encode_frame(values, seq=seq, timestamp_ms=time.time_ns() // 1000000)
+                client.publish(frame_topics[station], frame)
+                messages += 1
+            else:
+                stamp = f"@{time.time_ns() // 1000000}#{seq}"
+                for topic, measurement in topics[station]:
+                    client.publish(topic, f"{values[measurement]}{stamp}")
+                messages += len(topics[station])
+            samples += 1
+        seq += 1
+        deadline += period
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            late_ticks += 1  # this worker cannot keep up with --rate
+    elapsed = time.perf_counter() - start
+    client.loop_stop()
+    client.disconnect()
+    results.put({"messages": messages, "samples": samples, "late_ticks": late_ticks, "elapsed": elapsed})
+
+
+class Probe:
+    """Publishes timestamped probe frames and records when each stage shows them."""
+
+    def __init__(self, interval, poll_interval):
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.sent = {}  # probe seq -> send time in ns
+        self.latencies = {"influxdb": [], "snapshot": [], "dashboard": []}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+        self.influx_client = InfluxDBClient(
+            host=INFLUXDB_HOST,
+            port=INFLUXDB_PORT,
+            username=INFLUXDB_USER,
+            password=INFLUXDB_PASSWORD,
+            database=INFLUXDB_DATABASE
+        )
+
+    def start(self):
+        self.started_ns = time.time_ns()
+        for target in (self._send, self._watch_influxdb, self._watch_snapshot, self._watch_dashboard):
+            thread = threading.Thread(target=target, name=target.__name__, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self, settle):
+        # Give the last probes time to reach every stage before the watchers stop
+        time.sleep(settle)
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _record(self, stage, value, seen_ns):
+        """Record the latency of the newest probe with this tvoc value (it wraps at 65536)."""
+        with self._lock:
+            sent = [sent_ns for seq, sent_ns in self.sent.items() if seq % 65536 == value]
+            if sent and sent[-1] >= self.started_ns:
+                self.latencies[stage].append((seen_ns - sent[-1]) / 1e9)
+
+    def _send(self):
+        client = make_client(f"loadBench-probe-{os.getpid()}")
+        seq = 0
+        while not self._stopping.is_set():
+            sent_ns = time.time_ns()
+            with self._lock:
+                self.sent[seq] = sent_ns
+            frame = encode_frame({PROBE_MEASUREMENT: seq % 65536, "temperature_f": 70.0}, seq=seq, timestamp_ms=sent_ns // 1000000)
+            client.publish(f"weather/{PROBE_STATION}/frame", frame)
+            seq += 1
+            self._stopping.wait(self.interval)
+        client.loop_stop()
+        client.disconnect()
+
+    def _watch_influxdb(self):
+        # Probes sent within the same second share a stored point, so poll
+        # from the last point seen (inclusive) and tell probes apart by value
+        last_ns = self.started_ns - self.started_ns % 1000000000
+        last_value = None
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                result = self.influx_client.query(
+                    f'SELECT "value" FROM "{PROBE_MEASUREMENT}" WHERE "station" = \'{PROBE_STATION}\' AND time >= {last_ns}',
+                    epoch="ns"
+                )
+            except Exception as e:
+                print(f"Error polling InfluxDB: {e}")
+                continue
+            seen_ns = time.time_ns()
+            for point in result.get_points():
+                value = int(point["value"])
+                if value != last_value:
+                    self._record("influxdb", value, seen_ns)
+                    last_value = value
+                last_ns = max(last_ns, point["time"])
+
+    def _watch_snapshot(self):
+        last_value = None
+        while not self._stopping.wait(self.poll_interval):
+            snapshot = read_snapshot(LATEST_SNAPSHOT_PATH)
+            if snapshot is None:
+                continue
+            entry = snapshot[1].get(PROBE_STATION, {}).get(PROBE_MEASUREMENT)
+            if entry is not None and int(entry[0]) != last_value:
+                last_value = int(entry[0])
+                self._record("snapshot", last_value, time.time_ns())
+
+    def _watch_dashboard(self):
+        path = os.path.join(HTML_ROOT, PROBE_STATION, "index.html")
+        last_seq = None
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                with open(path) as f:
+                    match = PAGE_PROBE_RE.search(f.read())
+            except OSError:
+                continue
+            if match is None:
+                continue
+            value = int(float(match.group(1)))
+            if value != last_seq:
+                last_seq = value
+                self._record("dashboard", value, time.time_ns())
+
+
+def count_stored(client, started_ns):
+    """Raw points stored since the run started for every load station."""
+    measurements = "|".join(NUMERIC_MEASUREMENTS)
+    result = client.query(
+        f'SELECT count("value") FROM /^({measurements})$/ '
+        f'WHERE "station" =~ /^{LOAD_STATION_PREFIX}[0-9]+$/ AND time >= {started_ns}'
+    )
+    return sum(point["count"] for point in result.get_points())
+
+
+def wait_for_drain(client, started_ns, expected, timeout, poll):
+    """Poll the stored count until it reaches expected or stops growing. Returns (count, ns of last growth)."""
+    count = 0
+    grew_ns = time.time_ns()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        latest = count_stored(client, started_ns)
+        if latest > count:
+            count = latest
+            grew_ns = time.time_ns()
+        if count >= expected:
+            break
+        time.sleep(poll)
+    return count, grew_ns
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark for the weather pipeline.")
+    parser.add_argument("--stations", type=int, default=50, help="simulated stations")
+    parser.add_argument("--rate", type=float, default=1.0, help="samples per second per station")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to publish for")
+    parser.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1), help="publisher processes")
+    parser.add_argument("--frames", action="store_true", help="publish binary frames instead of text readings")
+    parser.add_argument("--probe-interval", type=float, default=0.1, help="seconds between latency probes")
+    parser.add_argument("--poll-interval", type=float, default=0.01, help="seconds between stage polls")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="seconds to wait for the bridge to catch up")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    stations = [f"{LOAD_STATION_PREFIX}{i}" for i in range(args.stations)]
+    processes = max(1, min(args.processes, len(stations)))
+    slices = [stations[i::processes] for i in range(processes)]
+
+    probe = Probe(args.probe_interval, args.poll_interval)
+    probe.start()
+    started_ns = probe.started_ns
+
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=publisher, args=(i, slices[i], args.rate, args.duration, args.frames, results))
+        for i in range(processes)
+    ]
+    print(f"Publishing {len(stations)} stations at {args.rate}/s for {args.duration:.0f}s from {processes} processes")
+    for worker in workers:
+        worker.start()
+    published = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    messages = sum(r["messages"] for r in published)
+    samples = sum(r["samples"] for r in published)
+    publish_elapsed = max(r["elapsed"] for r in published)
+    expected_points = samples * len(NUMERIC_MEASUREMENTS)
+
+    print(f"Published {messages} messages, waiting for {expected_points} points to be stored...")
+    stored, last_growth_ns = wait_for_drain(probe.influx_client, started_ns, expected_points, args.drain_timeout, 1.0)
+    probe.close(settle=args.poll_interval * 10 + 1.0)
+    ingest_elapsed = (last_growth_ns - started_ns) / 1e9
+
+    report = {
+        "stations": len(stations),
+        "rate": args.rate,
+        "format": "frame" if args.frames else "text",
+        "messages_published": messages,
+        "publish_msgs_per_s": messages / publish_elapsed,
+        "late_ticks": sum(r["late_ticks"] for r in published),
+        "points_expected": expected_points,
+        "points_stored": stored,
+        "stored_points_per_s": stored / ingest_elapsed if ingest_elapsed > 0 else 0.0,
+        "latency": {},
+    }
+    for stage, latencies in probe.latencies.items():
+        if latencies:
+            report["latency"][stage] = {
+                "samples": len(latencies),
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "max_ms": max(latencies) * 1000,
+            }
+
+    print(f"\n{report['stations']} stations x {report['rate']}/s, {report['format']} payloads")
+    print(f"  published   {report['messages_published']:>10} messages   {report['publish_msgs_per_s']:>10,.0f} msg/s"
+          f"   ({report['late_ticks']} late ticks)")
+    print(f"  stored      {report['points_stored']:>10} points     {report['stored_points_per_s']:>10,.0f} points/s"
+          f"   ({report['points_stored'] / expected_points if expected_points else 0:.1%} of expected)")
+    print(f"  {'latency':<11} {'samples':>8} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for stage in probe.latencies:
+        stats = report["latency"].get(stage)
+        if stats is None:
+            print(f"  {stage:<11} {'no probes seen':>30}")
+        else:
+            print(f"  {stage:<11} {stats['samples']:>8} {stats['p50_ms']:>10.1f} {stats['p99_ms']:>10.1f} {stats['max_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if stored >= expected_points else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
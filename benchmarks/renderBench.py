@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Dashboard Render Benchmark
+--------------------------
+Compares renders per second of the original string-concatenation
+generate_html with the precompiled DashboardTemplate in htmlScript.py.
+
+    python3 benchmarks/renderBench.py [seconds per run]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "final_scripts"))
+
+import pytz
+import htmlScript
+
+
+def legacy_generate_html(data):
+    """The pre-template renderer: timezone lookup, iframe list and += per fragment on every call"""
+    pacific = pytz.timezone('US/Pacific')
+    local_time = datetime.now(pacific).strftime('%Y-%m-%d %H:%M:%S')
+    css = str(htmlScript.CSS)
+
+    html = f"<!DOCTYPE html><html><head><title>Weather Station Dashboard</title>"
+    html += f"<meta http-equiv='refresh' content='60'>"
+    html += f"<style>{css}</style></head><body>"
+    html += f"<div class='container'>"
+    html += f"<h1>Weather Station Dashboard</h1>"
+    html += f"<div class='timestamp'>Last Updated: {local_time}</div>"
+    html += f"<div class='dashboard'>"
+    iframe_urls = list(htmlScript.IFRAME_URLS)
+    for url in iframe_urls:
+        html += f"<div class='iframe-wrapper'>"
+        html += f"<iframe src='{url}'></iframe>"
+        html += f"</div>"
+    for group_name, metrics in htmlScript.SENSOR_GROUPS.items():
+        html += f"<div class='card'><h2>{group_name}</h2>"
+        if group_name in data:
+            for metric in metrics:
+                value = data[group_name].get(metric, 'No data available')
+                display_name = htmlScript.SUMMARY_FIELD_MAPPING.get(metric, {}).get('display', metric)
+                html += f"<div class='metric'><span>{display_name}</span><span class='value'>{value}</span></div>"
+        else:
+            html += f"<div class='metric'><span class='no-data'>No data available</span></div>"
+        html += "</div>"
+    html += "</div></div></body></html>"
+    return html
+
+
+def sample_data():
+    data = {}
+    for i, (group, metrics) in enumerate(htmlScript.SENSOR_GROUPS.items()):
+        data[group] = {metric: round(10.0 + i + j * 0.37, 2) for j, metric in enumerate(metrics)}
+    return data
+
+
+def renders_per_second(render, data, duration):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            render(data)
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    data = sample_data()
+
+    before = renders_per_second(legacy_generate_html, data, duration)
+    after = renders_per_second(htmlScript.generate_html, data, duration)
+    print(f"legacy concatenation : {before:12,.0f} renders/s")
+    print(f"precompiled template : {after:12,.0f} renders/s")
+    print(f"speedup              : {after / before:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Topic Router Benchmark
+----------------------
+Messages per second through the bridge's compiled topic router
+(build_router over TOPIC_MAPPING) and its typed parsers, compared with the
+original dict lookup + float()/ValueError fallback from on_message. Each
+side is run `runs` times, alternating, and the medians are compared.
+
+    python3 benchmarks/routerBench.py [stations] [seconds per run] [runs]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "final_scripts"))
+
+from topicMapping import TOPIC_MAPPING
+from topicRouter import build_router
+
+# A typical payload per text topic type; frames and summaries never went
+# through the original path
+SAMPLE_PAYLOADS = {"float": b"71.42", "int": b"412", "strike": b"0"}
+
+
+def build_messages(stations):
+    messages = []
+    for i in range(stations):
+        for topic, mapping in TOPIC_MAPPING.items():
+            payload = SAMPLE_PAYLOADS.get(mapping["type"])
+            if payload is None:
+                continue
+            prefix, rest = topic.split("/", 1)
+            messages.append((f"{prefix}/station{i}/{rest}", payload))
+    # A few malformed payloads, as a flaky sensor would send
+    messages.extend((topic, b"nan") for topic, _ in messages[:stations])
+    random.Random(1).shuffle(messages)
+    return messages
+
+
+def legacy_dispatch(messages, mapping):
+    """The original per-message path: split off the station, dict lookup, try float()"""
+    handled = 0
+    for topic, payload in messages:
+        payload = payload.decode()
+        levels = topic.split("/")
+        key = "/".join([levels[0]] + levels[2:]) if len(levels) == 4 else topic
+        if key in mapping:
+            measurement = mapping[key]
+            if key == "weather/summary":
+                continue
+            try:
+                value = float(payload)
+            except ValueError:
+                value = payload
+            handled += 1
+    return handled
+
+
+def router_dispatch(messages, router):
+    handled = 0
+    for topic, payload in messages:
+        route, levels = router.match(topic)
+        if route is None:
+            continue
+        fields = route.parse(payload)
+        if fields is not None:
+            handled += 1
+    return handled
+
+
+def messages_per_second(dispatch, messages, target, duration):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        dispatch(messages, target)
+        count += len(messages)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    stations = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 9
+    messages = build_messages(stations)
+    mapping = {topic: entry["measurement"] for topic, entry in TOPIC_MAPPING.items()}
+    router = build_router(TOPIC_MAPPING)
+
+    legacy, routed = [], []
+    for _ in range(runs):
+        legacy.append(messages_per_second(legacy_dispatch, messages, mapping, duration))
+        routed.append(messages_per_second(router_dispatch, messages, router, duration))
+    before = statistics.median(legacy)
+    after = statistics.median(routed)
+    print(f"{len(messages)} distinct messages from {stations} stations, median of {runs} runs")
+    print(f"legacy dict + float() : {before:12,.0f} msgs/s  (min {min(legacy):,.0f}, max {max(legacy):,.0f})")
+    print(f"compiled router       : {after:12,.0f} msgs/s  (min {min(routed):,.0f}, max {max(routed):,.0f})")
+    print(f"ratio                 : {after / before:12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,28 @@
 #!/usr/bin/env python3
+import os
+import sys
 import time
 import random
 import json
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "final_scripts"))
+from sampleFrame import encode_frame
+
 # MQTT Broker Configuration
 MQTT_BROKER = "localhost"               # Change to your broker IP if needed
 MQTT_PORT = 1883                        # Default port for Mosquitto
 MQTT_USERNAME = "weather_user"
 MQTT_PASSWORD = "WeatherWizards"         # Replace with your actual MQTT password
 
+# Station ID to publish as (weather/<station>/...). Leave empty to use the
+# original single-station topics, which the bridge files under station "main".
+STATION_ID = ""
+
+# Publish each sample as one binary frame on weather/frame (see
+# final_scripts/sampleFrame.py) instead of one text message per reading
+BINARY_FRAMES = False
+
 # MQTT Topics (matches your ESP32 structure)
 topics = {
     "ens160/aqi": "weather/ens160/aqi",
@@ -29,9 +42,16 @@ topics = {
     "light/infrared": "weather/light/infrared",
     "lightning/distance": "weather/lightning/distance",
     "lightning/strike": "weather/lightning/strike",
-    "summary": "weather/summary"
+    "summary": "weather/summary",
+    "frame": "weather/frame"
 }
 
+def station_topic(topic):
+    """Insert the station ID after the weather/ prefix when one is configured"""
+    if STATION_ID:
+        return topic.replace("weather/", f"weather/{STATION_ID}/", 1)
+    return topic
+
 # Setup MQTT client
 client = mqtt.Client(client_id="PythonDummyWeatherPublisher")
 client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
@@ -47,6 +67,8 @@ client.on_connect = on_connect
 client.connect(MQTT_BROKER, MQTT_PORT, 60)
 client.loop_start()
 
+seq = 0
+
 try:
     while True:
         # Generate random dummy values
@@ -80,12 +102,36 @@ try:
             }
         }
 
+        if BINARY_FRAMES:
+            # Whole sample in a single message
+            frame = encode_frame({
+                "air_quality": data["ens160"]["aqi"],
+                "tvoc": data["ens160"]["tvoc"],
+                "co2_concentration": data["ens160"]["eco2"],
+                "temperature_c": data["bme680"]["temperature"],
+                "temperature_f": data["ens160"]["temperatureF"],
+                "pressure": data["bme680"]["pressure"],
+                "humidity": data["bme680"]["humidity"],
+                "dewpoint": data["bme680"]["dewpoint"],
+                "gas": data["bme680"]["gas"],
+                "altitude": data["bme680"]["altitude"],
+                "visible_light": data["light"]["visible_ir"],
+                "infrared": data["light"]["infrared"],
+                "lightning_distance": data["lightning"]["distance"],
+                "lightning_strike": int(data["lightning"]["strike"])
+            }, seq=seq, timestamp_ms=int(time.time() * 1000))
+            client.publish(station_topic(topics["frame"]), frame)
+            seq += 1
+            print(f"📡 Published {len(frame)} byte sample frame #{seq}")
+            time.sleep(5)
+            continue
+
         # Publish individual values
         for category, sensors in data.items():
             for key, value in sensors.items():
                 topic = topics.get(f"{category}/{key}")
                 if topic:
-                    client.publish(topic, str(value))
+                    client.publish(station_topic(topic), str(value))
 
         # Publish combined JSON summary
         summary_data = {
@@ -98,7 +144,7 @@ try:
             "light_level": data["light"]["visible_ir"],
             "lightning_distance": data["lightning"]["distance"]
         }
-        client.publish(topics["summary"], json.dumps(summary_data))
+        client.publish(station_topic(topics["summary"]), json.dumps(summary_data))
 
         # Print to terminal
         print("📡 Published dummy weather data:", json.dumps(summary_data, indent=2))
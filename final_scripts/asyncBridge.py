@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Weather MQTT to InfluxDB Bridge (asyncio)
+-----------------------------------------
+Alternative to running mqttInfluxdb.py directly: the same topic routing,
+payload parsing, station tags, latest-value snapshot, rollups and spool,
+but the MQTT client (aiomqtt) and the InfluxDB writes (AsyncLineWriter over
+a pooled keep-alive aiohttp session) share one event loop instead of a
+network thread, writer threads and blocking HTTP calls.
+
+Configuration is read from mqttInfluxdb.py. Run it in place of the
+threaded bridge, not next to it, since both use the same spool (and the
+same MQTT client ID unless MQTT_SHARE_GROUP is set):
+
+    python3 asyncBridge.py
+"""
+import asyncio
+import logging
+import signal
+import time
+
+import aiomqtt
+
+import mqttInfluxdb as bridge
+from asyncWriter import AsyncLineWriter
+
+# Batches in flight at once per writer (one keep-alive connection each)
+WRITE_CONCURRENCY = 4
+
+# Seconds to wait before reconnecting after the broker connection drops
+MQTT_RECONNECT_INTERVAL = 5
+
+logger = logging.getLogger("bridge")
+
+
+def make_writer(spool, retention_policy=None):
+    return AsyncLineWriter(
+        bridge.INFLUXDB_HOST,
+        bridge.INFLUXDB_PORT,
+        bridge.INFLUXDB_DATABASE,
+        username=bridge.INFLUXDB_USER,
+        password=bridge.INFLUXDB_PASSWORD,
+        max_points=bridge.WRITE_BATCH_SIZE,
+        flush_interval_ms=bridge.WRITE_FLUSH_INTERVAL_MS,
+        concurrency=WRITE_CONCURRENCY,
+        spool=spool,
+        retention_policy=retention_policy,
+        timeout=bridge.INFLUXDB_TIMEOUT
+    )
+
+
+async def consume(writer):
+    """Read messages until cancelled, reconnecting whenever the broker goes away."""
+    while True:
+        try:
+            async with aiomqtt.Client(
+                bridge.MQTT_BROKER,
+                port=bridge.MQTT_PORT,
+                username=bridge.MQTT_USERNAME or None,
+                password=bridge.MQTT_PASSWORD or None,
+                identifier=bridge.CLIENT_ID,
+                keepalive=60,
+                # Bounds memory while the writer pushes back
+                max_queued_incoming_messages=bridge.INGEST_QUEUE_SIZE
+            ) as client:
+                logger.info("Connected to MQTT broker: %s on port %s as %s", bridge.MQTT_BROKER, bridge.MQTT_PORT,
+                            bridge.CLIENT_ID)
+                await client.subscribe(bridge.SUBSCRIBE_TOPIC)
+                logger.info("Subscribed to topic: %s", bridge.SUBSCRIBE_TOPIC)
+                async for message in client.messages:
+                    await process_message(writer, message.topic.value, message.payload, time.time_ns())
+        except aiomqtt.MqttError as e:
+            logger.warning("MQTT connection lost: %s. Reconnecting in %ss...", e, MQTT_RECONNECT_INTERVAL)
+            await asyncio.sleep(MQTT_RECONNECT_INTERVAL)
+
+
+async def process_message(writer, topic, payload, received_ns):
+    """Parse one message and queue its points, waiting if every write slot is busy."""
+    try:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received message on topic %s: %s", topic, payload.decode(errors='replace'))
+        start = time.perf_counter()
+        points = bridge.message_points(topic, payload, received_ns)
+        bridge.PARSE_SECONDS.observe(time.perf_counter() - start)
+        if points is None:
+            return
+        bridge.track_points(points)
+        await writer.add(points)
+    except Exception as e:
+        bridge.MESSAGES_FAILED.inc()
+        logger.error("Error processing message on topic %s: %s", topic, e)
+
+
+async def emit_rollups(rollup_writers):
+    """Close due rollup windows every ROLLUP_INTERVAL and queue them for writing."""
+    while True:
+        await asyncio.sleep(bridge.ROLLUP_INTERVAL)
+        for rp, points in bridge.rollups.collect().items():
+            await rollup_writers[rp].add(points)
+
+
+async def report_stats(writer):
+    """Periodically log write, spool and rollup statistics."""
+    while True:
+        await asyncio.sleep(bridge.STATS_INTERVAL)
+        log_stats(writer)
+
+
+def log_stats(writer):
+    logger.info("Async writer stats: %s", writer.stats())
+    logger.info("Spool stats: %s", bridge.point_spool.stats())
+    logger.info("Ring stats: %s", bridge.recent_ring.stats())
+    if bridge.rollup_rebuilder is not None:
+        logger.info("Rollup rebuild stats: %s", bridge.rollup_rebuilder.stats())
+    else:
+        logger.info("Rollup stats: %s", bridge.rollups.stats())
+
+
+async def run():
+    bridge.init_state()
+    writer = make_writer(bridge.point_spool)
+    rollup_writers = {rp: make_writer(spool, retention_policy=rp) for rp, (spool, _) in bridge.rollup_writers.items()}
+    bridge.start_metrics({"default": writer.stats, **{rp: w.stats for rp, w in rollup_writers.items()}}, queues=())
+
+    # Startup is a handful of blocking queries, done before the loop gets busy
+    bridge.prepare_influxdb()
+    bridge.point_spool.start_replay(bridge.influx_client, chunk_points=bridge.SPOOL_REPLAY_CHUNK)
+    for spool, _ in bridge.rollup_writers.values():
+        spool.start_replay(bridge.influx_client, chunk_points=bridge.SPOOL_REPLAY_CHUNK)
+    bridge.latest_cache.start_publisher(bridge.LATEST_SNAPSHOT_PATH, interval=bridge.LATEST_SNAPSHOT_INTERVAL)
+
+    for w in (writer, *rollup_writers.values()):
+        await w.start()
+    background = [asyncio.create_task(report_stats(writer))]
+    if bridge.rollup_rebuilder is not None:
+        bridge.rollup_rebuilder.start(interval=bridge.ROLLUP_INTERVAL)
+    elif not bridge.SHARE_GROUP:
+        background.append(asyncio.create_task(emit_rollups(rollup_writers)))
+
+    # systemd stops the bridge with SIGTERM; drain below as on Ctrl+C
+    consumer = asyncio.create_task(consume(writer))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, consumer.cancel)
+    try:
+        logger.info("Starting asyncio Weather MQTT to InfluxDB bridge. Press Ctrl+C to stop.")
+        await consumer
+    except asyncio.CancelledError:
+        logger.info("Stopping the bridge...")
+    finally:
+        for task in background:
+            task.cancel()
+        if bridge.rollup_rebuilder is not None:
+            bridge.rollup_rebuilder.close()
+        await writer.close()
+        bridge.point_spool.close()
+        # Write the open rollup windows as they stand; the next start
+        # rebuilds them from raw data
+        for rp, points in bridge.rollups.collect(flush_all=True).items():
+            await rollup_writers[rp].add(points)
+        for rp, w in rollup_writers.items():
+            await w.close()
+            bridge.rollup_writers[rp][0].close()
+        bridge.latest_cache.close()
+        bridge.latest_cache.publish(bridge.LATEST_SNAPSHOT_PATH)
+        log_stats(writer)
+        bridge.recent_ring.close()
+        logger.info("Bridge stopped.")
+
+
+def main():
+    bridge.setup_logging()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass  # run() has already drained everything on its way out
+
+
+if __name__ == "__main__":
+    main()
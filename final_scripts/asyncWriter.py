@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Async InfluxDB Line Protocol Writer
+-----------------------------------
+asyncio counterpart of WriteBuffer for the asyncio bridge (asyncBridge.py).
+Points are batched the same way, flushed at max_points or after
+flush_interval_ms, and POSTed as line protocol to InfluxDB's /write
+endpoint over one aiohttp session. The session's connector keeps up to
+`concurrency` keep-alive connections open and that many batches can be in
+flight at once; add() waits when all of them are busy, which is what
+pushes back on the MQTT reader.
+
+With a spool attached, failed batches are written to disk as line protocol
+and replayed by the spool's own thread, exactly as with WriteBuffer; a
+batch InfluxDB refuses with a 4xx is dropped and counted, as there.
+"""
+import asyncio
+import logging
+import time
+
+import aiohttp
+from influxdb.line_protocol import make_lines
+
+from pointSpool import rejected_status
+from writeBuffer import WRITE_BATCH_POINTS, WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLineWriter:
+    """Batches points and writes them with a bounded number of concurrent POSTs."""
+
+    def __init__(self, host, port, database, username=None, password=None, max_points=500,
+                 flush_interval_ms=1000, concurrency=4, spool=None, retention_policy=None, timeout=10.0):
+        self.url = f"http://{host}:{port}/write"
+        self.params = {"db": database, "precision": "n"}
+        if retention_policy is not None:
+            self.params["rp"] = retention_policy
+        self._batch_points = WRITE_BATCH_POINTS.labels(retention_policy or "default")
+        self._write_seconds = WRITE_SECONDS.labels(retention_policy or "default")
+        self.auth = aiohttp.BasicAuth(username, password) if username else None
+        self.max_points = max_points
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.concurrency = concurrency
+        self.spool = spool
+        self.timeout = timeout
+
+        self._points = []
+        self._oldest = None  # monotonic time the oldest buffered point arrived
+        self._session = None
+        self._slots = None
+        self._in_flight = set()
+        self._writing = 0  # writes holding a slot
+        self._task = None
+
+        # Counters, read through stats()
+        self.flush_count = 0
+        self.points_written = 0
+        self.points_failed = 0
+        self.points_spooled = 0
+        self.points_rejected = 0
+        self.max_in_flight = 0
+        self.last_flush_latency_ms = 0.0
+        self.total_flush_latency_ms = 0.0
+
+    async def start(self):
+        """Open the pooled HTTP session and start the interval flush task."""
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                auth=self.auth,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, points):
+        """Queue points (InfluxDB JSON dicts), flushing when the batch is full."""
+        if not self._points:
+            self._oldest = time.monotonic()
+        self._points.extend(points)
+        if len(self._points) >= self.max_points:
+            await self.flush()
+
+    async def flush(self):
+        """Start writing everything buffered so far. Returns the number of points sent."""
+        batch = self._points
+        self._points = []
+        self._oldest = None
+        if not batch:
+            return 0
+        lines = make_lines({"points": batch})
+
+        if self.spool is not None and not self.spool.healthy:
+            # InfluxDB is known to be down, don't wait on another timeout
+            await self._spool(lines, len(batch))
+            return len(batch)
+
+        # Waits here while every connection is busy
+        await self._slots.acquire()
+        self._writing += 1
+        self.max_in_flight = max(self.max_in_flight, self._writing)
+        task = asyncio.create_task(self._write(lines, len(batch)))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+        return len(batch)
+
+    async def close(self):
+        """Stop the flush task, write what is buffered and wait for every write in flight."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self.flush()
+            if self._in_flight:
+                await asyncio.gather(*self._in_flight)
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        """Snapshot of the writer counters."""
+        return {
+            "pending": len(self._points),
+            "in_flight": self._writing,
+            "max_in_flight": self.max_in_flight,
+            "flush_count": self.flush_count,
+            "points_written": self.points_written,
+            "points_failed": self.points_failed,
+            "points_spooled": self.points_spooled,
+            "points_rejected": self.points_rejected,
+            "last_flush_latency_ms": round(self.last_flush_latency_ms, 3),
+            "avg_flush_latency_ms": round(self.total_flush_latency_ms / self.flush_count, 3) if self.flush_count else 0.0,
+        }
+
+    async def _write(self, lines, count):
+        start = time.perf_counter()
+        refused = False
+        try:
+            async with self._session.post(self.url, params=self.params, data=lines.encode()) as response:
+                success = response.status == 204
+                refused = rejected_status(response.status)
+                if refused:
+                    logger.error("InfluxDB refused batch of %d points, dropping it: %s %s", count, response.status,
+                                 await response.text())
+                elif not success:
+                    logger.warning("InfluxDB failed to write batch of %d points: %s %s", count, response.status,
+                                   await response.text())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error("Error writing batch of %d points to InfluxDB: %s", count, e)
+            success = False
+        finally:
+            self._writing -= 1
+            self._slots.release()
+        latency = time.perf_counter() - start
+        latency_ms = latency * 1000.0
+        self._batch_points.observe(count)
+        self._write_seconds.observe(latency)
+
+        self.flush_count += 1
+        self.last_flush_latency_ms = latency_ms
+        self.total_flush_latency_ms += latency_ms
+        if success:
+            self.points_written += count
+        elif refused:
+            self.points_rejected += count
+        else:
+            self.points_failed += count
+            if self.spool is not None:
+                self.spool.healthy = False
+                await self._spool(lines, count)
+
+    async def _spool(self, lines, count):
+        # The spool fsyncs, keep that off the event loop
+        try:
+            await asyncio.to_thread(self.spool.append, lines.splitlines())
+        except Exception as e:
+            logger.error("Error spooling %d points: %s", count, e)
+            return
+        self.points_spooled += count
+
+    async def _run(self):
+        while True:
+            if self._oldest is None:
+                delay = self.flush_interval
+            else:
+                delay = max(0.0, self._oldest + self.flush_interval - time.monotonic())
+            await asyncio.sleep(delay)
+            if self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval:
+                await self.flush()
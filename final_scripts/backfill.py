@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Historical Backfill
+-------------------
+Bulk-loads recorded sensor data into InfluxDB without going through MQTT.
+
+CSV files need a header row with a "time" column (epoch seconds,
+milliseconds, microseconds or nanoseconds, or ISO 8601), an optional
+"station" column, and one column per reading. Reading columns may be named
+by bridge topic (weather/bme680/humidity), by topic without the weather/
+prefix (bme680/humidity) or by measurement (humidity), and are written
+under the bridge's TOPIC_MAPPING measurement names.
+
+Line protocol files (.lp) are streamed through unchanged.
+
+The file is read as a stream in chunks of --chunk-rows rows. Each chunk is
+parsed and validated with vectorized NumPy operations and turned into line
+protocol, then written in batches of --batch-points with at most
+--concurrency writes in flight, so memory stays flat however large the
+file is.
+
+    python3 backfill.py station-archive.csv --station roof
+    python3 backfill.py export.lp --rollups
+"""
+import argparse
+import csv
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from influxdb import InfluxDBClient
+
+from rollups import ROLLUP_WINDOWS, rollup_query
+from topicMapping import DEFAULT_STATION, NUMERIC_MEASUREMENTS, STATION_ID_PATTERN, TOPIC_MAPPING
+
+# InfluxDB Configuration
+INFLUXDB_HOST = "localhost"
+INFLUXDB_PORT = 8086
+INFLUXDB_USER = "user"
+INFLUXDB_PASSWORD = "secret"
+INFLUXDB_DATABASE = "weather"
+
+CHUNK_ROWS = 50000
+BATCH_POINTS = 20000
+CONCURRENCY = 4
+
+# --rollups recomputes one day per query, so no single SELECT ... INTO has
+# to scan the whole imported range
+ROLLUP_CHUNK = 86400  # seconds, a multiple of every rollup window
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"
+
+# Column name -> measurement, accepting every spelling the docstring lists
+COLUMN_MEASUREMENTS = {}
+for _topic, _mapping in TOPIC_MAPPING.items():
+    if _mapping["measurement"] in NUMERIC_MEASUREMENTS:
+        COLUMN_MEASUREMENTS[_topic] = _mapping["measurement"]
+        COLUMN_MEASUREMENTS[_topic.split("/", 1)[1]] = _mapping["measurement"]
+        COLUMN_MEASUREMENTS[_mapping["measurement"]] = _mapping["measurement"]
+
+# Epoch values below these magnitudes are taken to be in s, ms and us
+_EPOCH_LIMITS = ((1e11, 1000000000), (1e14, 1000000), (1e17, 1000))
+
+logger = logging.getLogger("backfill")
+
+
+class BatchWriter:
+    """Writes line protocol batches from a thread pool with a bound on writes in flight."""
+
+    def __init__(self, client, batch_points, concurrency, dry_run=False):
+        self.client = client
+        self.batch_points = batch_points
+        self.dry_run = dry_run
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._slots = threading.BoundedSemaphore(concurrency * 2)  # running + queued batches
+        self._pending = []
+        self._lock = threading.Lock()
+        self.points_written = 0
+        self.batches_failed = 0
+        self.time_min = None
+        self.time_max = None
+
+    def add(self, lines, times):
+        """Queue line protocol lines along with their int64 ns timestamps."""
+        if len(times):
+            low, high = int(times.min()), int(times.max())
+            self.time_min = low if self.time_min is None else min(self.time_min, low)
+            self.time_max = high if self.time_max is None else max(self.time_max, high)
+        self._pending.extend(lines)
+        while len(self._pending) >= self.batch_points:
+            batch = self._pending[:self.batch_points]
+            del self._pending[:self.batch_points]
+            self._submit(batch)
+
+    def close(self):
+        """Send the last partial batch and wait for every write to finish."""
+        if self._pending:
+            self._submit(self._pending)
+            self._pending = []
+        self._pool.shutdown(wait=True)
+
+    def _submit(self, batch):
+        # Blocks while too many batches are in flight, which is what keeps
+        # memory flat when InfluxDB is slower than the parser
+        self._slots.acquire()
+        self._pool.submit(self._write, batch)
+
+    def _write(self, batch):
+        try:
+            if not self.dry_run:
+                self.client.write_points(batch, protocol="line", time_precision="n")
+            with self._lock:
+                self.points_written += len(batch)
+        except Exception as e:
+            with self._lock:
+                self.batches_failed += 1
+            logger.error("Error writing batch of %d points: %s", len(batch), e)
+        finally:
+            self._slots.release()
+
+
+def to_epoch_ns(column):
+    """Vectorized time column -> (int64 ns array, valid mask)"""
+    column = np.char.strip(column)
+    times = np.zeros(len(column), dtype=np.int64)
+
+    # Epoch numbers, one unit per chunk picked from the largest timestamp
+    numeric = to_float(column)
+    is_epoch = np.isfinite(numeric) & (numeric > 0)
+    if is_epoch.any():
+        magnitude = numeric[is_epoch].max()
+        scale = 1
+        for limit, factor in _EPOCH_LIMITS:
+            if magnitude < limit:
+                scale = factor
+                break
+        times[is_epoch] = (numeric[is_epoch] * scale).astype(np.int64)
+
+    # Everything else should be ISO 8601; a trailing Z is accepted and taken as UTC
+    valid = is_epoch.copy()
+    rest = ~is_epoch
+    if rest.any():
+        stripped = np.char.rstrip(column[rest], "Z")
+        try:
+            parsed = stripped.astype("datetime64[ns]")
+        except ValueError:
+            parsed = np.array([_parse_datetime(value) for value in stripped], dtype="datetime64[ns]")
+        parsed_ok = ~np.isnat(parsed)
+        times[rest] = np.where(parsed_ok, parsed.astype(np.int64), 0)
+        valid[rest] = parsed_ok
+    return times, valid
+
+
+def _parse_datetime(value):
+    try:
+        return np.datetime64(value, "ns")
+    except ValueError:
+        return np.datetime64("NaT")
+
+
+def to_float(block):
+    """Vectorized numeric block -> float64 array with NaN for anything unparsable"""
+    try:
+        return np.char.strip(block).astype(np.float64)
+    except ValueError:
+        # Dirty chunk: convert element by element, empty and junk cells become NaN
+        convert = np.vectorize(_parse_float, otypes=[np.float64])
+        return convert(block)
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def csv_chunks(path, chunk_rows):
+    """Yield (header, 2-D str array, malformed row count) chunks of a CSV file"""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        width = len(header)
+        while True:
+            raw = list(itertools.islice(reader, chunk_rows))
+            if not raw:
+                return
+            rows = [row for row in raw if len(row) == width]
+            if rows:
+                yield header, np.array(rows, dtype=str).reshape(len(rows), width), len(raw) - len(rows)
+
+
+def import_csv(path, writer, station, chunk_rows):
+    """Stream a CSV archive into the writer. Returns (rows read, values rejected)."""
+    rows_read = 0
+    rejected = 0
+    for header, block, malformed in csv_chunks(path, chunk_rows):
+        if "time" not in header:
+            raise ValueError(f"{path} has no 'time' column")
+        value_columns = [(i, COLUMN_MEASUREMENTS[name]) for i, name in enumerate(header) if name in COLUMN_MEASUREMENTS]
+        if not value_columns:
+            raise ValueError(f"{path} has no columns matching TOPIC_MAPPING")
+        rows_read += len(block) + malformed
+        rejected += malformed * len(value_columns)
+
+        times, time_valid = to_epoch_ns(block[:, header.index("time")])
+        if "station" in header:
+            stations = np.char.strip(block[:, header.index("station")])
+            stations = np.where(stations == "", station, stations)
+            # Station IDs become tags and file names, only allow the bridge's pattern
+            check = np.vectorize(lambda s: STATION_ID_PATTERN.match(s) is not None, otypes=[bool])
+            time_valid &= check(stations)
+        else:
+            stations = np.full(len(block), station)
+
+        values = to_float(block[:, [i for i, _ in value_columns]])
+        valid = np.isfinite(values) & time_valid[:, None]
+        rejected += int((~valid).sum())
+
+        time_text = times.astype(str)
+        series_prefix = np.char.add(",station=", stations)
+        for column, (_, measurement) in enumerate(value_columns):
+            mask = valid[:, column]
+            if not mask.any():
+                continue
+            lines = np.char.add(measurement, series_prefix[mask])
+            lines = np.char.add(lines, " value=")
+            lines = np.char.add(lines, values[mask, column].astype(str))
+            lines = np.char.add(lines, " ")
+            lines = np.char.add(lines, time_text[mask])
+            writer.add(lines.tolist(), times[mask])
+    return rows_read, rejected
+
+
+def import_line_protocol(path, writer, chunk_rows):
+    """Stream a line protocol archive into the writer. Returns (lines read, lines rejected)."""
+    lines_read = 0
+    rejected = 0
+    with open(path) as f:
+        while True:
+            chunk = list(itertools.islice(f, chunk_rows))
+            if not chunk:
+                break
+            lines_read += len(chunk)
+            block = np.char.strip(np.array(chunk, dtype=str))
+            # Blank lines, comments and lines without a field set are skipped
+            keep = (block != "") & ~np.char.startswith(block, "#") & (np.char.count(block, " ") >= 1)
+            rejected += int((~keep).sum())
+            kept = block[keep]
+            timestamps = np.char.rpartition(kept, " ")[:, 2]
+            has_time = np.char.isdigit(timestamps) & (np.char.count(kept, " ") >= 2)
+            writer.add(kept.tolist(), timestamps[has_time].astype(np.int64))
+    return lines_read, rejected
+
+
+def rebuild_rollups(client, start_ns, end_ns, chunk=ROLLUP_CHUNK):
+    """Recompute the rollup retention policies over the imported range, one chunk per query. Returns False on a failed query."""
+    chunk_ns = chunk * 1000000000
+    for rp, window, _ in ROLLUP_WINDOWS:
+        window_ns = window * 1000000000
+        start = start_ns - start_ns % chunk_ns
+        end = end_ns - end_ns % window_ns + window_ns
+        logger.info("Rebuilding %s from %d to %d", rp, start, end)
+        while start < end:
+            stop = min(start + chunk_ns, end)
+            try:
+                client.query(rollup_query(INFLUXDB_DATABASE, rp, window, NUMERIC_MEASUREMENTS,
+                                          f"time >= {start} AND time < {stop}"))
+            except Exception as e:
+                # Earlier chunks are complete; rerunning with the same
+                # archive redoes the whole range idempotently
+                logger.error("Error rebuilding %s from %d to %d: %s", rp, start, stop, e)
+                return False
+            start = stop
+        logger.info("Rebuilt %s", rp)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load CSV or line protocol archives into InfluxDB.")
+    parser.add_argument("path", help="CSV or line protocol (.lp) file")
+    parser.add_argument("--format", choices=("csv", "lp"), help="input format (default: from the file extension)")
+    parser.add_argument("--station", default=DEFAULT_STATION, help="station for rows without a station column")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows parsed per vectorized chunk")
+    parser.add_argument("--batch-points", type=int, default=BATCH_POINTS, help="points per InfluxDB write")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="writes in flight at once")
+    parser.add_argument("--rollups", action="store_true", help="recompute rollups over the imported range")
+    parser.add_argument("--dry-run", action="store_true", help="parse and validate without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+    if not STATION_ID_PATTERN.match(args.station):
+        parser.error(f"invalid station ID '{args.station}'")
+    file_format = args.format or ("lp" if args.path.endswith((".lp", ".txt")) else "csv")
+
+    client = InfluxDBClient(
+        host=INFLUXDB_HOST,
+        port=INFLUXDB_PORT,
+        username=INFLUXDB_USER,
+        password=INFLUXDB_PASSWORD,
+        database=INFLUXDB_DATABASE,
+        pool_size=args.concurrency
+    )
+    writer = BatchWriter(client, args.batch_points, args.concurrency, dry_run=args.dry_run)
+
+    start = time.perf_counter()
+    try:
+        if file_format == "csv":
+            read, rejected = import_csv(args.path, writer, args.station, args.chunk_rows)
+        else:
+            read, rejected = import_line_protocol(args.path, writer, args.chunk_rows)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    logger.info("Read %d rows, rejected %d values, wrote %d points in %.1fs (%.0f points/s), %d failed batches",
+                read, rejected, writer.points_written, elapsed,
+                writer.points_written / elapsed if elapsed else 0, writer.batches_failed)
+
+    if args.rollups and not args.dry_run and writer.time_min is not None:
+        if not rebuild_rollups(client, writer.time_min, writer.time_max):
+            return 1
+    return 1 if writer.batches_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,6 +19,7 @@ also create a "wifi_creds.h" file to put the wifi ssid and password in
 #include <SPI.h>
 #include <WiFi.h>
 #include <Wire.h>
+#include <sys/time.h>
 #include "SparkFun_ENS160.h"
 #include "SparkFunBME280.h"
 #include "Adafruit_BME680.h"
@@ -34,6 +35,38 @@ also create a "wifi_creds.h" file to put the wifi ssid and password in
 #define DISTURBER_INT 0x04
 #define NOISE_INT 0x01
 
+// Binary sample frame (layout documented in final_scripts/sampleFrame.py).
+// Set USE_BINARY_FRAME to 1 to publish each sample as one packed message on
+// weather/frame instead of one text message per reading.
+#define USE_BINARY_FRAME 0
+// Append "@<device time ms>#<sequence>" to text readings once NTP has set the
+// clock, so the bridge can timestamp them at the source and drop redeliveries
+#define STAMP_TEXT_READINGS 1
+// Report by exception: a reading is only published when it has moved by
+// more than its deadband since it was last published, or when
+// HEARTBEAT_MS has passed without one (so the bridge can tell a steady
+// value from a dead sensor). Lightning strikes are always sent at once.
+// Set REPORT_BY_EXCEPTION to 0 to publish every sample.
+#define REPORT_BY_EXCEPTION 1
+#define HEARTBEAT_MS 600000 // keep in step with REPORT_HEARTBEAT in mqttInfluxdb.py
+#define FRAME_VERSION 1
+#define FRAME_FIELD_COUNT 14
+// frame field indexes, in the order the bridge decodes them
+#define F_AQI 0
+#define F_TVOC 1
+#define F_ECO2 2
+#define F_TEMP_C 3
+#define F_TEMP_F 4
+#define F_PRESSURE 5
+#define F_HUMIDITY 6
+#define F_DEWPOINT 7
+#define F_GAS 8
+#define F_ALTITUDE 9
+#define F_VISIBLE 10
+#define F_INFRARED 11
+#define F_LIGHTNING_DISTANCE 12
+#define F_LIGHTNING_STRIKE 13
+
 // define all sensor and mqtt related objects
 SparkFun_ENS160 myENS;
 BME280 myBME280;
@@ -67,11 +100,137 @@ char pass[] = WIFI_PASS;
 const char broker[] = "35.193.89.30";
 int port = 1883;
 
+// bytes each field takes in the frame, and the factor it is scaled by
+const uint8_t frame_sizes[FRAME_FIELD_COUNT] = {1, 2, 2, 2, 2, 4, 2, 2, 4, 4, 2, 2, 1, 1};
+const float frame_scales[FRAME_FIELD_COUNT] = {1, 1, 1, 100, 100, 100, 100, 100, 100, 100, 1, 1, 1, 1};
+// pending readings for the next binary frame
+int32_t frame_values[FRAME_FIELD_COUNT];
+uint16_t frame_mask = 0;
+uint32_t frame_seq = 0;
+unsigned long last_frame_sample = 0;
+uint32_t text_seq = 0;
+
+// smallest change worth publishing, in each field's reported units;
+// negative means always publish (events)
+const float report_deadbands[FRAME_FIELD_COUNT] = {
+  0.5,   // AQI, any change
+  25,    // TVOC, ppb
+  25,    // eCO2, ppm
+  0.2,   // temperature, C
+  0.36,  // temperature, F
+  0.3,   // pressure, hPa
+  1.0,   // humidity, %
+  0.2,   // dewpoint, C
+  5.0,   // gas, KOhms
+  3.0,   // altitude, m
+  20,    // visible + IR
+  20,    // infrared
+  -1,    // lightning distance
+  -1     // lightning strike
+};
+// last published value of each field and when it was published
+float reported_values[FRAME_FIELD_COUNT];
+unsigned long reported_at[FRAME_FIELD_COUNT];
+uint16_t reported_mask = 0;
+
+int64_t deviceTimeMs() {
+  // device time in ms, 0 until NTP has set the clock
+  struct timeval now;
+  gettimeofday(&now, NULL);
+  return now.tv_sec > 1600000000 ? (int64_t)now.tv_sec * 1000 + now.tv_usec / 1000 : 0;
+}
+
 void sendMqttData(char topic[], String data) {
   // send data over mqtt to specified topic
   mqttClient.beginMessage(topic);
   mqttClient.print(data);
+#if STAMP_TEXT_READINGS
+  int64_t timestamp_ms = deviceTimeMs();
+  if (timestamp_ms > 0) {
+    char stamp[40];
+    snprintf(stamp, sizeof(stamp), "@%lld#%lu", (long long)timestamp_ms, (unsigned long)text_seq++);
+    mqttClient.print(stamp);
+  }
+#endif
+  mqttClient.endMessage();
+}
+
+void publishFrame(uint16_t mask) {
+  // pack the requested pending fields into one frame and send it
+  mask &= frame_mask;
+  if (mask == 0) {
+    return;
+  }
+  uint8_t frame[64];
+  size_t n = 0;
+  frame[n++] = 0x57; // magic "W"
+  frame[n++] = FRAME_VERSION;
+  memcpy(frame + n, &mask, 2); n += 2; // the ESP32 is little endian, like the frame
+  memcpy(frame + n, &frame_seq, 4); n += 4;
+  int64_t timestamp_ms = deviceTimeMs();
+  memcpy(frame + n, &timestamp_ms, 8); n += 8;
+  for (int i = 0; i < FRAME_FIELD_COUNT; i++) {
+    if (mask & (1 << i)) {
+      // low bytes of the little endian int32 are the 1, 2 or 4 byte value
+      memcpy(frame + n, &frame_values[i], frame_sizes[i]);
+      n += frame_sizes[i];
+    }
+  }
+  mqttClient.beginMessage("weather/frame");
+  mqttClient.write(frame, n);
   mqttClient.endMessage();
+  frame_seq++;
+  frame_mask &= ~mask;
+}
+
+bool shouldReport(int field, float value) {
+  // report by exception: first reading, moved past the deadband, heartbeat due or an event
+#if REPORT_BY_EXCEPTION
+  if (report_deadbands[field] >= 0 && (reported_mask & (1 << field))
+      && fabsf(value - reported_values[field]) <= report_deadbands[field]
+      && millis() - reported_at[field] < HEARTBEAT_MS) {
+    return false;
+  }
+#endif
+  reported_values[field] = value;
+  reported_at[field] = millis();
+  reported_mask |= (1 << field);
+  return true;
+}
+
+void reportValue(int field, char topic[], float value) {
+  // queue a reading for the next frame, or send it as its own text message
+  if (!shouldReport(field, value)) {
+    return;
+  }
+#if USE_BINARY_FRAME
+  frame_values[field] = (int32_t)lroundf(value * frame_scales[field]);
+  frame_mask |= (1 << field);
+#else
+  sendMqttData(topic, String(value));
+#endif
+}
+
+void reportValue(int field, char topic[], long value) {
+  if (!shouldReport(field, (float)value)) {
+    return;
+  }
+#if USE_BINARY_FRAME
+  frame_values[field] = (int32_t)value;
+  frame_mask |= (1 << field);
+#else
+  sendMqttData(topic, String(value));
+#endif
+}
+
+unsigned long handleFrameData(unsigned long last_sample) {
+  // send everything gathered since the last frame once a minute (nothing
+  // when every reading stayed inside its deadband)
+  if (last_sample + 60000 < millis()) {
+    publishFrame(frame_mask);
+    last_sample += 60000;
+  }
+  return last_sample;
 }
 
 unsigned long handleComboData(unsigned long last_sample) {
@@ -80,9 +239,9 @@ unsigned long handleComboData(unsigned long last_sample) {
     // Check if the combo sensor reading was successful
     if (myENS.checkDataStatus()) {
       // send data to mqtt server
-      sendMqttData("weather/ens160/aqi", String(myENS.getAQI())); // units: 1-5
-      sendMqttData("weather/ens160/tvoc", String(myENS.getTVOC())); // units: ppb
-      sendMqttData("weather/ens160/eco2", String(myENS.getECO2())); // units: ppm
+      reportValue(F_AQI, "weather/ens160/aqi", (long)myENS.getAQI()); // units: 1-5
+      reportValue(F_TVOC, "weather/ens160/tvoc", (long)myENS.getTVOC()); // units: ppb
+      reportValue(F_ECO2, "weather/ens160/eco2", (long)myENS.getECO2()); // units: ppm
     }
     else {
       Serial.println("Failed to read from env combo sensor");
@@ -103,14 +262,14 @@ unsigned long handleBMEData(unsigned long last_sample) {
       // subtract 3 degrees C from temp reading as the sensor reading is 
       //  quite consistently about 3 degrees higher than the actual temp
       // when sensor is indoors, this difference is closer to 4 degrees
-      sendMqttData("weather/bme680/temperatureC", String(adaBME.temperature - 3.0));
+      reportValue(F_TEMP_C, "weather/bme680/temperatureC", (float)(adaBME.temperature - 3.0));
       float degrees_f = ((adaBME.temperature - 3.0) * (9.0 / 5.0)) + 32.0;
-      sendMqttData("weather/bme680/temperatureF", String(degrees_f));
-      sendMqttData("weather/bme680/pressure", String(adaBME.pressure / 100.0)); // units: hPa
-      sendMqttData("weather/bme680/humidity", String(adaBME.humidity)); // units: %
-      sendMqttData("weather/bme680/dewpoint", String(dewPoint)); // units: degrees C
-      sendMqttData("weather/bme680/gas", String(adaBME.gas_resistance / 1000.0)); // units: KOhms
-      sendMqttData("weather/bme680/altitude", String(adaBME.readAltitude(SEALEVELPRESSURE_HPA))); // units: m
+      reportValue(F_TEMP_F, "weather/bme680/temperatureF", degrees_f);
+      reportValue(F_PRESSURE, "weather/bme680/pressure", (float)(adaBME.pressure / 100.0)); // units: hPa
+      reportValue(F_HUMIDITY, "weather/bme680/humidity", adaBME.humidity); // units: %
+      reportValue(F_DEWPOINT, "weather/bme680/dewpoint", dewPoint); // units: degrees C
+      reportValue(F_GAS, "weather/bme680/gas", (float)(adaBME.gas_resistance / 1000.0)); // units: KOhms
+      reportValue(F_ALTITUDE, "weather/bme680/altitude", adaBME.readAltitude(SEALEVELPRESSURE_HPA)); // units: m
     }
     else {
       Serial.println("Failed to read from Adafruit BME680");
@@ -129,8 +288,8 @@ unsigned long handleLightData(unsigned long last_sample) {
       valid_light = ltr.readBothChannels(visible_plus_ir, infrared);
       if (valid_light) {
         // send data to mqtt server
-        sendMqttData("weather/light/visible_ir", String(visible_plus_ir));
-        sendMqttData("weather/light/infrared", String(infrared));
+        reportValue(F_VISIBLE, "weather/light/visible_ir", (long)visible_plus_ir);
+        reportValue(F_INFRARED, "weather/light/infrared", (long)infrared);
       }
     }
     last_sample += 15000;
@@ -169,7 +328,14 @@ unsigned long handleLightningData(unsigned long last_sample) {
         // account any previously seen events in the last 15 seconds. 
         byte distance = lightning.distanceToStorm(); 
         // send data to mqtt server
+#if USE_BINARY_FRAME
+        // strikes don't wait for the next frame
+        reportValue(F_LIGHTNING_DISTANCE, "weather/lightning/distance", (long)distance);
+        reportValue(F_LIGHTNING_STRIKE, "weather/lightning/strike", 1L);
+        publishFrame((1 << F_LIGHTNING_DISTANCE) | (1 << F_LIGHTNING_STRIKE));
+#else
         sendMqttData("weather/lightning/distance", String(distance));
+#endif
       }
     }
     last_sample += 250;
@@ -318,6 +484,9 @@ void setup() {
   Serial.println("Connected to the network!");
   Serial.println();
 
+  // NTP time for binary frame timestamps
+  configTime(0, 0, "pool.ntp.org");
+
   Serial.print("Attempting to connect to the MQTT broker: ");
   Serial.println(broker);
   if (!mqttClient.connect(broker, port)) {
@@ -338,6 +507,7 @@ void setup() {
   last_bme_sample = start_time;
   last_light_sample = start_time;
   last_lightning_sample = start_time;
+  last_frame_sample = start_time;
   Serial.println("done with setup");
 }
 
@@ -353,4 +523,9 @@ void loop() {
 
   // lightning sensor
   last_lightning_sample = handleLightningData(last_lightning_sample);
+
+#if USE_BINARY_FRAME
+  // binary frame of everything sampled this minute
+  last_frame_sample = handleFrameData(last_frame_sample);
+#endif
 }
\ No newline at end of file
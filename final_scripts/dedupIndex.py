@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Duplicate Reading Index
+-----------------------
+Recognises readings the bridge has already seen, so QoS redeliveries and
+replayed device queues are not written twice. Each station/measurement
+series keeps a sliding window of the sequence numbers (or, without one,
+the device timestamps) it has accepted, the way a replay window works:
+
+    key already in the window          duplicate
+    newer than the window's high mark  accepted, the window slides forward
+    older, but inside the window       accepted (it arrived out of order)
+    far older than the window          accepted as a device restart or a
+                                       wrapped counter; the window restarts
+
+A sequence number is only a duplicate together with its device timestamp
+when the reading has one, since a station's counters restart at 0 on
+every reboot: a sequence number at or below the high mark whose device
+timestamp is newer than the high mark's is a restarted device, and the
+window restarts from it.
+
+Readings that carry neither a sequence number nor a device timestamp
+cannot be told apart and are always accepted. Series are kept in LRU
+order and the least recently used are evicted beyond max_series, so
+memory stays bounded however many stations come and go.
+"""
+import collections
+import threading
+
+
+class _Window:
+    __slots__ = ("high", "high_ms", "keys", "order")
+
+    def __init__(self, key, timestamp_ms):
+        self.high = key
+        self.high_ms = timestamp_ms  # device timestamp of the high mark, 0 if unknown
+        self.keys = {key: timestamp_ms}  # key -> device timestamp ms, 0 if unknown
+        self.order = collections.deque((key,))  # insertion order, for pruning
+
+
+class DedupIndex:
+    """Per-series sliding windows of accepted sequence numbers and device timestamps."""
+
+    def __init__(self, seq_window=1024, time_window_ms=600000, max_keys=256, max_series=20000):
+        self.seq_window = seq_window
+        self.time_window_ms = time_window_ms
+        self.max_keys = max_keys  # per series
+        self.max_series = max_series
+        self._series = collections.OrderedDict()  # (station, measurement, kind) -> _Window
+        self._lock = threading.Lock()
+
+        # Counters, read through stats()
+        self.checked = 0
+        self.duplicates = 0
+        self.resets = 0
+        self.evicted = 0
+
+    def is_duplicate(self, station, measurement, seq=None, timestamp_ms=0):
+        """Record a reading and return True if this series has already accepted it."""
+        if seq is not None:
+            kind, key, window = "seq", seq, self.seq_window
+        elif timestamp_ms > 0:
+            kind, key, window = "time", timestamp_ms, self.time_window_ms
+        else:
+            return False
+
+        series = (station, measurement, kind)
+        with self._lock:
+            self.checked += 1
+            state = self._series.get(series)
+            if state is None:
+                self._series[series] = _Window(key, timestamp_ms)
+                if len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+                    self.evicted += 1
+                return False
+            self._series.move_to_end(series)
+
+            restarted = kind == "seq" and 0 < state.high_ms < timestamp_ms and key <= state.high
+            if not restarted and key in state.keys:
+                seen_ms = state.keys[key]
+                if not seen_ms or not timestamp_ms or seen_ms == timestamp_ms:
+                    self.duplicates += 1
+                    return True
+            if restarted or key < state.high - window:
+                # Not a redelivery: the device restarted or its counter wrapped
+                self.resets += 1
+                state.high = key
+                state.high_ms = timestamp_ms
+                state.keys.clear()
+                state.order.clear()
+            elif key > state.high and not 0 < timestamp_ms < state.high_ms:
+                # (a higher key with an older timestamp is a late reading from before a restart)
+                state.high = key
+                state.high_ms = timestamp_ms
+
+            if key not in state.keys:
+                state.order.append(key)
+            state.keys[key] = timestamp_ms
+            floor = state.high - window
+            while state.order and (len(state.order) > self.max_keys or state.order[0] < floor):
+                state.keys.pop(state.order.popleft(), None)
+            return False
+
+    def stats(self):
+        """Snapshot of the index counters."""
+        with self._lock:
+            return {
+                "series": len(self._series),
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "resets": self.resets,
+                "evicted": self.evicted,
+            }
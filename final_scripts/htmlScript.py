@@ -1,9 +1,23 @@
 #!/usr/bin/env python3
+import glob
+import gzip
+import hashlib
+import json
+import logging
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from influxdb import InfluxDBClient
 import os
 import pytz
+import metrics
+from latestCache import read_snapshot
+from ringStore import RingStore
+from topicMapping import DEFAULT_STATION, STATION_ID_PATTERN
+
+try:
+    import brotli
+except ImportError:  # optional, only needed for the .br siblings
+    brotli = None
 
 # InfluxDB connection parameters
 INFLUXDB_HOST = 'localhost'
@@ -12,13 +26,79 @@ INFLUXDB_USER = 'user'
 INFLUXDB_PASSWORD = 'secret'
 INFLUXDB_DATABASE = 'weather'
 
-# HTML output file
+# HTML output file. The default station keeps the site's index.html, every
+# other station gets <HTML_ROOT>/<station>/index.html
 HTML_OUTPUT = '/var/www/html/index.html'
+HTML_ROOT = os.path.dirname(HTML_OUTPUT)
+
+# Every page has a latest.json next to it holding its current values. Pages
+# poll it instead of reloading themselves, and it is only rewritten when a
+# value changes, so nginx answers most polls with a 304 Not Modified. Both
+# files get precompressed .gz (and, with the brotli module, .br) siblings
+# for gzip_static/brotli_static.
+LATEST_JSON = 'latest.json'
+LATEST_JSON_VERSION = 1  # bumped when the format changes; open pages then reload
+JSON_POLL_INTERVAL = 15  # seconds between polls in the browser
+# Event stream of the live update gateway (liveGateway.py) as the browser
+# reaches it, e.g. '/live/events' behind nginx. When set, pages also
+# apply readings pushed from it between polls. Empty turns it off.
+LIVE_EVENTS_URL = ''
+LIVE_RETRY_INTERVAL = 60  # seconds before reconnecting after the gateway refused the stream
+
+# Latest value snapshot published by the MQTT bridge (mqttInfluxdb.py).
+# InfluxDB is only queried when the snapshot is missing or older than this.
+LATEST_SNAPSHOT_PATH = '/var/lib/weather-station/latest.snapshot'
+# Pooled bridge workers other than the first publish their own snapshots
+WORKER_SNAPSHOT_GLOB = '/var/lib/weather-station/worker-*/latest.snapshot'
+SNAPSHOT_MAX_AGE = 30  # seconds
+
+# Recent readings the bridge keeps on local disk (RING_PATH in
+# mqttInfluxdb.py). They stand in for InfluxDB while the bridge is
+# restarting and give the high/low over the last RANGE_HOURS. A ring only
+# holds a fixed number of readings per series, so when it does not reach
+# back that far the hourly rollups (RANGE_ROLLUP_RP) cover the rest; they
+# are queried at most every RANGE_ROLLUP_REFRESH.
+RING_PATH = '/var/lib/weather-station/recent.ring'
+WORKER_RING_GLOB = '/var/lib/weather-station/worker-*/recent.ring'
+RANGE_HOURS = 24
+RANGE_ROLLUP_RP = 'rollup_1h'
+RANGE_ROLLUP_REFRESH = 300  # seconds
+
+# Stations only report a reading when it changes, plus a heartbeat every
+# 10 minutes, so an old value is normally still the current one. Readings
+# older than this (REPORT_HOLD in mqttInfluxdb.py) are shown as missing.
+# Lightning is an event and its last distance is always shown.
+READING_MAX_AGE = 1500  # seconds
+
+# Regeneration timing: the snapshot file is checked every POLL_INTERVAL,
+# changes arriving within DEBOUNCE_WINDOW are coalesced into one render, and
+# without a fresh snapshot InfluxDB is polled every DB_POLL_INTERVAL
+POLL_INTERVAL = 0.25  # seconds
+DEBOUNCE_WINDOW = 1.0  # seconds
+DB_POLL_INTERVAL = 15  # seconds
+
+# Logging and the local /metrics endpoint (the bridge uses 9101)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = '%(asctime)s level=%(levelname)s logger=%(name)s %(message)s'
+METRICS_PORT = 9102
+
+# Stands in for the "Last Updated" time while hashing the rendered page,
+# so a page only counts as changed when its values change
+TIMESTAMP_SLOT = '\x00updated\x00'
+
+logger = logging.getLogger('dashboard')
+
+QUERY_SECONDS = metrics.histogram('dashboard_query_seconds', 'Latency of the latest-values InfluxDB query')
+SNAPSHOT_READ_SECONDS = metrics.histogram('dashboard_snapshot_read_seconds', 'Time to read and merge the bridge snapshots')
+RENDER_SECONDS = metrics.histogram('dashboard_render_seconds', 'Time to render one station page')
+UPDATE_SECONDS = metrics.histogram('dashboard_update_seconds', 'Time for a full refresh of every station page')
+DATA_SOURCE = metrics.counter('dashboard_refreshes_total', 'Dashboard refreshes, by data source', labelnames=('source',))
+PAGES_WRITTEN = metrics.counter('dashboard_pages_written_total', 'Station pages rewritten because their content changed')
 
 # Sensor data configuration based on broker messages
 SENSOR_GROUPS = {
     "Air Quality": ["air_quality", "tvoc", "co2_concentration"],
-    "Temperature & Humidity": ["temperature_f", "temperature_c", "humidity", "dewpoint"],
+    "Temperature & Humidity": ["temperature_f", "temperature_f_range", "temperature_c", "humidity", "dewpoint"],
     "Atmospheric Conditions": ["pressure", "altitude", "gas"],
     "Light & Lightning": ["visible_light", "lightning_distance", "last_strike"],
 }
@@ -26,6 +106,7 @@ SENSOR_GROUPS = {
 # Map summary fields to their display names and group
 SUMMARY_FIELD_MAPPING = {
     "temperature_f": {"display": "Temperature (&deg;F)", "group": "Temperature & Humidity"},
+    "temperature_f_range": {"display": "24h High / Low (&deg;F)", "group": "Temperature & Humidity"},
     "temperature_c": {"display": "Temperature (&deg;C)", "group": "Temperature & Humidity"},
     "humidity": {"display": "Humidity (%)", "group": "Temperature & Humidity"},
     "pressure": {"display": "Pressure (hPa)", "group": "Atmospheric Conditions"},
@@ -40,11 +121,8 @@ SUMMARY_FIELD_MAPPING = {
     "last_strike": {"display" : "Time of Last Strike (PST)", "group": "Light & Lightning"}
 }
 
-def generate_html(data):
-    """Generate HTML content for Weather Station Dashboard"""
-
-    # CSS Styles
-    css = """
+# Page styles, embedded in the static shell of every rendered page
+CSS = """
     body {
         font-family: Arial, sans-serif;
         background: linear-gradient(135deg, #1e293b 0%, #0f172a 100%);
@@ -110,160 +188,539 @@ def generate_html(data):
     }
     """
 
-    pacific = pytz.timezone('US/Pacific')
-    local_time = datetime.now(pacific).strftime('%Y-%m-%d %H:%M:%S')
-
-    # Build the HTML content
-    html = f"<!DOCTYPE html><html><head><title>Weather Station Dashboard</title>"
-    html += f"<meta http-equiv='refresh' content='60'>"
-    html += f"<style>{css}</style></head><body>"
-    html += f"<div class='container'>"
-    html += f"<h1>Weather Station Dashboard</h1>"
-    html += f"<div class='timestamp'>Last Updated: {local_time}</div>"
-
-    # Start dashboard grid
-    html += f"<div class='dashboard'>"
-
-    # Insert iframes nicely wrapped
-    iframe_urls = [
-        "http://35.193.89.30:3000/d-solo/bek3tv69tmgw0f/mean-temp-f?orgId=1&timezone=browser&panelId=1&__feature.dashboardSceneSolo",
-        "http://35.193.89.30:3000/d-solo/bek3tv69tmgw0f/mean-temp-f?orgId=1&timezone=browser&panelId=2&__feature.dashboardSceneSolo",
-        "http://35.193.89.30:3000/d-solo/bek3tv69tmgw0f/mean-temp-f?orgId=1&timezone=browser&panelId=3&__feature.dashboardSceneSolo",
-    ]
-
-    for url in iframe_urls:
-        html += f"<div class='iframe-wrapper'>"
-        html += f"<iframe src='{url}'></iframe>"
-        html += f"</div>"
-
-    # Now generate cards
-    for group_name, metrics in SENSOR_GROUPS.items():
-        html += f"<div class='card'><h2>{group_name}</h2>"
-        if group_name in data:
-            for metric in metrics:
-                value = data[group_name].get(metric, 'No data available')
-
-                display_name = SUMMARY_FIELD_MAPPING.get(metric, {}).get('display', metric)
-                html += f"<div class='metric'><span>{display_name}</span><span class='value'>{value}</span></div>"
-        else:
-            html += f"<div class='metric'><span class='no-data'>No data available</span></div>"
-        html += "</div>"
+# Grafana panels embedded above the cards
+IFRAME_URLS = [
+    "http://35.193.89.30:3000/d-solo/bek3tv69tmgw0f/mean-temp-f?orgId=1&timezone=browser&panelId=1&__feature.dashboardSceneSolo",
+    "http://35.193.89.30:3000/d-solo/bek3tv69tmgw0f/mean-temp-f?orgId=1&timezone=browser&panelId=2&__feature.dashboardSceneSolo",
+    "http://35.193.89.30:3000/d-solo/bek3tv69tmgw0f/mean-temp-f?orgId=1&timezone=browser&panelId=3&__feature.dashboardSceneSolo",
+]
+
+PACIFIC = pytz.timezone('US/Pacific')
+
+NO_DATA = 'No data available'
+
+# Keeps an open page current from its latest.json. With cache 'no-cache' the
+# browser revalidates its copy, so an unchanged file costs a 304 and the
+# page is left alone; a reading the page has no slot for (its card shows
+# "no data") or a new format reloads the page instead.
+POLL_SCRIPT = """<script>
+(function () {{
+    var url = '{url}', digest = null;
+    function update(latest) {{
+        if (latest.version !== {version}) {{
+            location.reload();
+            return;
+        }}
+        if (latest.digest === digest) {{
+            return;
+        }}
+        digest = latest.digest;
+        var slots = document.querySelectorAll('[data-metric]'), shown = {{}};
+        for (var i = 0; i < slots.length; i++) {{
+            var metric = slots[i].getAttribute('data-metric');
+            shown[metric] = true;
+            slots[i].textContent = metric in latest.values ? latest.values[metric] : '{no_data}';
+        }}
+        for (var metric in latest.values) {{
+            if (!shown[metric]) {{
+                location.reload();
+                return;
+            }}
+        }}
+        document.getElementById('updated').textContent = latest.updated;
+    }}
+    setInterval(function () {{
+        fetch(url, {{cache: 'no-cache'}})
+            .then(function (response) {{ return response.ok ? response.json() : null; }})
+            .then(function (latest) {{ if (latest) update(latest); }})
+            .catch(function () {{}});
+    }}, {interval});
+}})();
+</script>"""
+
+# Applies readings pushed by the live gateway to the value slots as they
+# arrive; whole numbers get a ".0" so they read the same as rendered ones
+LIVE_SCRIPT = """<script>
+(function () {{
+    if (!window.EventSource) {{
+        return;
+    }}
+    function connect() {{
+        var source = new EventSource('{url}');
+        source.onmessage = function (event) {{
+            var values = JSON.parse(event.data).values;
+            for (var metric in values) {{
+                var slot = document.querySelector('[data-metric="' + metric + '"]'), value = values[metric][0];
+                if (slot) {{
+                    slot.textContent = typeof value === 'number' && Number.isInteger(value) ? value.toFixed(1) : String(value);
+                }}
+            }}
+        }};
+        // The browser gives up on an error response (e.g. 404 before the
+        // gateway has heard from the station); latest.json polling carries on
+        source.onerror = function () {{
+            if (source.readyState === EventSource.CLOSED) {{
+                setTimeout(connect, {retry});
+            }}
+        }};
+    }}
+    connect();
+}})();
+</script>"""
+
+
+class DashboardTemplate:
+    """Precompiled dashboard page.
+
+    The static shell (CSS, iframe wrappers, card skeletons and labels) is
+    built once; render() only joins the current values into the slots.
+    """
+
+    def __init__(self, title="Weather Station Dashboard", iframe_urls=IFRAME_URLS, json_url='/' + LATEST_JSON,
+                 live_url=''):
+        self.head = (
+            f"<!DOCTYPE html><html><head><title>{title}</title>"
+            f"<noscript><meta http-equiv='refresh' content='60'></noscript>"
+            f"<style>{CSS}</style></head><body>"
+            f"<div class='container'>"
+            f"<h1>{title}</h1>"
+            f"<div class='timestamp'>Last Updated: <span id='updated'>"
+        )
+        self.body = "</span></div><div class='dashboard'>" + "".join(
+            f"<div class='iframe-wrapper'><iframe src='{url}'></iframe></div>" for url in iframe_urls
+        )
+        # (group, card opening, [(metric, markup before its value)])
+        self.cards = [
+            (
+                group_name,
+                f"<div class='card'><h2>{group_name}</h2>",
+                [
+                    (metric, "<div class='metric'><span>{}</span><span class='value' data-metric='{}'>".format(
+                        SUMMARY_FIELD_MAPPING.get(metric, {}).get('display', metric), metric))
+                    for metric in group_metrics
+                ],
+            )
+            for group_name, group_metrics in SENSOR_GROUPS.items()
+        ]
+        self.metric_close = "</span></div>"
+        self.no_data = f"<div class='metric'><span class='no-data'>{NO_DATA}</span></div>"
+        self.tail = "</div></div>" + POLL_SCRIPT.format(url=json_url, version=LATEST_JSON_VERSION,
+                                                         interval=JSON_POLL_INTERVAL * 1000, no_data=NO_DATA)
+        if live_url:
+            self.tail += LIVE_SCRIPT.format(url=live_url, retry=LIVE_RETRY_INTERVAL * 1000)
+        self.tail += "</body></html>"
+
+    def render(self, data, updated_at):
+        """Fill the current values into the precompiled page"""
+        parts = [self.head, updated_at, self.body]
+        append = parts.append
+        metric_close = self.metric_close
+        for group_name, card_open, card_metrics in self.cards:
+            append(card_open)
+            values = data.get(group_name)
+            if values is None:
+                append(self.no_data)
+            else:
+                for metric, metric_open in card_metrics:
+                    append(metric_open)
+                    append(str(values.get(metric, NO_DATA)))
+                    append(metric_close)
+            append("</div>")
+        append(self.tail)
+        return "".join(parts)
+
+
+def live_url(station):
+    """The live gateway event stream for a station's page, or '' without a gateway"""
+    return f"{LIVE_EVENTS_URL}?station={station}" if LIVE_EVENTS_URL else ''
+
+
+# Built once at startup and reused for every refresh
+DASHBOARD_TEMPLATE = DashboardTemplate(json_url='/' + LATEST_JSON, live_url=live_url(DEFAULT_STATION))
+station_templates = {DEFAULT_STATION: DASHBOARD_TEMPLATE}
+
+
+def get_template(station):
+    """Precompiled template for a station, built the first time the station is seen"""
+    template = station_templates.get(station)
+    if template is None:
+        template = DashboardTemplate(
+            title=f"Weather Station Dashboard - {station}",
+            iframe_urls=[f"{url}&var-station={station}" for url in IFRAME_URLS],
+            json_url=f"/{station}/{LATEST_JSON}",
+            live_url=live_url(station)
+        )
+        station_templates[station] = template
+    return template
 
-    # Close dashboard and container
-    html += "</div></div></body></html>"
 
-    return html
+def generate_html(data, updated_at=None, station=DEFAULT_STATION):
+    """Generate HTML content for Weather Station Dashboard"""
+    if updated_at is None:
+        updated_at = format_local_time(datetime.now(pytz.utc))
+    return get_template(station).render(data, updated_at)
+
+
+# Measurements shown on the dashboard, queried together in one statement
+LATEST_MEASUREMENTS = [
+    "air_quality", "tvoc", "co2_concentration",
+    "temperature_f", "temperature_c", "pressure", "humidity", "dewpoint",
+    "gas", "altitude", "visible_light", "lightning_distance"
+]
+# Readings flagged by the bridge's quality control carry a "quality" tag
+LATEST_QUERY = 'SELECT last(value) FROM /^({})$/ WHERE "quality" = \'\' GROUP BY "station"'.format(
+    "|".join(LATEST_MEASUREMENTS))
+
+# Precomputed measurement -> dashboard group index
+MEASUREMENT_GROUP = {
+    measurement: group
+    for group, group_measurements in SENSOR_GROUPS.items()
+    for measurement in group_measurements
+}
 
+# One client for the life of the script; its HTTP session keeps the
+# connection to InfluxDB open between refreshes
+influx_client = InfluxDBClient(
+    host=INFLUXDB_HOST,
+    port=INFLUXDB_PORT,
+    username=INFLUXDB_USER,
+    password=INFLUXDB_PASSWORD,
+    database=INFLUXDB_DATABASE,
+    pool_size=2
+)
 
 def get_latest_data():
-    """Get the latest data directly from relevant measurements using original field names"""
+    """Get the latest dashboard values per station, from the bridge snapshot when it is fresh.
+
+    Without a fresh snapshot the bridge's recent ring is tried before InfluxDB.
+    """
+    rings = open_rings()
+    start = time.perf_counter()
+    data = read_latest_snapshot()
+    SNAPSHOT_READ_SECONDS.observe(time.perf_counter() - start)
+    if data is not None:
+        DATA_SOURCE.labels('snapshot').inc()
+    else:
+        data = read_ring_latest(rings)
+        if data is not None:
+            DATA_SOURCE.labels('ring').inc()
+        else:
+            DATA_SOURCE.labels('influxdb').inc()
+            data = query_latest_data()
+    add_ranges(data, rings)
+    return data
+
+
+def is_current(measurement, time_ns, now_ns):
+    """Whether a reading is recent enough to be shown"""
+    return measurement == "lightning_distance" or now_ns - time_ns <= READING_MAX_AGE * 1000000000
+
+
+def snapshot_paths():
+    """The main bridge snapshot plus those of any pooled bridge workers"""
+    return [LATEST_SNAPSHOT_PATH] + sorted(glob.glob(WORKER_SNAPSHOT_GLOB))
+
+
+def read_latest_snapshot():
+    """Build per-station dashboard data from the bridge's snapshot files, or None if they are missing or stale"""
+    latest = {}
+    for path in snapshot_paths():
+        snapshot = read_snapshot(path)
+        # A stale snapshot belongs to a worker that is no longer running
+        if snapshot is None or time.time() - snapshot[0] / 1e9 > SNAPSHOT_MAX_AGE:
+            continue
+        # Workers share stations between them, keep the newest reading of each
+        for station, measurements in snapshot[1].items():
+            merged = latest.setdefault(station, {})
+            for measurement, entry in measurements.items():
+                current = merged.get(measurement)
+                if current is None or entry[1] > current[1]:
+                    merged[measurement] = entry
+    if not latest:
+        return None
+    return dashboard_data(latest)
+
+
+def ring_paths():
+    """The main bridge ring plus those of any pooled bridge workers"""
+    return [RING_PATH] + sorted(glob.glob(WORKER_RING_GLOB))
+
+
+# Ring files mapped so far, path -> (inode, RingStore), kept open between
+# refreshes. The bridge replaces a ring file whose layout changes, which
+# gives it a new inode.
+open_ring_files = {}
+
+
+def open_rings():
+    """The bridge ring files there are, mapped for reading once and reopened only when replaced"""
+    rings = []
+    paths = ring_paths()
+    for path in set(open_ring_files) - set(paths):
+        open_ring_files.pop(path)[1].close()
+    for path in paths:
+        try:
+            inode = os.stat(path).st_ino
+        except OSError:
+            inode = None
+        held = open_ring_files.get(path)
+        if held is not None and held[0] != inode:
+            open_ring_files.pop(path)[1].close()
+            held = None
+        if held is None and inode is not None:
+            ring = RingStore.open(path)
+            if ring is not None:
+                held = open_ring_files[path] = (inode, ring)
+        if held is not None:
+            rings.append(held[1])
+    return rings
+
+
+def read_ring_latest(rings):
+    """Build per-station dashboard data from the newest readings in the rings, or None if they hold none"""
+    latest = {}
+    for ring in rings:
+        for station, measurements in ring.latest_all().items():
+            merged = latest.setdefault(station, {})
+            for measurement, entry in measurements.items():
+                current = merged.get(measurement)
+                if current is None or entry[1] > current[1]:
+                    merged[measurement] = entry
+    data = dashboard_data(latest)
+    return data if any(data.values()) else None
+
+
+def add_ranges(stations, rings):
+    """Add the high/low temperature over the last RANGE_HOURS to every station's data"""
+    group = MEASUREMENT_GROUP["temperature_f_range"]
+    range_start_ns = time.time_ns() - RANGE_HOURS * 3600 * 1000000000
+    rollup_ranges = None
+    for station, data in stations.items():
+        windows = [ring.window(station, "temperature_f", RANGE_HOURS * 3600) for ring in rings]
+        windows = [window for window in windows if window is not None]
+        highs = [window["max"] for window in windows]
+        lows = [window["min"] for window in windows]
+        if not windows or min(window["oldest"] for window in windows) > range_start_ns:
+            if rollup_ranges is None:
+                rollup_ranges = query_rollup_ranges()
+            if station in rollup_ranges:
+                high, low = rollup_ranges[station]
+                highs.append(high)
+                lows.append(low)
+        if highs:
+            data.setdefault(group, {})["temperature_f_range"] = f"{max(highs):.1f} / {min(lows):.1f}"
+
+
+# Last hourly rollup high/low per station, and when it was queried
+rollup_ranges_cache = {'queried_at': 0.0, 'ranges': {}}
+
+
+def query_rollup_ranges():
+    """{station: (high, low)} temperature over the last RANGE_HOURS from the hourly rollups, cached"""
+    now = time.monotonic()
+    if now - rollup_ranges_cache['queried_at'] < RANGE_ROLLUP_REFRESH:
+        return rollup_ranges_cache['ranges']
+    rollup_ranges_cache['queried_at'] = now
     try:
-        client = InfluxDBClient(
-            host=INFLUXDB_HOST,
-            port=INFLUXDB_PORT,
-            username=INFLUXDB_USER,
-            password=INFLUXDB_PASSWORD,
-            database=INFLUXDB_DATABASE
+        result = influx_client.query(
+            f'SELECT max("max"), min("min") FROM "{RANGE_ROLLUP_RP}"."temperature_f" '
+            f'WHERE time > now() - {RANGE_HOURS}h GROUP BY "station"'
         )
-
-        data = {}
-
-        # Measurements to query and corresponding fields
-        measurement_fields = {
-        "air_quality": ["value"],
-        "tvoc": ["value"],
-        "co2_concentration": ["value"],
-        "temperature_f": ["value"],
-        "temperature_c": ["value"],
-        "pressure": ["value"],
-        "humidity": ["value"],
-        "dewpoint": ["value"],
-        "gas": ["value"],
-        "altitude": ["value"],
-        "visible_light": ["value"],
-        "lightning_distance": ["value"]
-        }
-
-        for measurement, fields in measurement_fields.items():
-            for field in fields:
-                try:
-                    # print("measurement", measurement)
-                    # print("field", field)
-                    query = f'SELECT last(value) FROM "{measurement}"'
-                    # query = f'SELECT value FROM gas'
-                    result = client.query(query)
-                    # print("result", result)
-                    points = list(result.get_points())
-                    print("points", points)
-                    if points and len(points) > 0:
-                        value = points[0].get('last')
-                        if value is not None:
-                            # Use field name directly, no transformation
-                            for group, group_measurements in SENSOR_GROUPS.items():
-                                # print("group", group)
-                                # print("group measurements", group_measurements)
-                                if measurement in group_measurements:
-                                    if group not in data:
-                                        data[group] = {}
-                                    # display_name = SUMMARY_FIELD_MAPPING.get(measurement, {}).get("display", field)
-                                    # print("display name", display_name)
-                                    # data[group][measurement] = value
-
-                                    if measurement != "last_strike":
-                                        # add value to data for all measurements except last strike
-                                        # as that is handled when lightning distance is added
-                                        data[group][measurement] = value
-                                    if measurement == "lightning_distance":
-                                        # Adding last lighting strike time to dashboard
-                                        strike_time_str = points[0].get('time')
-                                        time_format = "%Y-%m-%dT%H:%M:%S.%fZ"
-                                        strike_time = datetime.strptime(strike_time_str, time_format)
-                                        # change time zone to PST
-                                        strike_time -= timedelta(hours=7)
-                                        data[group]["last_strike"] = strike_time.strftime("%Y-%m-%d %H:%M:%S")
-
-                except Exception as e:
-                    print(f"Error querying {measurement}/{field}: {e}")
-
-        client.close()
-        print(f"Retrieved data: {data}")
-        return data
-
     except Exception as e:
-        print(f"Error connecting to InfluxDB: {e}")
+        logger.error("Error querying the %s rollups: %s", RANGE_ROLLUP_RP, e)
+        return rollup_ranges_cache['ranges']
+    ranges = {}
+    for (_, tags), points in result.items():
+        station = (tags or {}).get('station') or DEFAULT_STATION
+        for point in points:
+            if point.get('max') is not None and point.get('min') is not None:
+                ranges[station] = (point['max'], point['min'])
+    rollup_ranges_cache['ranges'] = ranges
+    return ranges
+
+
+def dashboard_data(latest):
+    """Turn {station: {measurement: (value, time_ns)}} into per-station dashboard groups"""
+    stations = {}
+    now_ns = time.time_ns()
+    for station, measurements in latest.items():
+        if not STATION_ID_PATTERN.match(station):
+            continue
+        data = stations.setdefault(station, {})
+        for measurement, (value, time_ns) in measurements.items():
+            group = MEASUREMENT_GROUP.get(measurement)
+            if group is None or not is_current(measurement, time_ns, now_ns):
+                continue
+            data.setdefault(group, {})[measurement] = value
+            if measurement == "lightning_distance":
+                strike_time = datetime.fromtimestamp(time_ns / 1e9, PACIFIC)
+                data[group]["last_strike"] = strike_time.strftime("%Y-%m-%d %H:%M:%S")
+    return stations
+
+
+def query_latest_data():
+    """Get the latest value of every dashboard measurement for every station from InfluxDB with a single query"""
+    start = time.perf_counter()
+    try:
+        result = influx_client.query(LATEST_QUERY, epoch='ns')
+    except Exception as e:
+        logger.error("Error querying InfluxDB: %s", e)
         return {}
-
-def main():
-    """Main function to update the HTML dashboard periodically"""
-    while True:
+    finally:
+        QUERY_SECONDS.observe(time.perf_counter() - start)
+
+    stations = {}
+    now_ns = time.time_ns()
+    # The regex FROM returns one series per measurement and station tag;
+    # points written before stations were tagged have an empty tag
+    for (measurement, tags), points in result.items():
+        group = MEASUREMENT_GROUP.get(measurement)
+        station = (tags or {}).get('station') or DEFAULT_STATION
+        if group is None or not STATION_ID_PATTERN.match(station):
+            continue
+        data = stations.setdefault(station, {})
+        for point in points:
+            value = point.get('last')
+            if value is None or not is_current(measurement, point['time'], now_ns):
+                continue
+            data.setdefault(group, {})[measurement] = value
+            if measurement == "lightning_distance":
+                # Adding last lighting strike time to dashboard
+                strike_time = datetime.fromtimestamp(point['time'] / 1e9, PACIFIC)
+                data[group]["last_strike"] = strike_time.strftime("%Y-%m-%d %H:%M:%S")
+
+    logger.debug("Retrieved data: %s", stations)
+    return stations
+
+def format_local_time(moment):
+    """Format an aware datetime in the dashboard's Pacific time zone"""
+    return moment.astimezone(PACIFIC).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def snapshot_mtime():
+    """Newest modification time of the bridge snapshots, or None when there are none"""
+    mtimes = []
+    for path in snapshot_paths():
         try:
-            # Get latest data from InfluxDB
-            data = get_latest_data()
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            pass
+    return max(mtimes, default=None)
+
+
+def write_atomic(path, content):
+    """Write content (str or bytes) to a temp file next to path and rename it into place"""
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, 'wb' if isinstance(content, bytes) else 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_precompressed(path, content):
+    """Write content with .gz and .br siblings, the siblings first so they are never older than the file"""
+    data = content.encode()
+    # mtime=0 keeps the gzip bytes identical for identical content
+    write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_atomic(path + '.br', brotli.compress(data))
+    write_atomic(path, data)
+
+
+def latest_json(data, station, updated_at):
+    """The latest.json document for a station's dashboard data"""
+    values = {
+        metric: str(value)  # rendered exactly as the page shows them
+        for group_values in data.values()
+        for metric, value in group_values.items()
+    }
+    encoded = json.dumps(values, sort_keys=True, separators=(',', ':'))
+    return json.dumps({
+        'version': LATEST_JSON_VERSION,
+        'station': station,
+        'updated': updated_at,
+        'digest': hashlib.sha256(encoded.encode()).hexdigest()[:16],
+        'values': values,
+    }, sort_keys=True, separators=(',', ':'))
 
-            # Generate HTML
-            html_content = generate_html(data)
 
-            # Write to file
-            with open(HTML_OUTPUT, 'w') as f:
-                f.write(html_content)
+def station_output_path(station):
+    """Where a station's dashboard page is written"""
+    if station == DEFAULT_STATION:
+        return HTML_OUTPUT
+    return os.path.join(HTML_ROOT, station, 'index.html')
 
-            print(f"Updated dashboard at {datetime.now()}")
 
-        except Exception as e:
-            import traceback
-            print(f"Error updating dashboard: {e}")
-            print(traceback.format_exc())
+def update_dashboard(last_digests):
+    """Render every station's page and latest.json in one pass, writing only those whose values changed.
 
-        # Wait 2 seconds before updating again
-        time.sleep(2)
+    last_digests maps station -> content hash of its current page and is updated in place.
+    """
+    stations = get_latest_data()
+    # The default station's page is always rendered, even before any data arrives
+    stations.setdefault(DEFAULT_STATION, {})
+    updated_at = format_local_time(datetime.now(pytz.utc))
+
+    for station, data in stations.items():
+        start = time.perf_counter()
+        page = generate_html(data, updated_at=TIMESTAMP_SLOT, station=station)
+        RENDER_SECONDS.observe(time.perf_counter() - start)
+        digest = hashlib.sha256(page.encode()).hexdigest()
+        if digest == last_digests.get(station):
+            continue
+
+        path = station_output_path(station)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The JSON goes first, so a page never polls a file older than itself
+        write_precompressed(os.path.join(os.path.dirname(path), LATEST_JSON),
+                            latest_json(data, station, updated_at))
+        write_precompressed(path, page.replace(TIMESTAMP_SLOT, updated_at))
+        last_digests[station] = digest
+        PAGES_WRITTEN.inc()
+        logger.info("Updated dashboard for station %s", station)
+
+
+def main():
+    """Main function to regenerate the HTML dashboard whenever the readings change"""
+    last_digests = {}
+    last_mtime = None
+    last_update = 0.0
+    while True:
+        mtime = snapshot_mtime()
+        snapshot_changed = mtime is not None and mtime != last_mtime
+        refresh_due = time.monotonic() - last_update >= DB_POLL_INTERVAL
+
+        if snapshot_changed or refresh_due:
+            if snapshot_changed and last_mtime is not None:
+                # Let a burst of updates settle so it becomes a single render
+                time.sleep(DEBOUNCE_WINDOW)
+                mtime = snapshot_mtime()
+            last_mtime = mtime
+            last_update = time.monotonic()
+            start = time.perf_counter()
+            try:
+                update_dashboard(last_digests)
+            except Exception as e:
+                logger.exception("Error updating dashboard: %s", e)
+            UPDATE_SECONDS.observe(time.perf_counter() - start)
+
+        time.sleep(POLL_INTERVAL)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
     # Make sure we have write permission to the output file
     directory = os.path.dirname(HTML_OUTPUT)
     if not os.path.exists(directory):
-        print(f"Creating directory {directory}")
+        logger.info("Creating directory %s", directory)
         os.makedirs(directory, exist_ok=True)
 
-    print("Starting dashboard generator...")
+    try:
+        metrics.start_server(METRICS_PORT)
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", METRICS_PORT)
+    except OSError as e:
+        logger.error("Could not serve metrics on port %d: %s", METRICS_PORT, e)
+
+    logger.info("Starting dashboard generator...")
     main()
                                                                                                   
\ No newline at end of file
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Bounded Ingest Queue
+--------------------
+Sits between the MQTT callback and the writer threads so a slow InfluxDB
+never stalls the paho network loop. When the queue is full one of three
+backpressure policies applies:
+
+    block        - the producer waits for space (up to block_timeout seconds,
+                   then the message is dropped)
+    drop_oldest  - the oldest queued message is discarded to make room
+    spill        - the new message is appended to a local spill file and
+                   re-queued once the backlog has drained; while spilled
+                   messages are waiting, new ones are spilled behind them
+                   so they are still processed in arrival order
+"""
+import base64
+import collections
+import json
+import logging
+import os
+import threading
+
+POLICIES = ("block", "drop_oldest", "spill")
+
+logger = logging.getLogger(__name__)
+
+
+def _complete_records(path):
+    """Count the records of a spill file, cutting off a last one left partial by a crash."""
+    count = 0
+    end = 0
+    with open(path, "r+b") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                logger.warning("Discarding a partial record at the end of %s", path)
+                break
+            count += 1
+            end += len(line)
+        f.truncate(end)
+    return count
+
+
+class QueueClosed(Exception):
+    """Raised by get() once the queue is closed and empty."""
+
+
+class IngestQueue:
+    """Thread-safe bounded FIFO of (topic, payload, received_ns) messages."""
+
+    def __init__(self, maxsize=10000, policy="block", spill_path="ingest_spill.jsonl", block_timeout=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._closed = False
+        self._replay_path = spill_path + ".replay"
+        self._replay_offset = 0  # bytes of the replay file already re-queued
+        self._spill_file = None  # append handle, kept open between spills
+
+        # Counters, read through stats()
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.unspilled = 0
+        self.max_depth = 0
+
+        # Messages spilled by a previous run, including a replay it did not
+        # finish, are replayed once there is room
+        for path in (self._replay_path, self.spill_path):
+            if os.path.exists(path):
+                self.spilled += _complete_records(path)
+
+    def put(self, item):
+        """Add a message, applying the backpressure policy if the queue is full."""
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+
+            # Spill when full, and while older messages are still on disk so
+            # this one queues behind them. It is counted here, so later
+            # messages queue behind it too, and written outside the lock.
+            spill = self.policy == "spill" and (self.spilled > self.unspilled or len(self._items) >= self.maxsize)
+            if spill:
+                self.spilled += 1
+            elif len(self._items) >= self.maxsize:
+                if self.policy == "block":
+                    if not self._cond.wait_for(lambda: len(self._items) < self.maxsize or self._closed,
+                                               self.block_timeout):
+                        self.dropped += 1
+                        return False
+                    if self._closed:
+                        self.dropped += 1
+                        return False
+                else:
+                    self._items.popleft()
+                    self.dropped += 1
+            if not spill:
+                self._append(item)
+                return True
+        self._spill(item)
+        return True
+
+    def get(self, timeout=None):
+        """Take the oldest message. Returns None on timeout, raises QueueClosed when done."""
+        if self.policy == "spill" and self.spilled > self.unspilled and not self.depth():
+            self.reload_spill()
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                raise QueueClosed()
+            item = self._items.popleft()
+            self.dequeued += 1
+            self._cond.notify_all()
+            return item
+
+    def reload_spill(self):
+        """Move spilled messages back into the queue, oldest first, as far as there is room."""
+        # Only one thread replays at a time, the others keep consuming
+        if not self._reload_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._spill_lock:
+                if self._spill_file is not None:
+                    self._spill_file.close()
+                    self._spill_file = None
+                # A replay file that is left over (unfinished, or from a crash)
+                # holds older messages than the spill file, so it goes first
+                if not os.path.exists(self._replay_path):
+                    if not os.path.exists(self.spill_path):
+                        return 0
+                    os.replace(self.spill_path, self._replay_path)
+                    self._replay_offset = 0
+
+            reloaded = 0
+            with open(self._replay_path, "rb") as f:
+                f.seek(self._replay_offset)
+                for line in iter(f.readline, b""):
+                    try:
+                        record = json.loads(line)
+                        item = (record["topic"], base64.b64decode(record["payload"]), record["received_ns"])
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.warning("Skipping an unreadable record in %s: %s", self._replay_path, e)
+                        with self._cond:
+                            self.unspilled += 1
+                            self.dropped += 1
+                        self._replay_offset = f.tell()
+                        continue
+                    with self._cond:
+                        if len(self._items) >= self.maxsize:
+                            # Still full, the rest stays on disk ahead of anything spilled since
+                            return reloaded
+                        self.unspilled += 1
+                        self._append(item)
+                    reloaded += 1
+                    self._replay_offset = f.tell()
+            os.remove(self._replay_path)
+            self._replay_offset = 0
+            return reloaded
+        finally:
+            self._reload_lock.release()
+
+    def close(self):
+        """Stop accepting messages and wake every waiting producer and consumer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        with self._spill_lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+    def depth(self):
+        with self._cond:
+            return len(self._items)
+
+    def stats(self):
+        """Snapshot of the queue counters."""
+        with self._cond:
+            return {
+                "depth": len(self._items),
+                "max_depth": self.max_depth,
+                "policy": self.policy,
+                "enqueued": self.enqueued,
+                "dequeued": self.dequeued,
+                "dropped": self.dropped,
+                "spilled": self.spilled,
+                "spill_backlog": self.spilled - self.unspilled,
+            }
+
+    def _append(self, item):
+        self._items.append(item)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._cond.notify_all()
+
+    def _spill(self, item):
+        # Called without _cond held, after put() has counted the message
+        topic, payload, received_ns = item
+        record = {
+            "topic": topic,
+            "payload": base64.b64encode(payload).decode("ascii"),
+            "received_ns": received_ns,
+        }
+        try:
+            with self._spill_lock:
+                if self._spill_file is None:
+                    self._spill_file = open(self.spill_path, "ab")
+                self._spill_file.write((json.dumps(record) + "\n").encode())
+                self._spill_file.flush()
+        except OSError as e:
+            logger.error("Error spilling a message on topic %s: %s", topic, e)
+            with self._cond:
+                self.unspilled += 1
+                self.dropped += 1
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Latest Value Cache
+------------------
+Keeps the last value and timestamp of every station's measurements, in a
+fixed-layout binary table, and publishes it as a snapshot file
+that is swapped in atomically. The dashboard reads the snapshot instead of
+querying InfluxDB for values the bridge has only just written.
+
+Snapshot layout (little endian):
+
+    header  magic "WXLC", version (H), entry count (I), written at ns (q)
+    entries station (24s, NUL padded), measurement (32s, NUL padded),
+            value (d), time ns (q)
+"""
+import logging
+import os
+import struct
+import threading
+import time
+
+SNAPSHOT_MAGIC = b"WXLC"
+SNAPSHOT_VERSION = 2
+HEADER = struct.Struct("<4sHIq")
+ENTRY = struct.Struct("<24s32sdq")
+ENTRY_TIME = struct.Struct("<q")  # the time field, last in ENTRY
+
+logger = logging.getLogger(__name__)
+
+
+class LatestCache:
+    """Last value per station and measurement, stored in a preallocated byte table."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._table = bytearray(ENTRY.size * max_entries)
+        self._slots = {}  # (station, measurement) -> slot index
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def update(self, station, measurement, value, time_ns):
+        """Record the latest numeric value of a station's measurement.
+
+        A value older than the one already cached is ignored, so readings
+        that are processed out of order never roll the dashboard back.
+        """
+        key = (station, measurement)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                if len(self._slots) >= self.max_entries:
+                    return
+                slot = len(self._slots)
+                self._slots[key] = slot
+            elif ENTRY_TIME.unpack_from(self._table, (slot + 1) * ENTRY.size - ENTRY_TIME.size)[0] > time_ns:
+                return
+            ENTRY.pack_into(self._table, slot * ENTRY.size, station.encode()[:24], measurement.encode()[:32],
+                            value, time_ns)
+            self._dirty = True
+
+    def snapshot(self):
+        """Serialize the cache into the snapshot format."""
+        with self._lock:
+            count = len(self._slots)
+            self._dirty = False
+            return HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, count, time.time_ns()) \
+                + bytes(self._table[:count * ENTRY.size])
+
+    def publish(self, path):
+        """Write the snapshot to a temp file and rename it over path."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.snapshot())
+        os.replace(tmp_path, path)
+
+    def start_publisher(self, path, interval=0.5, heartbeat=10.0):
+        """Publish the snapshot every interval seconds whenever it has changed.
+
+        It is also republished every heartbeat seconds regardless, so readers
+        can tell a quiet bridge from a dead one by the written timestamp.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._publish_loop, args=(path, interval, heartbeat),
+                                            name="latest-cache", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _publish_loop(self, path, interval, heartbeat):
+        last_publish = 0.0
+        while not self._stopping.wait(interval):
+            if self._dirty or time.monotonic() - last_publish >= heartbeat:
+                try:
+                    self.publish(path)
+                    last_publish = time.monotonic()
+                except OSError as e:
+                    logger.error("Error publishing latest value snapshot: %s", e)
+
+
+def read_snapshot(path):
+    """Read a snapshot file. Returns (written_ns, {station: {measurement: (value, time_ns)}}) or None."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if len(raw) < HEADER.size:
+        return None
+    magic, version, count, written_ns = HEADER.unpack_from(raw)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or len(raw) < HEADER.size + count * ENTRY.size:
+        return None
+    latest = {}
+    for station, name, value, time_ns in ENTRY.iter_unpack(raw[HEADER.size:HEADER.size + count * ENTRY.size]):
+        station = station.rstrip(b"\0").decode()
+        latest.setdefault(station, {})[name.rstrip(b"\0").decode()] = (value, time_ns)
+    return written_ns, latest
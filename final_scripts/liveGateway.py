@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Live Update Gateway
+-------------------
+Pushes live readings to dashboard viewers without making each of them a
+broker subscriber. The gateway holds one MQTT subscription to weather/#,
+keeps the latest value of every station's measurements and fans changes
+out to browsers over WebSocket (/ws) or Server-Sent Events (/events):
+
+    GET /events?station=main     text/event-stream, one JSON message per event
+    GET /ws?station=main         the same messages as WebSocket text frames
+    GET /latest?station=main     the current values as one JSON document
+
+A client first gets a "snapshot" message with every value of its station,
+then "delta" messages with only the measurements that changed since its
+previous message. Updates are conflated per measurement: a client is sent
+at most one message per CLIENT_MIN_INTERVAL, holding the newest value of
+each measurement that changed meanwhile, so a burst of readings or a slow
+client never builds a backlog. Deltas are encoded once and shared by every
+client of a station that is at the same version. Readings the bridge's
+quality control would flag (qualityControl.py) are not pushed.
+
+    {"type": "delta", "station": "main", "version": 812,
+     "values": {"temperature_f": [71.4, 1760000000000]}}   # [value, time ms]
+
+Run it next to the bridge and let nginx proxy /live/ to LISTEN_PORT:
+
+    python3 liveGateway.py
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+import aiomqtt
+from aiohttp import web
+
+import metrics
+from qualityControl import QualityControl
+from topicMapping import DEFAULT_STATION, STATION_ID_PATTERN, TOPIC_MAPPING
+from topicRouter import build_router, split_stamp
+
+# MQTT Configuration
+MQTT_BROKER = "35.193.89.30"
+MQTT_PORT = 1883
+MQTT_USERNAME = "user"
+MQTT_PASSWORD = "secret"
+MQTT_CLIENT_ID = "live-gateway"
+WEATHER_TOPIC = "weather/#"
+MQTT_RECONNECT_INTERVAL = 5  # seconds
+
+# HTTP listener, proxied by nginx
+LISTEN_HOST = "127.0.0.1"
+LISTEN_PORT = 8085
+
+# Per-client limits. A client gets at most one message per
+# CLIENT_MIN_INTERVAL; one that takes longer than SEND_TIMEOUT to accept a
+# message is disconnected so it cannot hold memory for everyone else.
+CLIENT_MIN_INTERVAL = 1.0  # seconds
+SEND_TIMEOUT = 10.0  # seconds
+MAX_CLIENTS = 2000
+MAX_CLIENTS_PER_ADDRESS = 16
+SSE_KEEPALIVE = 15.0  # seconds between comments on an idle event stream
+WS_HEARTBEAT = 30.0  # seconds between WebSocket pings
+
+# Logging and the local /metrics endpoint (the bridge uses 9101, the dashboard 9102)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"
+METRICS_PORT = 9103
+
+logger = logging.getLogger("gateway")
+
+MESSAGES = metrics.counter("gateway_messages_total", "MQTT messages received, by outcome", labelnames=("outcome",))
+MESSAGES_OK = MESSAGES.labels("ok")
+MESSAGES_IGNORED = MESSAGES.labels("ignored")
+MESSAGES_INVALID = MESSAGES.labels("invalid")
+PUSHES = metrics.counter("gateway_pushes_total", "Messages sent to clients, by transport", labelnames=("transport",))
+REJECTED = metrics.counter("gateway_rejected_total", "Clients turned away or dropped, by reason", labelnames=("reason",))
+
+topic_router = build_router(TOPIC_MAPPING)
+
+
+def readings(topic, payload, received_ms):
+    """Station, {measurement: value} and time in ms of one MQTT message, or None if it has no live values."""
+    route, levels = topic_router.match(topic)
+    if route is None or route.kind == "summary":
+        return None
+    station = DEFAULT_STATION if route.station_level is None else levels[route.station_level]
+    if not STATION_ID_PATTERN.match(station):
+        return None
+    if route.kind == "frame":
+        parsed = route.parse(payload)
+        if parsed is None:
+            return None
+        _, timestamp_ms, values = parsed
+    else:
+        stamp = split_stamp(payload)
+        parsed = None if stamp is None else route.parse(stamp[0])
+        if parsed is None:
+            return None
+        timestamp_ms = stamp[1]
+        values = {route.measurement: parsed["value"]}
+    return station, values, timestamp_ms or received_ms
+
+
+class LiveValues:
+    """Latest value of every station's measurements, versioned so clients can ask for what changed."""
+
+    def __init__(self):
+        self._values = {}  # station -> {measurement: (value, time_ms, version)}
+        self._versions = {}  # station -> version of its newest change
+        self._events = {}  # station -> asyncio.Event set on its next change
+        self._encoded = {}  # station -> {since version: encoded delta}, for the current version
+
+    def update(self, station, values, time_ms):
+        """Record readings; a value older than the one held is ignored. Wakes the station's clients."""
+        current = self._values.setdefault(station, {})
+        version = self._versions.get(station, 0)
+        changed = False
+        for measurement, value in values.items():
+            held = current.get(measurement)
+            if held is not None and held[1] > time_ms:
+                continue
+            if not changed:
+                version += 1
+                changed = True
+            current[measurement] = (value, time_ms, version)
+        if not changed:
+            return False
+        self._versions[station] = version
+        self._encoded.pop(station, None)
+        event = self._events.pop(station, None)
+        if event is not None:
+            event.set()
+        return True
+
+    def version(self, station):
+        return self._versions.get(station, 0)
+
+    def known(self, station):
+        """Whether the station has sent readings; only those get events and cached messages."""
+        return station in self._values
+
+    async def wait(self, station, version):
+        """Wait until the station has changed since version."""
+        while self.version(station) <= version:
+            event = self._events.get(station)
+            if event is None:
+                event = self._events[station] = asyncio.Event()
+            await event.wait()
+
+    def message(self, station, since=0):
+        """(version, encoded message) with the values changed after since; since=0 is a full snapshot."""
+        version = self.version(station)
+        # Unknown stations are not cached, so clients cannot grow the cache
+        cache = self._encoded.setdefault(station, {}) if self.known(station) else {}
+        text = cache.get(since)
+        if text is None:
+            values = {
+                measurement: [value, time_ms]
+                for measurement, (value, time_ms, changed) in self._values.get(station, {}).items()
+                if changed > since
+            }
+            text = cache[since] = json.dumps({
+                "type": "delta" if since else "snapshot",
+                "station": station,
+                "version": version,
+                "values": values,
+            }, separators=(",", ":"))
+        return version, text
+
+    def stats(self):
+        return {
+            "stations": len(self._values),
+            "series": sum(len(values) for values in self._values.values()),
+        }
+
+
+class Gateway:
+    """MQTT subscription, HTTP endpoints and the clients connected to them."""
+
+    def __init__(self):
+        self.live = LiveValues()
+        self.quality_control = QualityControl()
+        self.clients = {"ws": 0, "sse": 0}
+        self._addresses = {}  # client address -> open connections
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get("/events", self.handle_events),
+            web.get("/ws", self.handle_websocket),
+            web.get("/latest", self.handle_latest),
+        ])
+        return app
+
+    async def consume(self):
+        """Read messages until cancelled, reconnecting whenever the broker goes away."""
+        while True:
+            try:
+                async with aiomqtt.Client(
+                    MQTT_BROKER,
+                    port=MQTT_PORT,
+                    username=MQTT_USERNAME or None,
+                    password=MQTT_PASSWORD or None,
+                    identifier=MQTT_CLIENT_ID,
+                    keepalive=60
+                ) as client:
+                    logger.info("Connected to MQTT broker: %s on port %s", MQTT_BROKER, MQTT_PORT)
+                    await client.subscribe(WEATHER_TOPIC)
+                    async for message in client.messages:
+                        self.process_message(message.topic.value, message.payload)
+            except aiomqtt.MqttError as e:
+                logger.warning("MQTT connection lost: %s. Reconnecting in %ss...", e, MQTT_RECONNECT_INTERVAL)
+                await asyncio.sleep(MQTT_RECONNECT_INTERVAL)
+
+    def process_message(self, topic, payload):
+        try:
+            parsed = readings(topic, payload, time.time_ns() // 1000000)
+        except Exception as e:
+            MESSAGES_INVALID.inc()
+            logger.error("Error parsing message on topic %s: %s", topic, e)
+            return
+        if parsed is None:
+            MESSAGES_IGNORED.inc()
+            return
+        station, values, time_ms = parsed
+        values = {
+            measurement: value for measurement, value in values.items()
+            if not isinstance(value, float)
+            or self.quality_control.check(station, measurement, value, time_ms * 1000000) == "ok"
+        }
+        if not values:
+            MESSAGES_INVALID.inc()
+            return
+        MESSAGES_OK.inc()
+        self.live.update(station, values, time_ms)
+
+    async def handle_latest(self, request):
+        station = self._station(request)
+        _, text = self.live.message(station)
+        return web.Response(text=text, content_type="application/json", headers={"Cache-Control": "no-cache"})
+
+    async def handle_events(self, request):
+        station, address = self._admit(request)
+        self.clients["sse"] += 1
+        try:
+            response = web.StreamResponse(headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",  # nginx must not buffer the stream
+            })
+            await response.prepare(request)
+
+            async def send(text):
+                await response.write(f"data: {text}\n\n".encode())
+
+            async def keepalive():
+                await response.write(b": keepalive\n\n")
+
+            try:
+                await self._push(station, send, "sse", keepalive)
+            except (ConnectionResetError, asyncio.TimeoutError):
+                pass  # the client went away or stopped reading
+            return response
+        finally:
+            self.clients["sse"] -= 1
+            self._release(address)
+
+    async def handle_websocket(self, request):
+        station, address = self._admit(request)
+        self.clients["ws"] += 1
+        try:
+            ws = web.WebSocketResponse(heartbeat=WS_HEARTBEAT)
+            await ws.prepare(request)
+
+            async def push():
+                try:
+                    await self._push(station, ws.send_str, "ws")
+                except (ConnectionResetError, asyncio.TimeoutError):
+                    await ws.close()
+
+            pusher = asyncio.create_task(push())
+            try:
+                # Clients send nothing; reading notices when they go away
+                async for _ in ws:
+                    pass
+            finally:
+                pusher.cancel()
+            return ws
+        finally:
+            self.clients["ws"] -= 1
+            self._release(address)
+
+    def stats(self):
+        """Snapshot of the gateway counters."""
+        return {
+            "clients_ws": self.clients["ws"],
+            "clients_sse": self.clients["sse"],
+            "addresses": len(self._addresses),
+            **self.live.stats(),
+        }
+
+    async def _push(self, station, send, transport, keepalive=None):
+        # Snapshot first, then at most one conflated delta per CLIENT_MIN_INTERVAL
+        pushes = PUSHES.labels(transport)
+        version, text = self.live.message(station)
+        await asyncio.wait_for(send(text), SEND_TIMEOUT)
+        pushes.inc()
+        while True:
+            await asyncio.sleep(CLIENT_MIN_INTERVAL)
+            if keepalive is None:
+                await self.live.wait(station, version)
+            else:
+                try:
+                    await asyncio.wait_for(self.live.wait(station, version), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    await asyncio.wait_for(keepalive(), SEND_TIMEOUT)
+                    continue
+            version, text = self.live.message(station, since=version)
+            try:
+                await asyncio.wait_for(send(text), SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                REJECTED.labels("slow").inc()
+                raise
+            pushes.inc()
+
+    def _admit(self, request):
+        # Validates the station and enforces the connection limits
+        station = self._station(request)
+        if self.clients["ws"] + self.clients["sse"] >= MAX_CLIENTS:
+            REJECTED.labels("full").inc()
+            raise web.HTTPServiceUnavailable(text="too many clients", headers={"Retry-After": "30"})
+        # Behind nginx every connection comes from localhost
+        address = request.headers.get("X-Real-IP") or request.remote
+        if self._addresses.get(address, 0) >= MAX_CLIENTS_PER_ADDRESS:
+            REJECTED.labels("address").inc()
+            raise web.HTTPTooManyRequests(text="too many connections", headers={"Retry-After": "30"})
+        self._addresses[address] = self._addresses.get(address, 0) + 1
+        return station, address
+
+    def _station(self, request):
+        # Only stations that have sent readings are served, so made-up IDs
+        # never get state of their own
+        station = request.query.get("station", DEFAULT_STATION)
+        if not STATION_ID_PATTERN.match(station):
+            raise web.HTTPBadRequest(text="invalid station")
+        if not self.live.known(station):
+            REJECTED.labels("unknown").inc()
+            raise web.HTTPNotFound(text="unknown station")
+        return station
+
+    def _release(self, address):
+        count = self._addresses.get(address, 1) - 1
+        if count:
+            self._addresses[address] = count
+        else:
+            self._addresses.pop(address, None)
+
+
+async def run():
+    gateway = Gateway()
+    metrics.register_stats("gateway", gateway.stats)
+    try:
+        metrics.start_server(METRICS_PORT)
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", METRICS_PORT)
+    except OSError as e:
+        logger.error("Could not serve metrics on port %d: %s", METRICS_PORT, e)
+
+    runner = web.AppRunner(gateway.app())
+    await runner.setup()
+    await web.TCPSite(runner, LISTEN_HOST, LISTEN_PORT).start()
+    logger.info("Live gateway listening on http://%s:%d", LISTEN_HOST, LISTEN_PORT)
+    try:
+        await gateway.consume()
+    finally:
+        await runner.cleanup()
+        logger.info("Live gateway stopped.")
+
+
+def main():
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
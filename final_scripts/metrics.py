@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+In-process Metrics
+------------------
+Counters and latency histograms cheap enough for the per-message path (a
+lock, an add and, for histograms, a bisect over a dozen bucket bounds),
+served in the Prometheus text format on a local HTTP /metrics endpoint:
+
+    REQUESTS = metrics.counter("weather_requests_total", "Requests handled")
+    LATENCY = metrics.histogram("weather_request_seconds", "Request latency")
+    REQUESTS.inc()
+    LATENCY.observe(0.003)
+    metrics.start_server(9101)
+
+Components that already keep a stats() dict are exported with
+register_stats(), which turns its numeric entries into gauges when the
+endpoint is scraped, so they cost nothing in between.
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, from 50us up to 10s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Points per write batch
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_metrics = []  # registration order is exposition order
+_stats = []  # (prefix, stats function, labels)
+_registry_lock = threading.Lock()
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The child metric for one combination of label values."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        children = [((), self)] if not self.labelnames else sorted(self._children.items())
+        for values, child in children:
+            lines.extend(child._samples(self.name, _label_text(self.labelnames, values)))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count of events."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+
+    def _child(self):
+        return Counter(self.name, self.help)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, name, labels):
+        return [f"{name}{labels} {self.value}"]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def _child(self):
+        return Histogram(self.name, self.help, self.buckets)
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def _samples(self, name, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self.sum, self.count
+        inner = labels[1:-1] + "," if labels else ""
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            samples.append(f'{name}_bucket{{{inner}le="{bound}"}} {cumulative}')
+        samples.append(f"{name}_sum{labels} {total}")
+        samples.append(f"{name}_count{labels} {count}")
+        return samples
+
+
+def _register(metric):
+    with _registry_lock:
+        _metrics.append(metric)
+    return metric
+
+
+def counter(name, help_text, labelnames=()):
+    """Create and register a Counter."""
+    return _register(Counter(name, help_text, labelnames))
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS, labelnames=()):
+    """Create and register a Histogram."""
+    return _register(Histogram(name, help_text, buckets, labelnames))
+
+
+def register_stats(prefix, stats, **labels):
+    """Export the numeric entries of stats() as <prefix>_<key> gauges, read at scrape time."""
+    with _registry_lock:
+        _stats.append((prefix, stats, labels))
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_metrics)
+        stats = list(_stats)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.expose())
+
+    gauges = {}
+    for prefix, stats_function, labels in stats:
+        try:
+            values = stats_function()
+        except Exception:
+            continue
+        label_text = _label_text(tuple(labels), tuple(labels.values()))
+        for key, value in values.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                gauges.setdefault(f"{prefix}_{key}", []).append(f"{prefix}_{key}{label_text} {value}")
+    for name, samples in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line each
+
+
+def start_server(port, host="127.0.0.1"):
+    """Serve /metrics on a daemon thread. Returns the server so it can be shut down."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
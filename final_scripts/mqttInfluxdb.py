@@ -4,10 +4,28 @@ Weather MQTT to InfluxDB Bridge
 -------------------------------
 Subscribes to weather MQTT topics and writes the data to InfluxDB.
 """
-import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
 import time
+import zlib
 import paho.mqtt.client as mqtt
 from influxdb import InfluxDBClient
+import metrics
+from dedupIndex import DedupIndex
+from ingestQueue import IngestQueue, QueueClosed
+from latestCache import LatestCache
+from pointSpool import PointSpool
+from qualityControl import QualityControl
+from ringStore import RingStore
+from rollups import ROLLUP_WINDOWS, RollupAggregator, RollupRebuilder, rollup_query
+from topicMapping import DEFAULT_STATION, EVENT_MEASUREMENTS, NUMERIC_MEASUREMENTS, STATION_ID_PATTERN, TOPIC_MAPPING
+from topicRouter import build_router, split_stamp
+from writeBuffer import WriteBuffer
 
 # MQTT Configuration
 MQTT_BROKER = "35.193.89.30"
@@ -19,38 +37,256 @@ MQTT_CLIENT_ID = "bridge"
 # Topics to subscribe to
 WEATHER_TOPIC = "weather/#"  # Wildcard to subscribe to all weather topics
 
+# Horizontal scaling. With a share group every bridge instance subscribes to
+# $share/<group>/weather/# under its own client ID and the broker spreads
+# the messages across them. BRIDGE_PROCESSES > 1 runs that many instances
+# from this one service (sharing as group "bridge" unless one is set here).
+MQTT_SHARE_GROUP = ""
+BRIDGE_PROCESSES = 1
+BRIDGE_RESTART_DELAY = 5  # seconds before a crashed worker process is restarted
+
 # InfluxDB Configuration
 INFLUXDB_HOST = "localhost"
 INFLUXDB_PORT = 8086
 INFLUXDB_USER = "user"
 INFLUXDB_PASSWORD = "secret"
 INFLUXDB_DATABASE = "weather"
+# A server that hangs rather than refusing connections must still fail a
+# write in bounded time, so the spool takes over instead of the writer
+# threads (and then the MQTT loop) blocking on it
+INFLUXDB_TIMEOUT = 10  # seconds per request
+INFLUXDB_RETRIES = 2  # attempts per request
+
+# Write batching: flush when this many points are buffered or the oldest
+# buffered point has waited this long, whichever comes first
+WRITE_BATCH_SIZE = 500
+WRITE_FLUSH_INTERVAL_MS = 1000
+
+# Point times come from the device (frames, or text readings sent as
+# "<value>@<timestamp ms>#<seq>") when it has a clock, otherwise from
+# arrival. They are rounded down to WRITE_PRECISION: InfluxDB stores
+# second-aligned timestamps far more compactly, and a reading written twice
+# within the same second overwrites one point instead of adding another.
+WRITE_PRECISION = "s"  # "s", "ms", "u" or "ns"
+MAX_DEVICE_CLOCK_AHEAD = 300  # seconds; a device clock further ahead is ignored
+# A device clock further behind (a reset RTC, a long-stale queue) is ignored
+# too; it must stay well inside RAW_RETENTION, as InfluxDB refuses points
+# older than that
+MAX_DEVICE_CLOCK_BEHIND = 7 * 86400  # seconds
+
+# Readings with a sequence number or device timestamp are checked against a
+# sliding window of recent ones per station/measurement, so redeliveries
+# and replayed device queues are dropped instead of written twice
+DEDUP_SEQ_WINDOW = 1024  # sequence numbers
+DEDUP_TIME_WINDOW_MS = 600000  # device timestamps, ms
+DEDUP_MAX_SERIES = 20000  # least recently used series are forgotten beyond this
+
+# Quality control of numeric readings (see qualityControl.py for the ranges
+# and thresholds per measurement). Readings with a flag in QC_DROP are not
+# written; other flagged readings are written with a "quality" tag holding
+# the flag and are left out of the rollups and the dashboard.
+QC_DROP = ("range",)
+QC_WINDOW = 31  # readings per series for the rolling MAD
+QC_SPIKE_MADS = 6.0
+QC_STUCK_SECONDS = 3 * 3600
+
+# Raw points are kept this long in the default retention policy. Rollups
+# are kept in their own policies (see ROLLUP_WINDOWS in rollups.py).
+RAW_RETENTION = "30d"
+ROLLUP_GRACE = 30  # seconds a window stays open after it ends, for late points
+ROLLUP_INTERVAL = 10  # seconds between checks for windows to close
+# A new rollup policy is backfilled from raw data in the background, one
+# chunk at a time (a whole number of the longest rollup window, so no
+# window is split). Progress is kept in the STATE_RP policy, so a backfill
+# that is interrupted resumes on the next start, and the raw policy is only
+# bounded to RAW_RETENTION once every rollup policy has been backfilled.
+ROLLUP_BACKFILL_CHUNK = 86400  # seconds
+ROLLUP_BACKFILL_TIMEOUT = 300  # seconds per chunk query
+STATE_RP = "bridge_state"
+BACKFILL_MEASUREMENT = "rollup_backfill"
+
+# Stations report by exception (REPORT_BY_EXCEPTION in the firmware): a
+# reading is only sent when it moves past its deadband, or as a heartbeat
+# every REPORT_HEARTBEAT seconds. Rollup windows without points hold the
+# last value of a series that reported within REPORT_HOLD, so a steady
+# reading still has rollups while a silent sensor stops getting them.
+REPORT_HEARTBEAT = 600  # seconds, HEARTBEAT_MS in the firmware
+REPORT_HOLD = REPORT_HEARTBEAT * 5 // 2  # seconds, a missed heartbeat and then some
+
+# Local state shared with the dashboard generator. Pooled worker processes
+# other than the first keep theirs in worker-<n>/, which the dashboard
+# merges with the main snapshot.
+STATE_DIR = "/var/lib/weather-station"
+WORKER_ID = os.environ.get("BRIDGE_WORKER")  # set for pooled worker processes
+WORKER_STATE_DIR = f"{STATE_DIR}/worker-{WORKER_ID}" if WORKER_ID not in (None, "0") else STATE_DIR
+LATEST_SNAPSHOT_PATH = f"{WORKER_STATE_DIR}/latest.snapshot"
+LATEST_SNAPSHOT_INTERVAL = 0.5  # seconds between snapshot publishes
+# Recent readings of every series, memory-mapped for the dashboard's window
+# queries (see ringStore.py). RING_SLOTS readings per series hold a day at
+# one reading every 21 seconds; the file takes up to 16 bytes per slot.
+RING_PATH = f"{WORKER_STATE_DIR}/recent.ring"
+RING_SLOTS = 4096
+RING_MAX_SERIES = 1024
+
+# Local spool for points that could not be written (InfluxDB down or too slow)
+SPOOL_DIR = f"{WORKER_STATE_DIR}/spool"
+SPOOL_MAX_BYTES = 256 * 1024 * 1024
+SPOOL_FSYNC_EVERY = 1000  # points
+SPOOL_FSYNC_INTERVAL = 1.0  # seconds
+SPOOL_REPLAY_CHUNK = 5000  # points per replayed write
+
+# Ingest queues between the MQTT callback and the writer threads, one per
+# thread. A station's messages always go to the same queue so they are
+# processed in arrival order.
+INGEST_QUEUE_SIZE = 10000  # total across the queues
+INGEST_BACKPRESSURE = "spill"  # "block", "drop_oldest" or "spill"
+INGEST_BLOCK_TIMEOUT = 5.0  # seconds to wait for space before dropping (block policy)
+INGEST_SPILL_PATH = f"{WORKER_STATE_DIR}/ingest_spill.jsonl"
+WRITER_THREADS = 4
+
+SHARE_GROUP = MQTT_SHARE_GROUP or ("bridge" if BRIDGE_PROCESSES > 1 else "")
+if SHARE_GROUP:
+    SUBSCRIBE_TOPIC = f"$share/{SHARE_GROUP}/{WEATHER_TOPIC}"
+    # A second client with the same ID would kick this one off the broker
+    CLIENT_ID = f"{MQTT_CLIENT_ID}-{socket.gethostname()}-{os.getpid()}"
+else:
+    SUBSCRIBE_TOPIC = WEATHER_TOPIC
+    CLIENT_ID = MQTT_CLIENT_ID
+
+# How often to log queue and write statistics (seconds)
+STATS_INTERVAL = 60
+
+# Logging and metrics. Per-message logs are DEBUG, so at INFO they cost
+# nothing; counters and latency histograms are served on a local /metrics
+# endpoint (pooled worker n listens on METRICS_PORT + n).
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"
+METRICS_PORT = 9101
+
+logger = logging.getLogger("bridge")
+
+PRECISION_NS = {"s": 1000000000, "ms": 1000000, "u": 1000, "ns": 1}[WRITE_PRECISION]
+MAX_DEVICE_CLOCK_AHEAD_NS = MAX_DEVICE_CLOCK_AHEAD * 1000000000
+MAX_DEVICE_CLOCK_BEHIND_NS = MAX_DEVICE_CLOCK_BEHIND * 1000000000
+
+MESSAGES = metrics.counter("weather_messages_total", "MQTT messages received, by outcome", labelnames=("outcome",))
+MESSAGES_OK = MESSAGES.labels("ok")
+MESSAGES_UNROUTED = MESSAGES.labels("unrouted")
+MESSAGES_BAD_STATION = MESSAGES.labels("invalid_station")
+MESSAGES_BAD_PAYLOAD = MESSAGES.labels("invalid_payload")
+MESSAGES_DUPLICATE = MESSAGES.labels("duplicate")
+MESSAGES_REJECTED = MESSAGES.labels("rejected")
+MESSAGES_FAILED = MESSAGES.labels("error")
+MESSAGES_DROPPED = MESSAGES.labels("dropped")
+PARSE_SECONDS = metrics.histogram("weather_parse_seconds", "Time to route and parse one message")
+QUALITY_FLAGS = metrics.counter("weather_quality_flags_total", "Readings flagged by quality control, by flag",
+                                labelnames=("flag",))
+QUEUE_WAIT_SECONDS = metrics.histogram("weather_queue_wait_seconds", "Time from receipt until a writer thread picks a message up")
+
+# Bridge state, built by init_state() in the process that handles
+# messages. The supervisor of pooled workers only needs influx_client, so it
+# never opens the spool, ring or spill files worker 0 uses.
+influx_client = None
+point_spool = None
+write_buffer = None
+rollups = None
+rollup_rebuilder = None
+rollup_writers = {}  # rollup rp -> (spool, write buffer)
+latest_cache = None
+recent_ring = None
+dedup_index = None
+quality_control = None
+ingest_queues = []
+
+def make_influx_client(timeout=INFLUXDB_TIMEOUT):
+    """A new InfluxDB client for the bridge's database."""
+    return InfluxDBClient(
+        host=INFLUXDB_HOST,
+        port=INFLUXDB_PORT,
+        username=INFLUXDB_USER,
+        password=INFLUXDB_PASSWORD,
+        database=INFLUXDB_DATABASE,
+        timeout=timeout,
+        retries=INFLUXDB_RETRIES
+    )
+
+def init_state():
+    """Open the spools, ring and queues and build the in-memory state of a bridge that handles messages."""
+    global influx_client, point_spool, write_buffer, rollups, rollup_rebuilder, latest_cache, recent_ring
+    global dedup_index, quality_control, ingest_queues
+    influx_client = make_influx_client()
+
+    # Failed and overflowing batches are kept here until InfluxDB is back
+    point_spool = PointSpool(
+        SPOOL_DIR,
+        max_bytes=SPOOL_MAX_BYTES,
+        fsync_every=SPOOL_FSYNC_EVERY,
+        fsync_interval=SPOOL_FSYNC_INTERVAL
+    )
 
-# Mapping of topics to measurements
-TOPIC_MAPPING = {
-    "weather/ens160/aqi": {"measurement": "air_quality"},
-    "weather/ens160/tvoc": {"measurement": "tvoc"},
-    "weather/ens160/eco2": {"measurement": "co2_concentration"},
-    "weather/bme680/temperatureF": {"measurement": "temperature_f"},
-    "weather/bme680/temperatureC": {"measurement": "temperature_c"},
-    "weather/bme680/pressure": {"measurement": "pressure"},
-    "weather/bme680/humidity": {"measurement": "humidity"},
-    "weather/bme680/dewpoint": {"measurement": "dewpoint"},
-    "weather/bme680/gas": {"measurement": "gas"},
-    "weather/bme680/altitude": {"measurement": "altitude"},
-    "weather/light/visible_ir": {"measurement": "visible_light"},
-    "weather/light/infrared": {"measurement": "infrared"},
-    "weather/lightning/distance": {"measurement": "lightning_distance"}
-}
-
-# Connect to InfluxDB
-influx_client = InfluxDBClient(
-    host=INFLUXDB_HOST,
-    port=INFLUXDB_PORT,
-    username=INFLUXDB_USER,
-    password=INFLUXDB_PASSWORD,
-    database=INFLUXDB_DATABASE
-)
+    # Points are batched here instead of being written one HTTP request at a time
+    write_buffer = WriteBuffer(
+        influx_client,
+        max_points=WRITE_BATCH_SIZE,
+        flush_interval_ms=WRITE_FLUSH_INTERVAL_MS,
+        spool=point_spool
+    )
+
+    # Windowed aggregates for long-range charts. A shared subscription only
+    # delivers part of each series to this instance, so then the closed windows
+    # are recomputed from raw data instead (by one worker per service).
+    rollups = RollupAggregator(grace=ROLLUP_GRACE, hold=REPORT_HOLD, events=EVENT_MEASUREMENTS)
+    if SHARE_GROUP and WORKER_ID in (None, "0"):
+        rollup_rebuilder = RollupRebuilder(influx_client, INFLUXDB_DATABASE, NUMERIC_MEASUREMENTS, grace=ROLLUP_GRACE)
+
+    # Rollups go to their own retention policies, each with its own spool and buffer
+    for rollup_rp, _, _ in ROLLUP_WINDOWS:
+        rollup_spool = PointSpool(
+            os.path.join(SPOOL_DIR, rollup_rp),
+            max_bytes=SPOOL_MAX_BYTES // 8,
+            fsync_every=SPOOL_FSYNC_EVERY,
+            fsync_interval=SPOOL_FSYNC_INTERVAL,
+            retention_policy=rollup_rp
+        )
+        rollup_writers[rollup_rp] = (rollup_spool, WriteBuffer(
+            influx_client,
+            max_points=WRITE_BATCH_SIZE,
+            flush_interval_ms=WRITE_FLUSH_INTERVAL_MS,
+            spool=rollup_spool,
+            retention_policy=rollup_rp
+        ))
+
+    # Last value of every measurement, published for the dashboard
+    latest_cache = LatestCache()
+
+    # The last few hours of every series, kept on disk across restarts
+    recent_ring = RingStore(RING_PATH, slots=RING_SLOTS, max_series=RING_MAX_SERIES)
+
+    # Recently seen sequence numbers and device timestamps, per series
+    dedup_index = DedupIndex(
+        seq_window=DEDUP_SEQ_WINDOW,
+        time_window_ms=DEDUP_TIME_WINDOW_MS,
+        max_series=DEDUP_MAX_SERIES
+    )
+
+    # Running statistics per series for the quality checks
+    quality_control = QualityControl(
+        window=QC_WINDOW,
+        spike_mads=QC_SPIKE_MADS,
+        stuck_seconds=QC_STUCK_SECONDS,
+        max_series=DEDUP_MAX_SERIES
+    )
+
+    # Messages wait here until their writer thread picks them up
+    ingest_queues = [
+        IngestQueue(
+            maxsize=max(1, INGEST_QUEUE_SIZE // WRITER_THREADS),
+            policy=INGEST_BACKPRESSURE,
+            spill_path=INGEST_SPILL_PATH if i == 0 else INGEST_SPILL_PATH.replace(".jsonl", f"-{i}.jsonl"),
+            block_timeout=INGEST_BLOCK_TIMEOUT
+        )
+        for i in range(WRITER_THREADS)
+    ]
 
 def on_connect(client, userdata, flags, rc):
     """Callback for when the client connects to the MQTT broker."""
@@ -62,84 +298,432 @@ def on_connect(client, userdata, flags, rc):
         4: "Bad username or password",
         5: "Not authorized"
     }
-    print(f"MQTT Connection result: {connection_responses.get(rc, f'Unknown error ({rc})')}")
+    logger.info("MQTT Connection result: %s", connection_responses.get(rc, f"Unknown error ({rc})"))
     
     if rc == 0:
-        print(f"Connected to MQTT broker: {MQTT_BROKER} on port {MQTT_PORT}")
-        client.subscribe(WEATHER_TOPIC)
-        print(f"Subscribed to topic: {WEATHER_TOPIC}")
+        logger.info("Connected to MQTT broker: %s on port %s as %s", MQTT_BROKER, MQTT_PORT, CLIENT_ID)
+        client.subscribe(SUBSCRIBE_TOPIC)
+        logger.info("Subscribed to topic: %s", SUBSCRIBE_TOPIC)
     else:
-        print("Failed to connect to MQTT broker. Exiting...")
+        logger.critical("Failed to connect to MQTT broker. Exiting...")
         exit(1)
 
 def on_message(client, userdata, msg):
-    """Callback for when a message is received from the MQTT broker."""
+    """Callback for when a message is received from the MQTT broker.
+
+    Only stamps and queues the message; parsing and writing happen on the
+    writer threads so a slow InfluxDB never blocks the network loop.
+    """
+    queue = ingest_queues[writer_index(msg.topic)]
+    if not queue.put((msg.topic, msg.payload, time.time_ns())):
+        MESSAGES_DROPPED.inc()
+        logger.warning("Ingest queue full, dropped message on topic %s", msg.topic)
+
+def writer_index(topic):
+    """Writer queue for a topic, chosen by station so each station's messages stay in order."""
+    route, levels = topic_router.match(topic)
+    if route is None or route.station_level is None:
+        station = DEFAULT_STATION
+    else:
+        station = levels[route.station_level]
+    return zlib.crc32(station.encode()) % len(ingest_queues)
+
+topic_router = build_router(TOPIC_MAPPING)
+
+def message_points(topic, payload, received_ns):
+    """Turn one MQTT message into InfluxDB points, or None if it is not a valid reading."""
+    route, levels = topic_router.match(topic)
+    if route is None:
+        MESSAGES_UNROUTED.inc()
+        return None
+    if route.station_level is None:
+        station = DEFAULT_STATION
+    else:
+        station = levels[route.station_level]
+        if not STATION_ID_PATTERN.match(station):
+            MESSAGES_BAD_STATION.inc()
+            logger.warning("Invalid station ID in topic %s", topic)
+            return None
+
+    if route.kind == "frame":
+        parsed = route.parse(payload)
+        if parsed is not None:
+            seq, timestamp_ms, values = parsed
+    else:
+        # Text readings may carry "@<timestamp ms>#<seq>" after the value;
+        # summaries are JSON and never do
+        stamp = (payload, 0, None) if route.kind == "summary" else split_stamp(payload)
+        parsed = None if stamp is None else route.parse(stamp[0])
+        if parsed is not None:
+            _, timestamp_ms, seq = stamp
+    if parsed is None:
+        MESSAGES_BAD_PAYLOAD.inc()
+        logger.warning("Invalid %s payload on topic %s: %r", route.kind, topic, payload)
+        return None
+
+    # A frame's readings share one sequence number, so frames are deduplicated as a whole
+    if dedup_index.is_duplicate(station, route.measurement or route.kind, seq, timestamp_ms):
+        MESSAGES_DUPLICATE.inc()
+        return None
+
+    # Device time when the station has a clock that is close enough to arrival
+    device_ns = timestamp_ms * 1000000
+    if (timestamp_ms > 0 and received_ns - MAX_DEVICE_CLOCK_BEHIND_NS <= device_ns
+            <= received_ns + MAX_DEVICE_CLOCK_AHEAD_NS):
+        point_time = device_ns
+    else:
+        point_time = received_ns
+    point_time -= point_time % PRECISION_NS
+    tags = {"station": station}
+
+    if route.kind == "frame":
+        # One point per measurement in the frame
+        points = [
+            {
+                "measurement": measurement,
+                "tags": tags,
+                "time": point_time,
+                "fields": {"value": value}
+            }
+            for measurement, value in values.items()
+        ]
+    else:
+        points = [{
+            "measurement": route.measurement,
+            "tags": tags,
+            "time": point_time,  # ns, rounded down to WRITE_PRECISION
+            "fields": parsed
+        }]
+    points = check_quality(points)
+    if points is None:
+        MESSAGES_REJECTED.inc()
+        return None
+    MESSAGES_OK.inc()
+    return points
+
+def check_quality(points):
+    """Run numeric readings through quality control: drop those flagged QC_DROP, tag the other flagged ones."""
+    checked = []
+    for point in points:
+        value = point["fields"].get("value")
+        if isinstance(value, float):
+            flag = quality_control.check(point["tags"]["station"], point["measurement"], value, point["time"])
+            if flag != "ok":
+                QUALITY_FLAGS.labels(flag).inc()
+                if flag in QC_DROP:
+                    continue
+                # Frame points share one tags dict
+                point["tags"] = {**point["tags"], "quality": flag}
+        checked.append(point)
+    return checked or None
+
+def track_points(points):
+    """Feed numeric readings that passed quality control to the dashboard cache, the recent ring and the rollups."""
+    for point in points:
+        if "quality" in point["tags"]:
+            continue
+        value = point["fields"].get("value")
+        if isinstance(value, bool):
+            # A strike flag: only strikes are worth remembering, as events
+            if value:
+                recent_ring.append(point["tags"]["station"], point["measurement"], 1.0, point["time"])
+        elif isinstance(value, float):
+            station = point["tags"]["station"]
+            latest_cache.update(station, point["measurement"], value, point["time"])
+            recent_ring.append(station, point["measurement"], value, point["time"])
+            if not SHARE_GROUP:
+                rollups.add(station, point["measurement"], value, point["time"])
+
+def process_message(topic, payload, received_ns):
+    """Parse one queued message and hand the resulting points to the write buffer."""
+    QUEUE_WAIT_SECONDS.observe((time.time_ns() - received_ns) / 1e9)
     try:
-        topic = msg.topic
-        payload = msg.payload.decode()
-        print(f"Received message on topic {topic}: {payload}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received message on topic %s: %s", topic, payload.decode(errors='replace'))
         
-        # Handle the message based on the topic
-        if topic in TOPIC_MAPPING:
-            mapping = TOPIC_MAPPING[topic]
-            measurement = mapping["measurement"]
-            # field = mapping["field"]
-            
-            # For summary topic (JSON data)
-            if topic == "weather/summary":
-                json_data = json.loads(payload)
-                # Create point with all fields from summary
-                json_body = [{
-                    "measurement": "weather_summary",
-                    "time": int(time.time() * 1000000000),  # nanoseconds precision
-                    "fields": {
-                        "temperatureF": float(json_data["temperatureF"]),
-                        "humidity": float(json_data["humidity"]),
-                        "pressure": float(json_data["pressure"]),
-                        "tvoc": int(json_data["tvoc"]),
-                        "eco2": int(json_data["eco2"]),
-                        "aqi": int(json_data["aqi"]),
-                        "light_level": int(json_data["light_level"]),
-                        "lightning_distance": float(json_data["lightning_distance"])
-                    }
-                }]
-            else:
-                # Create point with single field for individual topics
-                try:
-                    # Try to convert to float first
-                    value = float(payload)
-                except ValueError:
-                    # If not a number, keep as string
-                    value = payload
-                
-                json_body = [{
-                    "measurement": measurement,
-                    # "tags": {
-                    #     "sensor": topic.split('/')[1],  # e.g., "ens160", "bme280"
-                    #     "parameter": topic.split('/')[-1]  # e.g., "aqi", "humidity"
-                    # },
-                    "time": int(time.time() * 1000000000),  # nanoseconds precision
-                    "fields": {
-                        # field: value
-                        "value": value
-                    }
-                }]
-            
-            # Write to InfluxDB
-            success = influx_client.write_points(json_body)
-            if success:
-                print(f"Data written to InfluxDB: {measurement}")
-            else:
-                print(f"Failed to write data to InfluxDB: {measurement}")
+        start = time.perf_counter()
+        json_body = message_points(topic, payload, received_ns)
+        PARSE_SECONDS.observe(time.perf_counter() - start)
+        if json_body is None:
+            return
+        track_points(json_body)
+
+        # Queue for the next batched write, flushing here if the batch is full
+        if write_buffer.add(json_body):
+            write_buffer.flush()
                 
-    except json.JSONDecodeError:
-        print(f"Error: Cannot parse JSON from topic {topic}: {payload}")
     except Exception as e:
-        print(f"Error processing message on topic {topic}: {e}")
+        MESSAGES_FAILED.inc()
+        logger.error("Error processing message on topic %s: %s", topic, e)
+
+def setup_retention_policies():
+    """Create the rollup retention policies and start backfilling the new ones.
+
+    The raw retention policy is only bounded once every rollup policy has
+    been backfilled, so raw history never expires before it is rolled up.
+    """
+    existing = {rp["name"]: rp for rp in influx_client.get_list_retention_policies(INFLUXDB_DATABASE)}
+    if STATE_RP not in existing:
+        influx_client.create_retention_policy(STATE_RP, "INF", 1, database=INFLUXDB_DATABASE)
+    progress = backfill_progress()
+    now_ns = time.time_ns()
+    pending = []
+    for rp, window, duration in ROLLUP_WINDOWS:
+        if rp in existing:
+            influx_client.alter_retention_policy(rp, database=INFLUXDB_DATABASE, duration=duration)
+        else:
+            logger.info("Creating retention policy '%s' (%s)", rp, duration)
+            influx_client.create_retention_policy(rp, duration, 1, database=INFLUXDB_DATABASE)
+        # A policy without progress is backfilled from scratch, also one that
+        # already existed: its backfill may have been cut short
+        until_ns, through_ns, done = progress.get(rp, (0, 0, False))
+        if done:
+            continue
+        if not until_ns:
+            until_ns = now_ns - now_ns % (window * 1000000000)
+            save_backfill_progress(rp, until_ns, 0, False)
+        pending.append((rp, window, until_ns, through_ns))
+
+    default = next((name for name, rp in existing.items() if rp["default"]), "autogen")
+    if not pending:
+        influx_client.alter_retention_policy(default, database=INFLUXDB_DATABASE, duration=RAW_RETENTION)
+        return
+    threading.Thread(target=backfill_rollups, args=(pending, default), name="rollup-backfill", daemon=True).start()
+
+def backfill_progress():
+    """{rp: (until ns, through ns, done)} of the rollup backfills started so far."""
+    result = influx_client.query(
+        f'SELECT "until", "through", "done" FROM "{STATE_RP}"."{BACKFILL_MEASUREMENT}" GROUP BY "rp"'
+    )
+    progress = {}
+    for (_, tags), points in result.items():
+        for point in points:
+            progress[tags["rp"]] = (int(point["until"]), int(point["through"]), bool(point["done"]))
+    return progress
+
+def save_backfill_progress(rp, until_ns, through_ns, done):
+    # One point per policy at time 0, overwritten as the backfill moves on
+    influx_client.write_points(
+        [{
+            "measurement": BACKFILL_MEASUREMENT,
+            "tags": {"rp": rp},
+            "time": 0,
+            "fields": {"until": until_ns, "through": through_ns, "done": done},
+        }],
+        retention_policy=STATE_RP
+    )
+
+def backfill_rollups(pending, raw_rp):
+    """Backfill rollup policies from raw data chunk by chunk, then bound the raw retention policy."""
+    chunk_ns = ROLLUP_BACKFILL_CHUNK * 1000000000
+    measurements = "|".join(NUMERIC_MEASUREMENTS)
+    # Its own client: a chunk query may take longer than INFLUXDB_TIMEOUT
+    client = make_influx_client(timeout=ROLLUP_BACKFILL_TIMEOUT)
+    try:
+        for rp, window, until_ns, through_ns in pending:
+            if not through_ns:
+                result = client.query(
+                    f'SELECT first("value") FROM /^({measurements})$/ WHERE time < {until_ns}', epoch="ns"
+                )
+                through_ns = min((point["time"] for point in result.get_points()), default=until_ns)
+                through_ns -= through_ns % chunk_ns
+            logger.info("Backfilling retention policy '%s' from %d to %d", rp, through_ns, until_ns)
+            while through_ns < until_ns:
+                end_ns = min(through_ns + chunk_ns, until_ns)
+                client.query(rollup_query(INFLUXDB_DATABASE, rp, window, NUMERIC_MEASUREMENTS,
+                                                 f"time >= {through_ns} AND time < {end_ns}"))
+                through_ns = end_ns
+                save_backfill_progress(rp, until_ns, through_ns, False)
+            save_backfill_progress(rp, until_ns, through_ns, True)
+            logger.info("Backfilled retention policy '%s'", rp)
+        influx_client.alter_retention_policy(raw_rp, database=INFLUXDB_DATABASE, duration=RAW_RETENTION)
+        logger.info("Raw retention policy '%s' set to %s", raw_rp, RAW_RETENTION)
+    except Exception as e:
+        # Raw data is kept as it is; the next start resumes where this stopped
+        logger.error("Rollup backfill failed, raw retention left unchanged: %s", e)
+
+def seed_rollups():
+    """Rebuild the currently open rollup windows from raw data, so a restart doesn't truncate them."""
+    now_ns = time.time_ns()
+    measurements = "|".join(NUMERIC_MEASUREMENTS)
+    for rp, window, _ in ROLLUP_WINDOWS:
+        start = now_ns - now_ns % (window * 1000000000)
+        result = influx_client.query(
+            f'SELECT min("value"), max("value"), sum("value"), count("value") '
+            f'FROM /^({measurements})$/ WHERE time >= {start} AND "quality" = \'\' GROUP BY "station"'
+        )
+        for (measurement, tags), points in result.items():
+            station = (tags or {}).get("station") or DEFAULT_STATION
+            for point in points:
+                if point.get("count"):
+                    rollups.seed(station, measurement, rp, start,
+                                 point["min"], point["max"], point["sum"], point["count"])
+
+    # Series that are holding a steady value keep holding it
+    result = influx_client.query(
+        f'SELECT last("value") FROM /^({measurements})$/ WHERE time > {now_ns - REPORT_HOLD * 1000000000} '
+        f'AND "quality" = \'\' GROUP BY "station"',
+        epoch="ns"
+    )
+    for (measurement, tags), points in result.items():
+        station = (tags or {}).get("station") or DEFAULT_STATION
+        for point in points:
+            if point.get("last") is not None:
+                rollups.seed_last(station, measurement, float(point["last"]), point["time"], now_ns=now_ns)
+                latest_cache.update(station, measurement, float(point["last"]), point["time"])
+
+def seed_latest():
+    """Fill the latest value cache from the recent ring, so steady series are not missing until their next report."""
+    for station, values in recent_ring.latest_all().items():
+        for measurement, (value, time_ns) in values.items():
+            # The ring also holds lightning strikes, which the cache leaves out
+            if measurement in NUMERIC_MEASUREMENTS:
+                latest_cache.update(station, measurement, value, time_ns)
+
+def emit_rollups(closed):
+    """Hand closed rollup windows ({rp: [points]}) to their write buffers."""
+    for rp, points in closed.items():
+        rollup_writers[rp][1].add(points)
+
+def setup_database():
+    """Create the database if needed and set up its retention policies.
+
+    Done once per bridge: by the supervisor before it starts pooled
+    workers, so they never race each other through it.
+    """
+    databases = influx_client.get_list_database()
+    if {'name': INFLUXDB_DATABASE} not in databases:
+        logger.info("Creating database '%s'", INFLUXDB_DATABASE)
+        influx_client.create_database(INFLUXDB_DATABASE)
+    setup_retention_policies()
+
+def prepare_influxdb():
+    """Set up the database unless the supervisor did, and seed the latest values and open rollup windows."""
+    if WORKER_ID is None:
+        setup_database()
+    logger.info("Connected to InfluxDB: %s:%s", INFLUXDB_HOST, INFLUXDB_PORT)
+    seed_latest()
+    if not SHARE_GROUP:
+        seed_rollups()
+
+def writer_worker(queue):
+    """Writer thread: drain one ingest queue until it is closed."""
+    while True:
+        try:
+            item = queue.get(timeout=1.0)
+            if item is not None:
+                process_message(*item)
+        except QueueClosed:
+            return
+        except Exception as e:
+            # Keep the thread: its stations would get no writer otherwise
+            logger.exception("Writer thread error: %s", e)
+            time.sleep(1.0)
+
+def stats_reporter():
+    """Periodically log queue depth, drop counts and write statistics."""
+    while True:
+        time.sleep(STATS_INTERVAL)
+        log_stats()
+
+def log_stats():
+    """Log queue, write buffer, spool and rollup statistics."""
+    for i, queue in enumerate(ingest_queues):
+        logger.info("Ingest queue %d stats: %s", i, queue.stats())
+    logger.info("Write buffer stats: %s", write_buffer.stats())
+    logger.info("Spool stats: %s", point_spool.stats())
+    logger.info("Dedup stats: %s", dedup_index.stats())
+    logger.info("Quality control stats: %s", quality_control.stats())
+    logger.info("Ring stats: %s", recent_ring.stats())
+    if rollup_rebuilder is not None:
+        logger.info("Rollup rebuild stats: %s", rollup_rebuilder.stats())
+    else:
+        logger.info("Rollup stats: %s", rollups.stats())
+
+def setup_logging():
+    """Configure level-gated key=value logging for the bridge process."""
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+def start_metrics(write_stats, queues=ingest_queues):
+    """Export component stats and serve /metrics.
+
+    write_stats maps a retention policy label to the stats() of the writer
+    for that policy, since the threaded and asyncio bridges use different
+    writers (and only the threaded one has ingest queues).
+    """
+    for i, queue in enumerate(queues):
+        metrics.register_stats("weather_ingest_queue", queue.stats, queue=str(i))
+    for rp, stats in write_stats.items():
+        metrics.register_stats("weather_writer", stats, rp=rp)
+    metrics.register_stats("weather_dedup", dedup_index.stats)
+    metrics.register_stats("weather_quality", quality_control.stats)
+    metrics.register_stats("weather_ring", recent_ring.stats)
+    metrics.register_stats("weather_spool", point_spool.stats, rp="default")
+    for rp, (spool, _) in rollup_writers.items():
+        metrics.register_stats("weather_spool", spool.stats, rp=rp)
+    if rollup_rebuilder is not None:
+        metrics.register_stats("weather_rollup_rebuild", rollup_rebuilder.stats)
+    else:
+        metrics.register_stats("weather_rollups", rollups.stats)
+    port = METRICS_PORT + int(WORKER_ID or 0)
+    try:
+        metrics.start_server(port)
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", port)
+    except OSError as e:
+        logger.error("Could not serve metrics on port %d: %s", port, e)
+
+def supervise():
+    """Run BRIDGE_PROCESSES copies of this script as worker processes, restarting any that die."""
+    global influx_client
+    stopping = threading.Event()
+    workers = {}
+
+    def start_worker(index):
+        env = dict(os.environ, BRIDGE_WORKER=str(index))
+        workers[index] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+        logger.info("Started bridge worker %d (pid %d)", index, workers[index].pid)
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    influx_client = make_influx_client()
+    while not stopping.is_set():
+        try:
+            setup_database()
+            break
+        except Exception as e:
+            logger.error("Could not set up InfluxDB, retrying in %ss: %s", BRIDGE_RESTART_DELAY, e)
+            stopping.wait(BRIDGE_RESTART_DELAY)
+    for index in range(BRIDGE_PROCESSES):
+        start_worker(index)
+    while not stopping.wait(1.0):
+        for index, process in list(workers.items()):
+            if process.poll() is not None:
+                logger.error("Bridge worker %d exited with %s, restarting in %ss",
+                             index, process.returncode, BRIDGE_RESTART_DELAY)
+                if stopping.wait(BRIDGE_RESTART_DELAY):
+                    break
+                start_worker(index)
+
+    logger.info("Stopping the bridge workers...")
+    for process in workers.values():
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for process in workers.values():
+        process.wait()
+    logger.info("Bridge stopped.")
 
 def main():
+    # systemd (and the supervisor, for workers) stop the bridge with SIGTERM;
+    # shut down as on Ctrl+C so the finally block drains what is in flight
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    init_state()
+
     # Initialize MQTT client
-    client = mqtt.Client(client_id=MQTT_CLIENT_ID)
+    client = mqtt.Client(client_id=CLIENT_ID)
+    workers = []
     
     # Set callbacks
     client.on_connect = on_connect
@@ -150,31 +734,66 @@ def main():
         client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
     
     try:
-        # Check if InfluxDB database exists, create if not
-        databases = influx_client.get_list_database()
-        if {'name': INFLUXDB_DATABASE} not in databases:
-            print(f"Creating database '{INFLUXDB_DATABASE}'")
-            influx_client.create_database(INFLUXDB_DATABASE)
-        
-        influx_client.switch_database(INFLUXDB_DATABASE)
-        print(f"Connected to InfluxDB: {INFLUXDB_HOST}:{INFLUXDB_PORT}")
+        write_stats = {rp: buffer.stats for rp, (_, buffer) in rollup_writers.items()}
+        start_metrics({"default": write_buffer.stats, **write_stats})
+        prepare_influxdb()
+        write_buffer.start()
+        point_spool.start_replay(influx_client, chunk_points=SPOOL_REPLAY_CHUNK)
+        for spool, buffer in rollup_writers.values():
+            buffer.start()
+            spool.start_replay(influx_client, chunk_points=SPOOL_REPLAY_CHUNK)
+        if rollup_rebuilder is not None:
+            rollup_rebuilder.start(interval=ROLLUP_INTERVAL)
+        elif not SHARE_GROUP:
+            rollups.start(emit_rollups, interval=ROLLUP_INTERVAL)
+        latest_cache.start_publisher(LATEST_SNAPSHOT_PATH, interval=LATEST_SNAPSHOT_INTERVAL)
         
         # Connect to MQTT broker
-        print(f"Connecting to MQTT broker: {MQTT_BROKER}:{MQTT_PORT}...")
+        logger.info("Connecting to MQTT broker: %s:%s...", MQTT_BROKER, MQTT_PORT)
         client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
         
-        # Start the loop
-        print("Starting Weather MQTT to InfluxDB bridge. Press Ctrl+C to stop.")
+        # Start the writer threads and the stats reporter
+        for i, queue in enumerate(ingest_queues):
+            worker = threading.Thread(target=writer_worker, args=(queue,), name=f"writer-{i}", daemon=True)
+            worker.start()
+            workers.append(worker)
+        threading.Thread(target=stats_reporter, name="stats", daemon=True).start()
+
+        logger.info("Starting Weather MQTT to InfluxDB bridge. Press Ctrl+C to stop.")
         client.loop_forever()
         
     except KeyboardInterrupt:
-        print("\nStopping the bridge...")
+        logger.info("Stopping the bridge...")
     except Exception as e:
-        print(f"Error: {e}")
+        logger.exception("Error: %s", e)
     finally:
         # Clean up
         client.disconnect()
-        print("Bridge stopped.")
+        # Let the writers finish what is queued, then drain the write buffer
+        for queue in ingest_queues:
+            queue.close()
+        for worker in workers:
+            worker.join()
+        write_buffer.close()
+        point_spool.close()
+        # Write the open rollup windows as they stand; the next start
+        # rebuilds them from raw data
+        if rollup_rebuilder is not None:
+            rollup_rebuilder.close()
+        rollups.close()
+        emit_rollups(rollups.collect(flush_all=True))
+        for spool, buffer in rollup_writers.values():
+            buffer.close()
+            spool.close()
+        latest_cache.close()
+        latest_cache.publish(LATEST_SNAPSHOT_PATH)
+        log_stats()
+        recent_ring.close()
+        logger.info("Bridge stopped.")
 
 if __name__ == "__main__":
-    main()
+    setup_logging()
+    if BRIDGE_PROCESSES > 1 and WORKER_ID is None:
+        supervise()
+    else:
+        main()
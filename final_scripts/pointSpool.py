@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+On-disk Point Spool
+-------------------
+Append-only segment log of InfluxDB line protocol. Batches that fail to
+write (or that overflow the write buffer) are appended here, and a
+background thread replays them oldest first once InfluxDB answers pings
+again, so restarts and database maintenance no longer leave gaps.
+
+Segments are plain text files named <sequence>.lp in the spool directory.
+Appends are fsynced in batches (every fsync_every lines or fsync_interval
+seconds), and the total size is capped at max_bytes by discarding the
+oldest segments. Replaying a segment twice is harmless because InfluxDB
+overwrites points with the same series and timestamp. Line protocol has no
+notion of retention policy, so each policy written to needs its own spool.
+
+Only outages (connection errors, timeouts, 5xx answers) are worth a retry.
+Points InfluxDB refuses outright with a 4xx, such as points beyond the
+retention policy or a field type conflict, are dropped and counted
+instead, or one bad point would hold back everything behind it.
+"""
+import logging
+import os
+import threading
+import time
+
+from influxdb.exceptions import InfluxDBClientError
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".lp"
+
+# 4xx answers that can clear up on their own (credentials, a database that
+# is not created yet, throttling), so they count as an outage
+RETRYABLE_CLIENT_STATUSES = frozenset((401, 403, 404, 408, 429))
+
+
+def rejected_status(status):
+    """Whether an HTTP status means InfluxDB refused the points themselves, so retrying cannot help."""
+    return 400 <= status < 500 and status not in RETRYABLE_CLIENT_STATUSES
+
+
+def rejected(error):
+    """Whether a write_points exception is such a refusal rather than an outage."""
+    return isinstance(error, InfluxDBClientError) and isinstance(error.code, int) and rejected_status(error.code)
+
+
+class PointSpool:
+    """Crash-safe, size-capped spool of line protocol points."""
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, segment_bytes=8 * 1024 * 1024,
+                 fsync_every=1000, fsync_interval=1.0, retention_policy=None):
+        self.directory = directory
+        self.retention_policy = retention_policy
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        # Cleared when a write fails, set again once a replay succeeds.
+        # While unhealthy the write buffer spools straight away instead of
+        # waiting on a database that is known to be down.
+        self.healthy = True
+
+        self._lock = threading.Lock()
+        self._segments = {}  # sequence -> [bytes, lines]
+        self._current = None  # open file object of the newest segment
+        self._current_seq = None
+        self._replaying = None  # sequence currently being replayed
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Counters, read through stats()
+        self.spooled_points = 0
+        self.replayed_points = 0
+        self.discarded_points = 0
+        self.rejected_points = 0
+        self.last_replay_rate = 0.0  # points per second of the last replayed segment
+
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                path = os.path.join(self.directory, name)
+                with open(path, "rb") as f:
+                    lines = sum(1 for _ in f)
+                self._segments[int(name[:-len(SEGMENT_SUFFIX)])] = [os.path.getsize(path), lines]
+
+    def append(self, lines):
+        """Append line protocol lines (without trailing newlines) to the spool."""
+        if not lines:
+            return
+        data = ("\n".join(lines) + "\n").encode()
+        with self._lock:
+            if self._current is None or self._segments[self._current_seq][0] >= self.segment_bytes:
+                self._roll()
+            self._current.write(data)
+            self._segments[self._current_seq][0] += len(data)
+            self._segments[self._current_seq][1] += len(lines)
+            self.spooled_points += len(lines)
+            self._unsynced += len(lines)
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            self._enforce_cap()
+
+    def sync(self):
+        """Flush and fsync the open segment."""
+        with self._lock:
+            self._sync()
+
+    def backlog(self):
+        """Number of points waiting to be replayed."""
+        with self._lock:
+            return sum(lines for _, lines in self._segments.values())
+
+    def start_replay(self, client, chunk_points=5000, check_interval=5.0):
+        """Start the background thread that replays the spool into InfluxDB."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._replay_loop, args=(client, chunk_points, check_interval),
+                                            name="spool-replay", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop replaying and make everything appended so far durable."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._current is not None:
+                self._sync()
+                self._current.close()
+                self._current = None
+                self._current_seq = None
+
+    def stats(self):
+        """Snapshot of the spool counters."""
+        with self._lock:
+            return {
+                "healthy": self.healthy,
+                "segments": len(self._segments),
+                "backlog_points": sum(lines for _, lines in self._segments.values()),
+                "backlog_bytes": sum(size for size, _ in self._segments.values()),
+                "spooled_points": self.spooled_points,
+                "replayed_points": self.replayed_points,
+                "discarded_points": self.discarded_points,
+                "rejected_points": self.rejected_points,
+                "last_replay_points_per_sec": round(self.last_replay_rate, 1),
+            }
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:010d}{SEGMENT_SUFFIX}")
+
+    def _roll(self):
+        # Called with the lock held: close the open segment and start a new one
+        if self._current is not None:
+            self._sync()
+            self._current.close()
+        self._current_seq = max(self._segments, default=0) + 1
+        self._current = open(self._path(self._current_seq), "ab")
+        self._segments[self._current_seq] = [0, 0]
+
+    def _sync(self):
+        if self._current is not None and self._unsynced:
+            self._current.flush()
+            os.fsync(self._current.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _enforce_cap(self):
+        # Drop the oldest closed segments until the spool fits in max_bytes
+        while sum(size for size, _ in self._segments.values()) > self.max_bytes:
+            closed = [seq for seq in self._segments if seq not in (self._current_seq, self._replaying)]
+            if not closed:
+                break
+            oldest = min(closed)
+            size, lines = self._segments.pop(oldest)
+            os.remove(self._path(oldest))
+            self.discarded_points += lines
+            logger.warning("Spool over %d bytes, discarded %d oldest points", self.max_bytes, lines)
+
+    def _take_oldest(self):
+        # Pick the oldest segment for replay, closing it first if it is the open one
+        with self._lock:
+            if not self._segments:
+                return None
+            oldest = min(self._segments)
+            if oldest == self._current_seq:
+                if self._segments[oldest][1] == 0:
+                    return None
+                self._sync()
+                self._current.close()
+                self._current = None
+                self._current_seq = None
+            self._replaying = oldest
+            return oldest
+
+    def _replay_chunk(self, client, seq, chunk):
+        # Points written; a chunk InfluxDB refuses is dropped, outages raise
+        try:
+            client.write_points(chunk, protocol="line", retention_policy=self.retention_policy)
+        except Exception as e:
+            if not rejected(e):
+                raise
+            logger.error("InfluxDB refused %d spooled points of segment %d, dropping them: %s", len(chunk), seq, e)
+            with self._lock:
+                self.rejected_points += len(chunk)
+            return 0
+        return len(chunk)
+
+    def _replay_loop(self, client, chunk_points, check_interval):
+        while not self._stopping.is_set():
+            # Keep fsync batching bounded in time even when appends stop
+            self.sync()
+
+            if not self.backlog():
+                self._stopping.wait(check_interval)
+                continue
+            try:
+                client.ping()
+            except Exception:
+                self.healthy = False
+                self._stopping.wait(check_interval)
+                continue
+            seq = self._take_oldest()
+            if seq is None:
+                self._stopping.wait(check_interval)
+                continue
+
+            start = time.perf_counter()
+            written = 0
+            try:
+                with open(self._path(seq), "rb") as f:
+                    chunk = []
+                    for raw in f:
+                        # A line without a newline was cut short by a crash
+                        if not raw.endswith(b"\n"):
+                            break
+                        chunk.append(raw[:-1].decode())
+                        if len(chunk) >= chunk_points:
+                            written += self._replay_chunk(client, seq, chunk)
+                            chunk = []
+                    if chunk:
+                        written += self._replay_chunk(client, seq, chunk)
+            except Exception as e:
+                logger.warning("Spool replay of segment %d failed after %d points: %s", seq, written, e)
+                with self._lock:
+                    self._replaying = None
+                self.healthy = False
+                self._stopping.wait(check_interval)
+                continue
+
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._segments.pop(seq, None)
+                self._replaying = None
+                os.remove(self._path(seq))
+                self.replayed_points += written
+                self.last_replay_rate = written / elapsed if elapsed > 0 else 0.0
+                self.healthy = True
+            logger.info("Replayed %d spooled points (%.0f points/s)", written, self.last_replay_rate)
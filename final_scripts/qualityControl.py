@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Streaming Quality Control
+-------------------------
+Checks every numeric reading against the recent history of its series as
+it passes through the bridge, without querying the database. Each series
+keeps a fixed amount of state: an EWMA of its accepted values, the last
+`window` accepted values for a rolling median absolute deviation (MAD),
+and how long its value has not changed. A reading gets one flag:
+
+    ok       nothing wrong found
+    range    outside what the sensor can physically report (RANGES), e.g.
+             the lightning distance of 0 sent when there was no strike
+    spike    further than spike_mads x the robust spread (1.4826 x MAD, but
+             at least the measurement's SPIKE_FLOORS entry) from the EWMA
+    stuck    the exact same value for stuck_seconds on a sensor whose
+             readings always drift (STUCK_MEASUREMENTS)
+
+Flagged values are kept out of the statistics, so a spike does not drag
+the baseline along. A change that persists for spike_confirm readings in a
+row in the same direction is a real shift rather than a spike: the
+statistics restart from it and it is accepted.
+"""
+import collections
+import statistics
+import threading
+
+# Physically possible readings per measurement, (low, high) inclusive
+RANGES = {
+    "air_quality": (1, 5),
+    "tvoc": (0, 65000),  # ppb
+    "co2_concentration": (400, 65000),  # ppm
+    "temperature_c": (-40, 85),
+    "temperature_f": (-40, 185),
+    "pressure": (300, 1100),  # hPa
+    "humidity": (0, 100),  # %
+    "dewpoint": (-60, 60),  # C
+    "gas": (0, 100000),  # KOhms
+    "altitude": (-500, 9000),  # m
+    "visible_light": (0, 65535),
+    "infrared": (0, 65535),
+    "lightning_distance": (1, 40),  # km; the AS3935 reports 1-40, 0 and 63 mean no storm
+}
+
+# Smallest spread the spike test assumes, in the measurement's units, so a
+# series that has been perfectly steady does not flag its first real
+# change. Only these measurements are checked for spikes: light levels and
+# lightning change abruptly by nature.
+SPIKE_FLOORS = {
+    "temperature_c": 1.0,
+    "temperature_f": 1.8,
+    "pressure": 1.0,
+    "humidity": 3.0,
+    "dewpoint": 1.0,
+    "altitude": 10.0,
+    "tvoc": 50,
+    "co2_concentration": 50,
+}
+
+# Readings that never stay exactly the same for long on a working sensor
+STUCK_MEASUREMENTS = frozenset(("temperature_c", "temperature_f", "pressure", "humidity", "dewpoint", "gas"))
+
+MAD_SCALE = 1.4826  # MAD -> standard deviation for normally distributed noise
+
+
+class _Series:
+    __slots__ = ("ewma", "window", "shift", "same_value", "same_since")
+
+    def __init__(self, window):
+        self.ewma = None
+        self.window = collections.deque(maxlen=window)
+        self.shift = 0  # consecutive spikes, signed by direction
+        self.same_value = None
+        self.same_since = 0
+
+
+class QualityControl:
+    """Per-series running statistics that flag out-of-range, spiking and stuck readings."""
+
+    def __init__(self, ranges=RANGES, spike_floors=SPIKE_FLOORS, stuck_measurements=STUCK_MEASUREMENTS,
+                 window=31, alpha=0.2, spike_mads=6.0, spike_confirm=3, min_samples=5,
+                 stuck_seconds=3 * 3600, max_series=20000):
+        self.ranges = ranges
+        self.spike_floors = spike_floors
+        self.stuck_measurements = frozenset(stuck_measurements)
+        self.window = window
+        self.alpha = alpha
+        self.spike_mads = spike_mads
+        self.spike_confirm = spike_confirm
+        self.min_samples = min_samples
+        self.stuck_ns = stuck_seconds * 1000000000
+        self.max_series = max_series
+        self._series = collections.OrderedDict()  # (station, measurement) -> _Series
+        self._lock = threading.Lock()
+
+        # Counters, read through stats()
+        self.checked = 0
+        self.flagged = collections.Counter()
+        self.shifts = 0
+
+    def check(self, station, measurement, value, time_ns):
+        """Flag one reading ("ok", "range", "spike" or "stuck") and fold it into its series' statistics."""
+        with self._lock:
+            self.checked += 1
+            flag = self._check(station, measurement, value, time_ns)
+            if flag != "ok":
+                self.flagged[flag] += 1
+            return flag
+
+    def stats(self):
+        """Snapshot of the quality control counters."""
+        with self._lock:
+            return {
+                "series": len(self._series),
+                "checked": self.checked,
+                "range": self.flagged["range"],
+                "spike": self.flagged["spike"],
+                "stuck": self.flagged["stuck"],
+                "shifts": self.shifts,
+            }
+
+    def _check(self, station, measurement, value, time_ns):
+        limits = self.ranges.get(measurement)
+        if limits is not None and not limits[0] <= value <= limits[1]:
+            return "range"
+
+        key = (station, measurement)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(self.window)
+            if len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        else:
+            self._series.move_to_end(key)
+
+        floor = self.spike_floors.get(measurement)
+        if floor is not None and len(series.window) >= self.min_samples:
+            median = statistics.median(series.window)
+            spread = max(MAD_SCALE * statistics.median(abs(x - median) for x in series.window), floor)
+            deviation = value - series.ewma
+            if abs(deviation) > self.spike_mads * spread:
+                direction = 1 if deviation > 0 else -1
+                series.shift = series.shift + direction if series.shift * direction > 0 else direction
+                if abs(series.shift) < self.spike_confirm:
+                    return "spike"
+                # It stayed there: a real change, start over from the new level
+                self.shifts += 1
+                series.window.clear()
+                series.ewma = None
+            series.shift = 0
+
+        series.ewma = value if series.ewma is None else series.ewma + self.alpha * (value - series.ewma)
+        series.window.append(value)
+
+        if measurement in self.stuck_measurements:
+            if value != series.same_value:
+                series.same_value = value
+                series.same_since = time_ns
+            elif time_ns - series.same_since >= self.stuck_ns:
+                return "stuck"
+        return "ok"
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Recent Readings Ring Store
+--------------------------
+Keeps the most recent readings of every station's measurements in a
+fixed-size file on local disk, memory-mapped with NumPy, so the dashboard
+and other local tools can answer "what was it lately" questions (latest
+value, min/max/mean over the last hours, time of the last lightning strike)
+without a database round trip. The file is written in place through the
+mapping, so it survives restarts of both the bridge and its readers.
+
+Every series gets a ring of `slots` readings; once full, each new reading
+overwrites the oldest. How many hours that covers depends on how often the
+series reports: 4096 slots hold a day of readings up to one every 21
+seconds. Window queries only look at readings inside the window.
+
+File layout (little endian):
+
+    header     magic "WXRS", version (H), slots (I), max series (I),
+               series in use (I), padded to 64 bytes
+    directory  max series entries of station (24s), measurement (32s),
+               readings written (Q)
+    values     max series x slots float64
+    times      max series x slots int64, ns (0 for a slot never written)
+
+A series' directory entry is filled in before the in-use count covers
+it, and a reading's value and time before its written count, so readers
+in other processes never see a half-added series or reading.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+RING_MAGIC = b"WXRS"
+RING_VERSION = 1
+HEADER = np.dtype([("magic", "S4"), ("version", "<u2"), ("slots", "<u4"), ("max_series", "<u4"),
+                   ("series", "<u4")])
+HEADER_BYTES = 64
+DIRECTORY = np.dtype([("station", "S24"), ("measurement", "S32"), ("written", "<u8")])
+
+logger = logging.getLogger(__name__)
+
+
+def _file_size(slots, max_series):
+    return HEADER_BYTES + max_series * (DIRECTORY.itemsize + slots * 16)
+
+
+class RingStore:
+    """Per-series ring buffers of (time, value) readings in a memory-mapped file."""
+
+    def __init__(self, path, slots=4096, max_series=1024, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._index = {}  # (station, measurement) -> series number
+
+        # Counters, read through stats()
+        self.appended = 0
+        self.dropped = 0
+
+        if not readonly and not self._matches(slots, max_series):
+            self._create(slots, max_series)
+        self._map()
+        if readonly:
+            return
+        for number in range(int(self._header["series"][0])):
+            entry = self._directory[number]
+            self._index[(entry["station"].decode(), entry["measurement"].decode())] = number
+
+    @classmethod
+    def open(cls, path):
+        """Open an existing ring file for reading, or return None if there is no usable one."""
+        try:
+            return cls(path, readonly=True)
+        except (OSError, ValueError):
+            return None
+
+    def append(self, station, measurement, value, time_ns):
+        """Record one reading, overwriting the series' oldest one once its ring is full."""
+        with self._lock:
+            number = self._index.get((station, measurement))
+            if number is None:
+                number = int(self._header["series"][0])
+                if number >= self.max_series:
+                    self.dropped += 1
+                    return
+                self._directory[number] = (station.encode()[:24], measurement.encode()[:32], 0)
+                self._header["series"][0] = number + 1
+                self._index[(station, measurement)] = number
+            written = int(self._directory["written"][number])
+            slot = written % self.slots
+            self._values[number, slot] = value
+            self._times[number, slot] = time_ns
+            self._directory["written"][number] = written + 1
+            self.appended += 1
+
+    def series(self):
+        """Every (station, measurement) with readings in the store."""
+        count = int(self._header["series"][0])
+        return [(entry["station"].decode(), entry["measurement"].decode()) for entry in self._directory[:count]]
+
+    def latest(self, station, measurement):
+        """(value, time_ns) of the newest reading of a series, or None."""
+        number = self._find(station, measurement)
+        if number is None:
+            return None
+        slot = int(self._times[number].argmax())
+        time_ns = int(self._times[number, slot])
+        return (float(self._values[number, slot]), time_ns) if time_ns else None
+
+    def latest_all(self):
+        """Newest reading of every series, as {station: {measurement: (value, time_ns)}}."""
+        count = int(self._header["series"][0])
+        if not count:
+            return {}
+        times = self._times[:count]
+        slots = times.argmax(axis=1)
+        rows = np.arange(count)
+        newest_times = times[rows, slots]
+        newest_values = self._values[:count][rows, slots]
+        latest = {}
+        for (station, measurement), value, time_ns in zip(self.series(), newest_values, newest_times):
+            if time_ns:
+                latest.setdefault(station, {})[measurement] = (float(value), int(time_ns))
+        return latest
+
+    def window(self, station, measurement, seconds, now_ns=None):
+        """min/max/mean/count of a series over the last `seconds`, or None without readings.
+
+        "oldest" is the time in ns of the oldest reading the ring still
+        holds: when it is inside the window, the readings before it have
+        been overwritten (or never recorded) and the figures are partial.
+        """
+        number = self._find(station, measurement)
+        if number is None:
+            return None
+        if now_ns is None:
+            now_ns = time.time_ns()
+        times = self._times[number]
+        written = times > 0
+        inside = written & (times > now_ns - int(seconds * 1000000000)) & (times <= now_ns)
+        values = self._values[number][inside]
+        if not values.size:
+            return None
+        return {
+            "oldest": int(times[written].min()),
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "mean": float(values.mean()),
+            "count": int(values.size),
+        }
+
+    def last_event(self, station, measurement):
+        """Time in ns of a series' newest reading, or None.
+
+        Meant for event measurements (lightning_distance, lightning_strike),
+        where every reading is an event.
+        """
+        latest = self.latest(station, measurement)
+        return None if latest is None else latest[1]
+
+    def flush(self):
+        """Ask the OS to write the mapped pages back to disk."""
+        if not self.readonly:
+            self._mm.flush()
+
+    def close(self):
+        """Flush and drop the mapping; the store cannot be used afterwards."""
+        with self._lock:
+            self.flush()
+            self._mm = self._header = self._directory = self._values = self._times = None
+
+    def stats(self):
+        """Snapshot of the store counters."""
+        return {
+            "series": int(self._header["series"][0]),
+            "appended": self.appended,
+            "dropped": self.dropped,
+        }
+
+    def _find(self, station, measurement):
+        if not self.readonly:
+            return self._index.get((station, measurement))
+        # A reader has no index of its own: series are only ever added, so
+        # rebuild it whenever the writer has added more
+        count = int(self._header["series"][0])
+        if len(self._index) != count:
+            self._index = {key: number for number, key in enumerate(self.series())}
+        return self._index.get((station, measurement))
+
+    def _matches(self, slots, max_series):
+        # Whether an existing file at path has this layout and can be reused
+        try:
+            with open(self.path, "rb") as f:
+                header = np.frombuffer(f.read(HEADER.itemsize), dtype=HEADER, count=1)[0]
+            size = os.path.getsize(self.path)
+        except (OSError, ValueError):
+            return False
+        if (header["magic"] != RING_MAGIC or header["version"] != RING_VERSION
+                or header["slots"] != slots or header["max_series"] != max_series):
+            logger.warning("Ring file %s has a different layout, starting a new one", self.path)
+            return False
+        return size == _file_size(slots, max_series)
+
+    def _create(self, slots, max_series):
+        # Sized with truncate, so the file stays sparse until readings land
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (RING_MAGIC, RING_VERSION, slots, max_series, 0)
+        with open(tmp_path, "wb") as f:
+            f.truncate(_file_size(slots, max_series))
+            f.write(header.tobytes())
+        os.replace(tmp_path, self.path)
+
+    def _map(self):
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode="r" if self.readonly else "r+")
+        if self._mm.size < HEADER_BYTES:
+            raise ValueError(f"{self.path} is too short to be a ring file")
+        self._header = self._mm[:HEADER.itemsize].view(HEADER)
+        if self._header["magic"][0] != RING_MAGIC or self._header["version"][0] != RING_VERSION:
+            raise ValueError(f"{self.path} is not a version {RING_VERSION} ring file")
+        self.slots = int(self._header["slots"][0])
+        self.max_series = int(self._header["max_series"][0])
+        if self._mm.size != _file_size(self.slots, self.max_series):
+            raise ValueError(f"{self.path} does not match its header")
+
+        offset = HEADER_BYTES
+        self._directory = self._mm[offset:offset + self.max_series * DIRECTORY.itemsize].view(DIRECTORY)
+        offset += self.max_series * DIRECTORY.itemsize
+        data_bytes = self.max_series * self.slots * 8
+        self._values = self._mm[offset:offset + data_bytes].view("<f8").reshape(self.max_series, self.slots)
+        offset += data_bytes
+        self._times = self._mm[offset:offset + data_bytes].view("<i8").reshape(self.max_series, self.slots)
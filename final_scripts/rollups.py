@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Continuous Rollups
+------------------
+Maintains 1-minute, 1-hour and 1-day min/mean/max/count aggregates per
+station and measurement, updated incrementally as points arrive. Closed
+windows are written to their own retention policies (rollup_1m, rollup_1h,
+rollup_1d) under the same measurement names, so long-range charts read a
+few hundred rollup points instead of millions of raw ones:
+
+    SELECT "mean" FROM "rollup_1h"."temperature_f" WHERE time > now() - 30d
+
+A window closes once a newer point for the same series arrives or its end
+plus a grace period has passed. Points older than the open window are
+counted as late and left out of the rollups (they are still stored raw).
+
+Stations that report by exception only publish a reading when it changes
+(plus a periodic heartbeat), so a window without points usually means the
+value held steady. With hold set, a series that reported within the last
+`hold` seconds carries its last value into such windows: they are written
+with min = max = mean = the held value and a count of 0, and the held
+value also bounds min/max of the next window that does get points. Event
+measurements are never held.
+
+When several bridge instances share the subscription each one only sees
+part of every series, so RollupRebuilder recomputes closed windows from the
+stored raw points instead. The query is idempotent, so instances that run
+it for the same window simply write the same rollup again.
+
+Points tagged with a quality flag (see qualityControl.py) are left out of
+the rollups.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# (retention policy, window length in seconds, how long that policy keeps data)
+ROLLUP_WINDOWS = (
+    ("rollup_1m", 60, "90d"),
+    ("rollup_1h", 3600, "730d"),
+    ("rollup_1d", 86400, "INF"),
+)
+
+
+def rollup_query(database, rp, window, measurements, where):
+    """SELECT ... INTO statement computing one retention policy's rollups from raw data."""
+    # An empty tag matches points without one, i.e. the unflagged ones
+    return (
+        f'SELECT min("value") AS "min", max("value") AS "max", mean("value") AS "mean", '
+        f'count("value") AS "count" INTO "{database}"."{rp}".:MEASUREMENT '
+        f'FROM /^({"|".join(measurements)})$/ WHERE ({where}) AND "quality" = \'\' '
+        f'GROUP BY time({window}s), "station"'
+    )
+
+
+class RollupAggregator:
+    """Incremental windowed aggregates, one open window per series and retention policy."""
+
+    def __init__(self, windows=ROLLUP_WINDOWS, grace=30, hold=0, events=()):
+        self.windows = [(rp, seconds * 1000000000) for rp, seconds, _ in windows]
+        self.grace_ns = grace * 1000000000
+        self.hold_ns = hold * 1000000000
+        self.events = frozenset(events)
+        self._open = {}  # (rp, station, measurement) -> [start_ns, min, max, sum, count]
+        self._last = {}  # (station, measurement) -> (value, time_ns) of the newest point
+        self._ready = []  # (rp, point) for windows closed by a newer point
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Counters, read through stats()
+        self.points_seen = 0
+        self.late_points = 0
+        self.windows_emitted = 0
+        self.windows_held = 0
+
+    def add(self, station, measurement, value, time_ns):
+        """Fold one numeric value into every window it belongs to."""
+        with self._lock:
+            self.points_seen += 1
+            last = self._last.get((station, measurement))
+            if last is None or time_ns >= last[1]:
+                self._last[(station, measurement)] = (value, time_ns)
+            for rp, window_ns in self.windows:
+                start = time_ns - time_ns % window_ns
+                key = (rp, station, measurement)
+                bucket = self._open.get(key)
+                if bucket is None or start > bucket[0]:
+                    if bucket is not None:
+                        self._ready.append((rp, self._point(key, bucket)))
+                    self._open[key] = [start, value, value, value, 1]
+                elif start == bucket[0]:
+                    if value < bucket[1]:
+                        bucket[1] = value
+                    if value > bucket[2]:
+                        bucket[2] = value
+                    bucket[3] += value
+                    bucket[4] += 1
+                else:
+                    self.late_points += 1
+
+    def seed(self, station, measurement, rp, start_ns, minimum, maximum, total, count):
+        """Restore an open window from raw data already stored, e.g. after a restart."""
+        with self._lock:
+            self._open[(rp, station, measurement)] = [start_ns, minimum, maximum, total, count]
+
+    def seed_last(self, station, measurement, value, time_ns, now_ns=None):
+        """Restore the newest stored value of a series so it is held across a restart.
+
+        Windows already seeded with points are left alone; the others open
+        holding the value, if it is recent enough to be held.
+        """
+        if now_ns is None:
+            now_ns = time.time_ns()
+        with self._lock:
+            last = self._last.get((station, measurement))
+            if last is None or time_ns >= last[1]:
+                self._last[(station, measurement)] = (value, time_ns)
+            for rp, window_ns in self.windows:
+                key = (rp, station, measurement)
+                start = now_ns - now_ns % window_ns
+                if key not in self._open and self._holds(key, start):
+                    self._open[key] = [start, value, value, 0.0, 0]
+
+    def collect(self, now_ns=None, flush_all=False):
+        """Close windows that are due and return {rp: [points]} ready to be written.
+
+        With flush_all every open window is emitted as it stands, which is
+        what shutdown does so a partial window is not lost.
+        """
+        if now_ns is None:
+            now_ns = time.time_ns()
+        closed = {}
+        with self._lock:
+            for rp, point in self._ready:
+                closed.setdefault(rp, []).append(point)
+            self._ready = []
+            window_ns = dict(self.windows)
+            for key, bucket in list(self._open.items()):
+                rp = key[0]
+                if flush_all or bucket[0] + window_ns[rp] + self.grace_ns <= now_ns:
+                    closed.setdefault(rp, []).append(self._point(key, bucket))
+                    if flush_all:
+                        continue
+                    # A steady series carries its last value into the next window
+                    start = bucket[0] + window_ns[rp]
+                    if self._holds(key, start):
+                        value = self._last[key[1:]][0]
+                        self._open[key] = [start, value, value, 0.0, 0]
+                    else:
+                        del self._open[key]
+            self.windows_emitted += sum(len(points) for points in closed.values())
+            self.windows_held += sum(1 for points in closed.values() for point in points if not point["fields"]["count"])
+        return closed
+
+    def start(self, emit, interval=10.0):
+        """Run collect() every interval seconds and pass each {rp: [points]} result to emit."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(emit, interval), name="rollups", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop the collector thread."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """Snapshot of the aggregator counters."""
+        with self._lock:
+            return {
+                "open_windows": len(self._open),
+                "points_seen": self.points_seen,
+                "late_points": self.late_points,
+                "windows_emitted": self.windows_emitted,
+                "windows_held": self.windows_held,
+            }
+
+    def _holds(self, key, start):
+        # Whether a window starting at start should hold the series' last value
+        _, station, measurement = key
+        last = self._last.get((station, measurement))
+        return (self.hold_ns > 0 and last is not None and measurement not in self.events
+                and start < last[1] + self.hold_ns)
+
+    @staticmethod
+    def _point(key, bucket):
+        _, station, measurement = key
+        start, minimum, maximum, total, count = bucket
+        return {
+            "measurement": measurement,
+            "tags": {"station": station},
+            "time": start,
+            "fields": {
+                "min": float(minimum),
+                "max": float(maximum),
+                "mean": float(total / count) if count else float(minimum),  # a held window
+                "count": count,
+            },
+        }
+
+    def _run(self, emit, interval):
+        while not self._stopping.wait(interval):
+            closed = self.collect()
+            if closed:
+                emit(closed)
+
+
+class RollupRebuilder:
+    """Recomputes closed rollup windows from raw data in InfluxDB on a timer."""
+
+    def __init__(self, client, database, measurements, windows=ROLLUP_WINDOWS, grace=30):
+        self.client = client
+        self.database = database
+        self.measurements = list(measurements)
+        self.windows = [(rp, seconds) for rp, seconds, _ in windows]
+        self.grace_ns = grace * 1000000000
+        self._done = {}  # rp -> end of the last window rebuilt, in ns
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Counters, read through stats()
+        self.queries = 0
+        self.failures = 0
+
+    def rebuild(self, now_ns=None):
+        """Rebuild every window that has closed since the previous call."""
+        if now_ns is None:
+            now_ns = time.time_ns()
+        for rp, window in self.windows:
+            window_ns = window * 1000000000
+            end = now_ns - self.grace_ns
+            end -= end % window_ns
+            # The first pass after a start also redoes the window before, in
+            # case the previous run stopped before it was rebuilt
+            start = self._done.get(rp, end - window_ns)
+            if end <= start:
+                continue
+            try:
+                self.client.query(rollup_query(self.database, rp, window, self.measurements,
+                                               f"time >= {start} AND time < {end}"))
+            except Exception as e:
+                self.failures += 1
+                logger.error("Error rebuilding %s rollups: %s", rp, e)
+                continue
+            self.queries += 1
+            self._done[rp] = end
+
+    def start(self, interval=10.0):
+        """Run rebuild() every interval seconds on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="rollup-rebuild", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop the rebuild thread."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """Snapshot of the rebuilder counters."""
+        return {"queries": self.queries, "failures": self.failures, "rebuilt_until": dict(self._done)}
+
+    def _run(self, interval):
+        while not self._stopping.wait(interval):
+            self.rebuild()
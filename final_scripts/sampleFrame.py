@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Binary Sample Frame
+-------------------
+Packs one full station sample (every sensor reading plus a timestamp) into
+a single compact MQTT message, published on weather/<station>/frame (or
+weather/frame for the default station). It replaces ~18 text messages per
+sample and is decoded by the bridge alongside the per-topic text format.
+
+Layout, little endian:
+
+    magic         B   0x57 ("W")
+    version       B   FRAME_VERSION
+    field mask    H   bit i set when FRAME_FIELDS[i] is present
+    sequence      I   per-device counter, wraps at 2**32
+    timestamp     q   device time in ms since the epoch, 0 if unknown
+    values            the present fields in FRAME_FIELDS order, each stored
+                      as a scaled integer of the listed struct type
+
+The firmware in final_scripts/data_gathering builds the same layout.
+"""
+import struct
+
+FRAME_MAGIC = 0x57
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<BBHIq")
+
+# (measurement, struct type, scale). Values are sent as round(value * scale).
+FRAME_FIELDS = (
+    ("air_quality", "B", 1),
+    ("tvoc", "H", 1),
+    ("co2_concentration", "H", 1),
+    ("temperature_c", "h", 100),
+    ("temperature_f", "h", 100),
+    ("pressure", "I", 100),
+    ("humidity", "H", 100),
+    ("dewpoint", "h", 100),
+    ("gas", "I", 100),
+    ("altitude", "i", 100),
+    ("visible_light", "H", 1),
+    ("infrared", "H", 1),
+    ("lightning_distance", "B", 1),
+    ("lightning_strike", "B", 1),
+)
+FIELD_INDEX = {name: i for i, (name, _, _) in enumerate(FRAME_FIELDS)}
+ALL_FIELDS_MASK = (1 << len(FRAME_FIELDS)) - 1
+
+# Value structs per field mask, compiled the first time each mask is seen
+_value_structs = {}
+
+
+def _value_struct(mask):
+    compiled = _value_structs.get(mask)
+    if compiled is None:
+        present = [i for i in range(len(FRAME_FIELDS)) if mask & (1 << i)]
+        layout = struct.Struct("<" + "".join(FRAME_FIELDS[i][1] for i in present))
+        compiled = (layout, tuple((FRAME_FIELDS[i][0], FRAME_FIELDS[i][2]) for i in present))
+        _value_structs[mask] = compiled
+    return compiled
+
+
+def encode_frame(values, seq=0, timestamp_ms=0):
+    """Pack {measurement: value} into a frame. Unknown measurements are ignored."""
+    mask = 0
+    for name in values:
+        i = FIELD_INDEX.get(name)
+        if i is not None:
+            mask |= 1 << i
+    layout, fields = _value_struct(mask)
+    scaled = [int(round(float(values[name]) * scale)) for name, scale in fields]
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, mask, seq & 0xFFFFFFFF, timestamp_ms) + layout.pack(*scaled)
+
+
+def decode_frame(payload):
+    """Unpack a frame into (seq, timestamp_ms, {measurement: value}), or None if it is malformed."""
+    if len(payload) < FRAME_HEADER.size:
+        return None
+    magic, version, mask, seq, timestamp_ms = FRAME_HEADER.unpack_from(payload)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION or mask & ~ALL_FIELDS_MASK:
+        return None
+    layout, fields = _value_struct(mask)
+    if len(payload) != FRAME_HEADER.size + layout.size:
+        return None
+    values = {}
+    for (name, scale), raw in zip(fields, layout.unpack_from(payload, FRAME_HEADER.size)):
+        values[name] = raw / scale if scale != 1 else float(raw)
+    if "lightning_strike" in values:
+        values["lightning_strike"] = values["lightning_strike"] != 0
+    return seq, timestamp_ms, values
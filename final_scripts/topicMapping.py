@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Weather Topic Mapping
+---------------------
+Topic -> measurement table shared by the MQTT bridge (mqttInfluxdb.py) and
+the tools that write the same measurements without going through MQTT
+(backfill.py). Kept free of side effects so importing it never connects
+to anything.
+"""
+import re
+
+# Stations publish on weather/<station>/<sensor>/<param> (and
+# weather/<station>/summary). The original single-station topics
+# weather/<sensor>/<param> belong to DEFAULT_STATION. The station ID is
+# written as the "station" tag on every point.
+DEFAULT_STATION = "main"
+STATION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,24}$")
+
+# Mapping of topics (without the station level) to measurements and the
+# payload type each topic carries ("float", "int", "strike", "summary" or
+# "frame"). A binary sample frame (see sampleFrame.py) holds a whole
+# station sample and is written as one point per measurement.
+TOPIC_MAPPING = {
+    "weather/ens160/aqi": {"measurement": "air_quality", "type": "int"},
+    "weather/ens160/tvoc": {"measurement": "tvoc", "type": "int"},
+    "weather/ens160/eco2": {"measurement": "co2_concentration", "type": "int"},
+    "weather/bme680/temperatureF": {"measurement": "temperature_f", "type": "float"},
+    "weather/bme680/temperatureC": {"measurement": "temperature_c", "type": "float"},
+    "weather/bme680/pressure": {"measurement": "pressure", "type": "float"},
+    "weather/bme680/humidity": {"measurement": "humidity", "type": "float"},
+    "weather/bme680/dewpoint": {"measurement": "dewpoint", "type": "float"},
+    "weather/bme680/gas": {"measurement": "gas", "type": "float"},
+    "weather/bme680/altitude": {"measurement": "altitude", "type": "float"},
+    "weather/light/visible_ir": {"measurement": "visible_light", "type": "int"},
+    "weather/light/infrared": {"measurement": "infrared", "type": "int"},
+    "weather/lightning/distance": {"measurement": "lightning_distance", "type": "float"},
+    "weather/lightning/strike": {"measurement": "lightning_strike", "type": "strike"},
+    "weather/summary": {"measurement": "weather_summary", "type": "summary"},
+    "weather/frame": {"measurement": None, "type": "frame"}
+}
+
+# Measurements with numeric values (the ones that get rollups)
+NUMERIC_MEASUREMENTS = sorted(
+    mapping["measurement"] for mapping in TOPIC_MAPPING.values() if mapping["type"] in ("float", "int")
+)
+
+# Event readings (a lightning strike and its distance) are published when
+# they happen rather than sampled, so a missing report means "nothing
+# happened", not "unchanged": they are never carried forward into empty
+# rollup windows and never go stale on the dashboard.
+EVENT_MEASUREMENTS = frozenset(("lightning_distance", "lightning_strike"))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Compiled Topic Router
+---------------------
+Routes MQTT topics to measurements through a trie of topic levels that
+supports the MQTT wildcards "+" (one level) and "#" (all remaining
+levels), so a lookup costs O(topic depth) no matter how many routes or
+stations there are. Each route carries a parser picked when the routing
+table is compiled. Parsers validate the raw payload bytes up front and
+return None for bad input instead of raising, so malformed messages stay
+off the exception path.
+
+Text readings may carry a device stamp after the value,
+"<value>@<timestamp ms>" or "<value>@<timestamp ms>#<sequence>", which
+split_stamp() separates before the value is parsed.
+"""
+import json
+import math
+import re
+from sampleFrame import decode_frame
+
+_FLOAT_RE = re.compile(rb"\s*[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?\s*")
+_INT_RE = re.compile(rb"\s*[-+]?\d+\s*")
+_TRUE = frozenset((b"1", b"true", b"True", b"on"))
+_FALSE = frozenset((b"0", b"false", b"False", b"off"))
+_STAMP_RE = re.compile(rb"([^@]*)@(\d{1,15})(?:#(\d{1,10}))?\s*")
+
+
+def split_stamp(payload):
+    """Text payload -> (value bytes, device timestamp ms or 0, sequence or None), or None if the stamp is malformed"""
+    if b"@" not in payload:
+        return payload, 0, None
+    match = _STAMP_RE.fullmatch(payload)
+    if match is None:
+        return None
+    value, timestamp_ms, seq = match.groups()
+    return value, int(timestamp_ms), int(seq) if seq is not None else None
+
+
+def parse_float(payload):
+    """Decimal number -> {"value": float}"""
+    if _FLOAT_RE.fullmatch(payload) is None:
+        return None
+    return {"value": float(payload)}
+
+
+def parse_int(payload):
+    """Integer reading -> {"value": float}
+
+    The value is stored as a float so it matches the field type these
+    measurements have always been written with.
+    """
+    if _INT_RE.fullmatch(payload) is None:
+        return None
+    return {"value": float(int(payload))}
+
+
+def parse_strike(payload):
+    """Lightning strike flag ("1"/"0") -> {"value": bool}"""
+    payload = payload.strip()
+    if payload in _TRUE:
+        return {"value": True}
+    if payload in _FALSE:
+        return {"value": False}
+    return None
+
+
+# Summary fields and the type each one is written as
+SUMMARY_SCHEMA = {
+    "temperatureF": float,
+    "humidity": float,
+    "pressure": float,
+    "tvoc": int,
+    "eco2": int,
+    "aqi": int,
+    "light_level": int,
+    "lightning_distance": float,
+}
+
+
+def parse_summary(payload):
+    """JSON summary object -> one field per SUMMARY_SCHEMA entry"""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    fields = {}
+    for name, kind in SUMMARY_SCHEMA.items():
+        value = data.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return None
+        fields[name] = kind(value)
+    return fields
+
+
+PARSERS = {
+    "float": parse_float,
+    "int": parse_int,
+    "strike": parse_strike,
+    "summary": parse_summary,
+    "frame": decode_frame,  # returns (seq, timestamp_ms, {measurement: value})
+}
+
+
+class Route:
+    """Where a matched topic goes: measurement, payload parser and station level."""
+
+    __slots__ = ("pattern", "measurement", "kind", "parse", "station_level")
+
+    def __init__(self, pattern, measurement, kind="float", station_level=None):
+        if kind not in PARSERS:
+            raise ValueError(f"Unknown payload type '{kind}' for topic {pattern}")
+        self.pattern = pattern
+        self.measurement = measurement
+        self.kind = kind
+        self.parse = PARSERS[kind]
+        self.station_level = station_level  # index of the topic level holding the station ID
+
+
+class _Node:
+    __slots__ = ("children", "plus", "hash", "route")
+
+    def __init__(self):
+        self.children = {}
+        self.plus = None  # child for a "+" level
+        self.hash = None  # route for a trailing "#"
+        self.route = None  # route ending exactly at this node
+
+
+class TopicRouter:
+    """Trie of topic levels with MQTT wildcard support."""
+
+    def __init__(self, cache_size=10000):
+        self._root = _Node()
+        self._cache = {}
+        self._cache_size = cache_size
+
+    def add(self, pattern, route):
+        """Register a route for a topic pattern such as weather/+/bme680/humidity."""
+        node = self._root
+        levels = pattern.split("/")
+        for i, level in enumerate(levels):
+            if level == "#":
+                if i != len(levels) - 1:
+                    raise ValueError(f"'#' must be the last level of {pattern}")
+                node.hash = route
+                break
+            if level == "+":
+                if node.plus is None:
+                    node.plus = _Node()
+                node = node.plus
+            else:
+                node = node.children.setdefault(level, _Node())
+        else:
+            node.route = route
+        self._cache.clear()
+
+    def match(self, topic):
+        """Return (route, levels) for a topic, or (None, None) when nothing matches.
+
+        Exact levels win over "+", which wins over "#".
+        """
+        hit = self._cache.get(topic)
+        if hit is not None:
+            return hit
+        levels = topic.split("/")
+        route = self._match(self._root, levels, 0)
+        result = (route, levels) if route is not None else (None, None)
+        if len(self._cache) >= self._cache_size:
+            self._cache.clear()
+        self._cache[topic] = result
+        return result
+
+    def _match(self, node, levels, depth):
+        if depth == len(levels):
+            return node.route or node.hash
+        level = levels[depth]
+        child = node.children.get(level)
+        if child is not None:
+            route = self._match(child, levels, depth + 1)
+            if route is not None:
+                return route
+        if node.plus is not None:
+            route = self._match(node.plus, levels, depth + 1)
+            if route is not None:
+                return route
+        return node.hash
+
+
+def build_router(topic_mapping):
+    """Compile a topic -> {"measurement", "type"} table (see topicMapping.py) into a router.
+
+    Every mapping is registered twice: as the original single-station topic
+    and with a "+" station level after the weather/ prefix.
+    """
+    router = TopicRouter()
+    for topic, mapping in topic_mapping.items():
+        measurement = mapping["measurement"]
+        kind = mapping.get("type", "float")
+        router.add(topic, Route(topic, measurement, kind))
+        prefix, rest = topic.split("/", 1)
+        station_pattern = f"{prefix}/+/{rest}"
+        router.add(station_pattern, Route(station_pattern, measurement, kind, station_level=1))
+    return router
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+InfluxDB Write Buffer
+---------------------
+Collects points from the bridge and writes them to InfluxDB in batches.
+A batch is flushed when it reaches max_points or when its oldest point has
+waited flush_interval_ms, whichever comes first. Writes happen on a
+background thread, or on the writer thread that filled the batch, so the
+MQTT network loop never waits on HTTP and several batches can be in
+flight at once.
+
+With a spool attached, failed batches and batches that overflow
+max_pending are written to disk as line protocol instead of being lost.
+A batch InfluxDB refuses with a 4xx is dropped and counted instead: it
+would be refused again on replay (see pointSpool.py).
+"""
+import logging
+import threading
+import time
+from influxdb.line_protocol import make_lines
+
+import metrics
+from pointSpool import rejected
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_POINTS = metrics.histogram("weather_write_batch_points", "Points per InfluxDB write",
+                                       buckets=metrics.SIZE_BUCKETS, labelnames=("rp",))
+WRITE_SECONDS = metrics.histogram("weather_write_seconds", "InfluxDB write latency", labelnames=("rp",))
+
+
+class WriteBuffer:
+    """Batches points and flushes them with a single write_points call."""
+
+    def __init__(self, client, max_points=500, flush_interval_ms=1000, spool=None, max_pending=None,
+                 retention_policy=None):
+        self.client = client
+        self.retention_policy = retention_policy  # None writes to the database's default policy
+        self._batch_points = WRITE_BATCH_POINTS.labels(retention_policy or "default")
+        self._write_seconds = WRITE_SECONDS.labels(retention_policy or "default")
+        self.max_points = max_points
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.spool = spool
+        self.max_pending = max_pending or max_points * 20
+
+        self._points = []
+        self._oldest = None  # monotonic time the oldest buffered point arrived
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Counters, read through stats()
+        self.flush_count = 0
+        self.points_written = 0
+        self.points_failed = 0
+        self.points_spooled = 0
+        self.points_rejected = 0
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_flush_latency_ms = 0.0
+        self.total_flush_latency_ms = 0.0
+
+    def start(self):
+        """Start the background flush thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+            self._thread.start()
+
+    def add(self, points):
+        """Queue one or more points (InfluxDB JSON dicts) for the next batch.
+
+        Returns True when the batch is full, so the caller may flush it itself.
+        """
+        overflow = None
+        with self._lock:
+            if not self._points:
+                self._oldest = time.monotonic()
+            self._points.extend(points)
+            full = len(self._points) >= self.max_points
+            if self.spool is not None and len(self._points) >= self.max_pending:
+                # Writes are not keeping up, move the backlog to disk
+                overflow = self._points
+                self._points = []
+                self._oldest = None
+                full = False
+        if overflow:
+            self._spool(overflow)
+        if full:
+            self._wake.set()
+        return full
+
+    def pending(self):
+        """Number of points waiting for the next flush."""
+        with self._lock:
+            return len(self._points)
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of points sent."""
+        with self._lock:
+            batch = self._points
+            self._points = []
+            self._oldest = None
+        if not batch:
+            return 0
+
+        if self.spool is not None and not self.spool.healthy:
+            # InfluxDB is known to be down, don't wait on another timeout
+            self._spool(batch)
+            return len(batch)
+
+        start = time.perf_counter()
+        refused = False
+        try:
+            success = self.client.write_points(batch, retention_policy=self.retention_policy)
+        except Exception as e:
+            refused = rejected(e)
+            if refused:
+                logger.error("InfluxDB refused batch of %d points, dropping it: %s", len(batch), e)
+            else:
+                logger.error("Error writing batch of %d points to InfluxDB: %s", len(batch), e)
+            success = False
+        latency = time.perf_counter() - start
+        latency_ms = latency * 1000.0
+        self._batch_points.observe(len(batch))
+        self._write_seconds.observe(latency)
+
+        with self._stats_lock:
+            self.flush_count += 1
+            self.last_flush_size = len(batch)
+            self.max_flush_size = max(self.max_flush_size, len(batch))
+            self.last_flush_latency_ms = latency_ms
+            self.total_flush_latency_ms += latency_ms
+            if success:
+                self.points_written += len(batch)
+            elif refused:
+                self.points_rejected += len(batch)
+            else:
+                self.points_failed += len(batch)
+        if not success and not refused:
+            logger.warning("Failed to write batch of %d points to InfluxDB", len(batch))
+            if self.spool is not None:
+                self.spool.healthy = False
+                self._spool(batch)
+        return len(batch)
+
+    def _spool(self, batch):
+        try:
+            self.spool.append(make_lines({"points": batch}).splitlines())
+        except Exception as e:
+            logger.error("Error spooling %d points: %s", len(batch), e)
+            return
+        with self._stats_lock:
+            self.points_spooled += len(batch)
+
+    def close(self):
+        """Stop the flush thread and drain whatever is still buffered."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        """Snapshot of the buffer counters."""
+        return {
+            "pending": self.pending(),
+            "flush_count": self.flush_count,
+            "points_written": self.points_written,
+            "points_failed": self.points_failed,
+            "points_spooled": self.points_spooled,
+            "points_rejected": self.points_rejected,
+            "last_flush_size": self.last_flush_size,
+            "max_flush_size": self.max_flush_size,
+            "avg_flush_size": ((self.points_written + self.points_failed + self.points_rejected) / self.flush_count
+                               if self.flush_count else 0.0),
+            "last_flush_latency_ms": round(self.last_flush_latency_ms, 3),
+            "avg_flush_latency_ms": round(self.total_flush_latency_ms / self.flush_count, 3) if self.flush_count else 0.0,
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                count = len(self._points)
+                oldest = self._oldest
+            if count >= self.max_points:
+                timeout = 0
+            elif oldest is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(0.0, oldest + self.flush_interval - time.monotonic())
+
+            if timeout > 0:
+                self._wake.wait(timeout)
+                self._wake.clear()
+                if self._stopping.is_set():
+                    break
+
+            with self._lock:
+                due = bool(self._points) and (
+                    len(self._points) >= self.max_points
+                    or time.monotonic() - self._oldest >= self.flush_interval
+                )
+            if due:
+                self.flush()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bridge modules are flat scripts in final_scripts/ that import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "final_scripts"))
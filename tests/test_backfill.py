@@ -0,0 +1,42 @@
+import re
+
+from backfill import rebuild_rollups
+
+DAY_NS = 86400 * 1000000000
+
+
+class FakeClient:
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.queries = []
+
+    def query(self, query):
+        if self.fail_after is not None and len(self.queries) >= self.fail_after:
+            raise ConnectionError("timed out")
+        self.queries.append(query)
+
+
+def bounds(client, rp):
+    return [tuple(map(int, re.search(r"time >= (\d+) AND time < (\d+)", q).groups()))
+            for q in client.queries if f'"{rp}"' in q]
+
+
+def test_rollups_are_rebuilt_one_day_at_a_time():
+    client = FakeClient()
+    start = 20000 * DAY_NS + 3600 * 1000000000 + 5
+    end = start + 2 * DAY_NS
+    assert rebuild_rollups(client, start, end)
+
+    hourly = bounds(client, "rollup_1h")
+    assert hourly[0][0] == 20000 * DAY_NS
+    assert all(stop - first <= DAY_NS for first, stop in hourly)
+    # Chunks are contiguous and cover the last window touched
+    assert all(a[1] == b[0] for a, b in zip(hourly, hourly[1:]))
+    assert hourly[-1][1] == end - end % (3600 * 1000000000) + 3600 * 1000000000
+    assert len(bounds(client, "rollup_1d")) == 3
+
+
+def test_failed_chunk_stops_the_rebuild():
+    client = FakeClient(fail_after=1)
+    assert not rebuild_rollups(client, 20000 * DAY_NS, 20003 * DAY_NS)
+    assert len(client.queries) == 1
@@ -0,0 +1,50 @@
+from dedupIndex import DedupIndex
+
+START_MS = 1760000000000
+MINUTE_MS = 60000
+
+
+def test_redelivery_is_duplicate():
+    index = DedupIndex()
+    assert not index.is_duplicate("main", "frame", 7, START_MS)
+    assert index.is_duplicate("main", "frame", 7, START_MS)
+
+
+def test_out_of_order_is_accepted():
+    index = DedupIndex()
+    assert not index.is_duplicate("main", "frame", 8, START_MS + MINUTE_MS)
+    assert not index.is_duplicate("main", "frame", 7, START_MS)
+    assert index.is_duplicate("main", "frame", 7, START_MS)
+
+
+def test_readings_after_reboot_are_accepted():
+    # The firmware's counters restart at 0 on boot while its clock keeps going
+    index = DedupIndex(seq_window=1024)
+    for seq in range(100):
+        assert not index.is_duplicate("main", "frame", seq, START_MS + seq * MINUTE_MS)
+    rebooted_ms = START_MS + 200 * MINUTE_MS
+    for seq in range(100):
+        assert not index.is_duplicate("main", "frame", seq, rebooted_ms + seq * MINUTE_MS)
+    assert index.stats()["duplicates"] == 0
+
+    # Redeliveries from either side of the reboot are still caught
+    assert index.is_duplicate("main", "frame", 99, rebooted_ms + 99 * MINUTE_MS)
+    assert index.is_duplicate("main", "frame", 50, rebooted_ms + 50 * MINUTE_MS)
+
+
+def test_late_reading_from_before_reboot_does_not_move_the_window():
+    index = DedupIndex()
+    for seq in range(100):
+        index.is_duplicate("main", "frame", seq, START_MS + seq * MINUTE_MS)
+    rebooted_ms = START_MS + 200 * MINUTE_MS
+    assert not index.is_duplicate("main", "frame", 0, rebooted_ms)
+    assert not index.is_duplicate("main", "frame", 80, START_MS + 80 * MINUTE_MS)
+    for seq in range(1, 10):
+        assert not index.is_duplicate("main", "frame", seq, rebooted_ms + seq * MINUTE_MS)
+    assert index.stats()["resets"] == 1
+
+
+def test_sequence_without_timestamp():
+    index = DedupIndex()
+    assert not index.is_duplicate("main", "frame", 3)
+    assert index.is_duplicate("main", "frame", 3)
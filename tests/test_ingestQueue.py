@@ -0,0 +1,77 @@
+import json
+
+from ingestQueue import IngestQueue
+
+
+def message(i):
+    return ("weather/temperatureF", str(i).encode(), i)
+
+
+def drain(queue):
+    received = []
+    while True:
+        item = queue.get(timeout=0.01)
+        if item is None:
+            return received
+        received.append(item[2])
+
+
+def test_spill_keeps_arrival_order(tmp_path):
+    queue = IngestQueue(maxsize=5, policy="spill", spill_path=str(tmp_path / "spill.jsonl"))
+    for i in range(20):
+        queue.put(message(i))
+    # Messages arriving while the backlog drains queue behind it
+    received = []
+    for i in range(20, 30):
+        received.append(queue.get(timeout=0)[2])
+        queue.put(message(i))
+    received += drain(queue)
+    assert received == list(range(30))
+    assert queue.stats()["spill_backlog"] == 0
+
+
+def test_spill_survives_restart(tmp_path):
+    path = str(tmp_path / "spill.jsonl")
+    queue = IngestQueue(maxsize=2, policy="spill", spill_path=path)
+    for i in range(6):
+        queue.put(message(i))
+    queue.close()
+
+    # The two in memory are lost with the process, the spilled ones are not
+    restarted = IngestQueue(maxsize=2, policy="spill", spill_path=path)
+    assert restarted.stats()["spill_backlog"] == 4
+    assert drain(restarted) == [2, 3, 4, 5]
+
+
+def test_unfinished_replay_is_replayed_first(tmp_path):
+    path = str(tmp_path / "spill.jsonl")
+    queue = IngestQueue(maxsize=2, policy="spill", spill_path=path)
+    for i in range(6):
+        queue.put(message(i))
+    queue.get(timeout=0)
+    queue.reload_spill()  # moves the spill file aside and re-queues what fits
+    queue.put(message(6))
+    queue.close()
+    assert (tmp_path / "spill.jsonl.replay").exists()
+
+    restarted = IngestQueue(maxsize=2, policy="spill", spill_path=path)
+    assert drain(restarted) == [2, 3, 4, 5, 6]
+
+
+def test_truncated_spill_record_is_discarded(tmp_path):
+    path = tmp_path / "spill.jsonl"
+    queue = IngestQueue(maxsize=1, policy="spill", spill_path=str(path))
+    for i in range(3):
+        queue.put(message(i))
+    queue.close()
+    # A crash in the middle of a spill leaves half a record
+    with open(path, "ab") as f:
+        f.write(json.dumps({"topic": "weather/temperatureF", "payload": "NzA="}).encode()[:20])
+
+    restarted = IngestQueue(maxsize=1, policy="spill", spill_path=str(path))
+    assert restarted.stats()["spill_backlog"] == 2
+    assert drain(restarted) == [1, 2]
+    # Messages spilled later are not glued onto the cut-off record
+    for i in range(3, 6):
+        restarted.put(message(i))
+    assert drain(restarted) == [3, 4, 5]
@@ -0,0 +1,79 @@
+import time
+
+import requests
+from influxdb.exceptions import InfluxDBClientError
+
+from pointSpool import PointSpool
+
+
+class FakeClient:
+    """Records line protocol writes; raises `error` for chunks containing `poison`."""
+
+    def __init__(self, poison=None, error=None):
+        self.poison = poison
+        self.error = error
+        self.written = []
+
+    def ping(self):
+        return "1.8"
+
+    def write_points(self, points, protocol="json", retention_policy=None):
+        if self.error is not None and (self.poison is None or any(self.poison in line for line in points)):
+            raise self.error
+        self.written.extend(points)
+        return True
+
+
+def replay(spool, client, until):
+    spool.start_replay(client, chunk_points=2, check_interval=0.01)
+    deadline = time.monotonic() + 5
+    while not until() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    spool.close()
+
+
+def test_replay_writes_and_removes_segments(tmp_path):
+    spool = PointSpool(str(tmp_path))
+    spool.append([f"temperature_f value={i} {i}" for i in range(5)])
+    client = FakeClient()
+    replay(spool, client, lambda: not spool.backlog())
+    assert len(client.written) == 5
+    assert not list(tmp_path.glob("*.lp"))
+    assert spool.stats()["replayed_points"] == 5
+
+
+def test_refused_chunk_is_dropped_not_retried(tmp_path):
+    spool = PointSpool(str(tmp_path))
+    spool.append(["temperature_f value=1 1", "temperature_f value=2 2", "bad value=3 3", "temperature_f value=4 4"])
+    client = FakeClient(poison="bad", error=InfluxDBClientError("partial write: points beyond retention policy", 400))
+    replay(spool, client, lambda: not spool.backlog())
+    assert client.written == ["temperature_f value=1 1", "temperature_f value=2 2"]
+    stats = spool.stats()
+    assert stats["healthy"]
+    assert stats["rejected_points"] == 2
+    assert stats["segments"] == 0
+
+
+def test_outage_keeps_segment(tmp_path):
+    spool = PointSpool(str(tmp_path))
+    spool.append(["temperature_f value=1 1"])
+    client = FakeClient(error=requests.exceptions.ConnectionError("refused"))
+    replay(spool, client, lambda: not spool.healthy)
+    assert not spool.healthy
+    assert spool.backlog() == 1
+    assert spool.stats()["rejected_points"] == 0
+
+
+def test_truncated_line_is_skipped_after_restart(tmp_path):
+    spool = PointSpool(str(tmp_path))
+    spool.append(["temperature_f value=1 1"])
+    spool.close()
+    # A crash in the middle of an append leaves a line without its newline
+    segment = next(tmp_path.glob("*.lp"))
+    with open(segment, "ab") as f:
+        f.write(b"temperature_f val")
+
+    spool = PointSpool(str(tmp_path))
+    client = FakeClient()
+    replay(spool, client, lambda: not spool.backlog())
+    assert client.written == ["temperature_f value=1 1"]
@@ -0,0 +1,49 @@
+from qualityControl import QualityControl
+
+S = 1000000000
+
+
+def feed(qc, values, measurement="temperature_f", start=0, step=60):
+    return [qc.check("main", measurement, value, start + i * step * S) for i, value in enumerate(values)]
+
+
+def test_out_of_range_reading_is_flagged():
+    qc = QualityControl()
+    assert feed(qc, [0], measurement="lightning_distance") == ["range"]
+    assert feed(qc, [12], measurement="lightning_distance") == ["ok"]
+    assert qc.stats()["range"] == 1
+
+
+def test_spike_is_flagged_and_kept_out_of_the_baseline():
+    qc = QualityControl()
+    steady = [70.0, 70.2, 69.9, 70.1, 70.0, 70.3]
+    assert set(feed(qc, steady)) == {"ok"}
+    assert feed(qc, [95.0], start=len(steady) * 60 * S) == ["spike"]
+    # The baseline did not move, so a normal reading is fine right after
+    assert feed(qc, [70.1], start=(len(steady) + 1) * 60 * S) == ["ok"]
+    assert qc.stats()["spike"] == 1
+
+
+def test_persistent_shift_is_accepted():
+    qc = QualityControl(spike_confirm=3)
+    feed(qc, [70.0, 70.2, 69.9, 70.1, 70.0, 70.3])
+    flags = feed(qc, [90.0, 90.1, 90.2, 90.1], start=6 * 60 * S)
+    assert flags == ["spike", "spike", "ok", "ok"]
+    assert qc.stats()["shifts"] == 1
+
+
+def test_spikes_in_opposite_directions_do_not_confirm_a_shift():
+    qc = QualityControl(spike_confirm=3)
+    feed(qc, [70.0, 70.2, 69.9, 70.1, 70.0, 70.3])
+    flags = feed(qc, [90.0, 50.0, 90.0, 50.0], start=6 * 60 * S)
+    assert flags == ["spike"] * 4
+    assert qc.stats()["shifts"] == 0
+
+
+def test_unchanging_value_is_flagged_stuck():
+    qc = QualityControl(stuck_seconds=3600)
+    flags = feed(qc, [55.0] * 62, measurement="humidity")
+    assert flags[:60] == ["ok"] * 60
+    assert flags[60:] == ["stuck", "stuck"]
+    # Light levels may sit at 0 all night
+    assert set(feed(qc, [0] * 62, measurement="visible_light")) == {"ok"}
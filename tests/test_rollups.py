@@ -0,0 +1,90 @@
+import mqttInfluxdb
+from rollups import RollupAggregator
+
+S = 1000000000
+MINUTE = (("rollup_1m", 60, "90d"),)
+
+
+def test_points_fold_into_aligned_windows():
+    rollups = RollupAggregator(windows=MINUTE, grace=0)
+    rollups.add("main", "temperature_f", 70.0, 600 * S + 5)
+    rollups.add("main", "temperature_f", 74.0, 659 * S)
+    rollups.add("main", "temperature_f", 72.0, 660 * S)
+
+    # The third point opened the next window, which closes the first
+    closed = rollups.collect(now_ns=661 * S)
+    point = closed["rollup_1m"][0]
+    assert point["time"] == 600 * S
+    assert point["fields"] == {"min": 70.0, "max": 74.0, "mean": 72.0, "count": 2}
+    assert len(closed["rollup_1m"]) == 1
+
+
+def test_late_point_is_counted_not_folded():
+    rollups = RollupAggregator(windows=MINUTE, grace=0)
+    rollups.add("main", "temperature_f", 70.0, 660 * S)
+    rollups.add("main", "temperature_f", 90.0, 600 * S)
+    assert rollups.stats()["late_points"] == 1
+    closed = rollups.collect(now_ns=720 * S)
+    assert closed["rollup_1m"][0]["fields"]["max"] == 70.0
+
+
+def test_steady_series_is_held_into_the_next_window():
+    rollups = RollupAggregator(windows=MINUTE, grace=0, hold=300)
+    rollups.add("main", "temperature_f", 70.0, 600 * S)
+    rollups.collect(now_ns=660 * S)
+    held = rollups.collect(now_ns=720 * S)["rollup_1m"][0]
+    assert held["time"] == 660 * S
+    assert held["fields"] == {"min": 70.0, "max": 70.0, "mean": 70.0, "count": 0}
+
+
+class FakeClient:
+    def __init__(self, first_ns=None):
+        self.first_ns = first_ns
+        self.queries = []
+        self.progress = []
+
+    def query(self, query, epoch=None):
+        self.queries.append(query)
+        return FakeResult([{"time": self.first_ns}] if self.first_ns is not None else [])
+
+    def write_points(self, points, retention_policy=None):
+        self.progress.append(points[0]["fields"])
+
+    def alter_retention_policy(self, *args, **kwargs):
+        pass
+
+
+class FakeResult:
+    def __init__(self, points):
+        self.points = points
+
+    def get_points(self):
+        return iter(self.points)
+
+
+def backfill(monkeypatch, client, pending):
+    monkeypatch.setattr(mqttInfluxdb, "influx_client", client)
+    monkeypatch.setattr(mqttInfluxdb, "make_influx_client", lambda timeout=None: client)
+    mqttInfluxdb.backfill_rollups(pending, "autogen")
+    return [q for q in client.queries if " INTO " in q]
+
+
+def test_backfill_starts_on_a_day_boundary(monkeypatch):
+    day = 86400 * S
+    client = FakeClient(first_ns=10 * day + 5 * 3600 * S)
+    queries = backfill(monkeypatch, client, [("rollup_1h", 3600, 13 * day, 0)])
+
+    assert len(queries) == 3
+    assert f"time >= {10 * day} AND time < {11 * day}" in queries[0]
+    assert client.progress[-1] == {"until": 13 * day, "through": 13 * day, "done": True}
+
+
+def test_backfill_resumes_where_it_stopped(monkeypatch):
+    day = 86400 * S
+    client = FakeClient()
+    queries = backfill(monkeypatch, client, [("rollup_1h", 3600, 13 * day, 12 * day)])
+
+    # No scan for the oldest point, and only the remaining day is redone
+    assert client.queries == queries
+    assert len(queries) == 1
+    assert f"time >= {12 * day} AND time < {13 * day}" in queries[0]
@@ -0,0 +1,67 @@
+import requests
+from influxdb.exceptions import InfluxDBClientError
+
+from pointSpool import PointSpool
+from writeBuffer import WriteBuffer
+
+POINT = {"measurement": "temperature_f", "tags": {"station": "main"}, "time": 1760000000000000000,
+         "fields": {"value": 70.0}}
+
+
+class FakeClient:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.batches = []
+
+    def write_points(self, points, retention_policy=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append(points)
+        return True
+
+
+def test_refused_batch_is_dropped_and_writes_continue(tmp_path):
+    spool = PointSpool(str(tmp_path))
+    client = FakeClient([InfluxDBClientError("field type conflict", 400)])
+    buffer = WriteBuffer(client, spool=spool)
+
+    buffer.add([POINT])
+    buffer.flush()
+    assert spool.healthy
+    assert spool.backlog() == 0
+    assert buffer.stats()["points_rejected"] == 1
+
+    # The next batch is still written, not sent to the spool
+    buffer.add([POINT])
+    buffer.flush()
+    assert client.batches == [[POINT]]
+    spool.close()
+
+
+def test_outage_spools_batch(tmp_path):
+    spool = PointSpool(str(tmp_path))
+    client = FakeClient([requests.exceptions.ConnectionError("refused")])
+    buffer = WriteBuffer(client, spool=spool)
+
+    buffer.add([POINT])
+    buffer.flush()
+    assert not spool.healthy
+    assert spool.backlog() == 1
+    assert buffer.stats()["points_failed"] == 1
+
+    # While InfluxDB is known to be down, batches go straight to the spool
+    buffer.add([POINT])
+    buffer.flush()
+    assert spool.backlog() == 2
+    assert not client.batches
+    spool.close()
+
+
+def test_unauthorized_counts_as_outage(tmp_path):
+    spool = PointSpool(str(tmp_path))
+    buffer = WriteBuffer(FakeClient([InfluxDBClientError("authorization failed", 401)]), spool=spool)
+    buffer.add([POINT])
+    buffer.flush()
+    assert not spool.healthy
+    assert spool.backlog() == 1
+    spool.close()